@@ -1,10 +1,17 @@
 __import__('pysqlite3')
 import sys
-sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
+# Concurrent sessions run this at the same time: only the first one finds pysqlite3 to pop
+sys.modules['sqlite3'] = sys.modules.pop('pysqlite3', None) or sys.modules['sqlite3']
 
-import re
+import os
+import uuid
 import streamlit as st
-from module.ui_module import chatbot_sidebar, setup_page
+from module.ui_module import chatbot_sidebar, performance_expander, setup_page
+from module.engines import get_engine
+from module.export import EXPORT_FORMATS, export_query, session_export_dir, sweep_exports
+from module.query_plan import apply_row_limit, assess_query_cost, strip_sql
+from module.sql_validation import SqlStreamParser, extract_sql, until_sql_block, validate_and_repair
+from module.tracing import record_since_start, span, start_metrics_server, start_trace, timed_stream
 from module.utils import *
 from dotenv import load_dotenv
 
@@ -13,6 +20,8 @@ from dotenv import load_dotenv
 setup_page()
 # setup side bar
 chatbot_sidebar()
+# serve the stage latency histograms (once per process)
+start_metrics_server()
 
 #print('chatbot session',st.session_state)
 # Attempt to initialize and catch any errors
@@ -33,17 +42,118 @@ if "messages" not in st.session_state:
         {"role": "assistant", "content": "InsightGenix: Your expert guide through the relational database maze. How can I assist you today with your database queries?"}
     ]
 
-for message in st.session_state.messages:
+def run_query(message: dict, sql: str):
+    # Execute the generated SQL and attach the results to the assistant message
+    try:
+        results = query_to_dataframe(st.session_state.db_file_path, sql, timeout=config.get('query_timeout', 60))
+    except Exception as e:
+        message["results"] = f'An error occurred: {e}'
+        message["result_str"] = ''
+        st.error(f"An error occurred: {e}")
+        return
+    # Statistical digest of the whole result for later `insight:` questions
+    try:
+        from module.digest import summarize_dataframe
+
+        with span("result.digest", rows=len(results)):
+            result_str = summarize_dataframe(results, token_budget=config.get('insight_token_budget', 1500))
+    except Exception:
+        result_str = ''  # insights then go without a digest; the result itself is still shown
+    message["results"] = results
+    message["result_str"] = result_str
+    with span("render.dataframe", rows=len(results)):
+        st.dataframe(message["results"], use_container_width=True)
+    record_since_start("turn.first_result", rows=len(results))
+
+def download_controls(message: dict, index: int):
+    # Re-run the message's query and stream its full result to a compressed file
+    if not message.get("sql") or isinstance(message.get("results"), str) or 'results' not in message:
+        return
+    with st.expander("Download full result"):
+        file_format = st.selectbox("Format", list(EXPORT_FORMATS), key=f"export_format_{index}")
+        extension, mime = EXPORT_FORMATS[file_format]
+        if st.button("Prepare download", key=f"export_{index}"):
+            session = st.session_state.setdefault("export_session", uuid.uuid4().hex)
+            sweep_exports(config.get('export_max_age', 3600), keep=session)
+            path = os.path.join(session_export_dir(session), f"query_result_{uuid.uuid4().hex}.{extension}")
+            try:
+                with st.spinner('Exporting the full result.....'):
+                    stats = export_query(st.session_state.db_file_path, message["sql"], path, file_format,
+                                         timeout=config.get('export_timeout', 600))
+            except Exception as e:
+                if os.path.exists(path):
+                    os.remove(path)
+                st.error(f"Export failed: {e}")
+            else:
+                previous = message.get("export")
+                if previous and os.path.exists(previous["path"]):
+                    os.remove(previous["path"])
+                message["export"] = {"path": path, "format": file_format, **stats}
+        export = message.get("export")
+        if export and os.path.exists(export["path"]):
+            extension, mime = EXPORT_FORMATS[export["format"]]
+            st.caption(f"{export['rows']:,} rows · {export['bytes'] / 1e6:.1f} MB · "
+                       f"{export['rows_per_s']:,.0f} rows/s ({export['mb_per_s']:.1f} MB/s)")
+            with open(export["path"], "rb") as f:
+                st.download_button(f"Download {export['format']}", f, file_name=f"query_result.{extension}",
+                                   mime=mime, key=f"download_{index}")
+
+def check_query_cost(message: dict, sql: str, index: int):
+    # Apply the query cost policy; returns the SQL to run now, or None when the user has to confirm it
+    policy = config.get('query_cost_policy', 'limit')
+    if policy == 'off':
+        return sql
+    large_table_rows = config.get('large_table_rows', 100000)
+    try:
+        with span("sql.plan") as attrs:
+            cost = assess_query_cost(st.session_state.db_file_path, sql, large_table_rows=large_table_rows)
+            attrs.update(issues=len(cost.issues), scanned_rows=cost.scanned_rows)
+            if cost.flagged and policy == 'limit':
+                limit = config.get('query_row_limit', 1000)
+                limited_sql = apply_row_limit(sql, limit)
+                limited_cost = assess_query_cost(st.session_state.db_file_path, limited_sql,
+                                                 large_table_rows=large_table_rows)
+    except Exception:
+        return sql  # a query that cannot be planned fails with its own error when run
+    if not cost.flagged:
+        return sql
+    if policy == 'limit':
+        # Only worth limiting (and mentioning) when the LIMIT lets the engine stop early
+        if len(limited_cost.issues) >= len(cost.issues):
+            return sql
+        message["cost_warning"] = cost.summary()
+        if limited_sql != strip_sql(sql):
+            message["cost_warning"] += f" Results are limited to {limit} rows."
+        st.warning(message["cost_warning"])
+        return limited_sql
+    message["cost_warning"] = cost.summary()
+    st.warning(message["cost_warning"])
+    if policy == 'confirm':
+        message["pending_sql"] = sql
+        st.button("Run query anyway", key=f"run_pending_{index}")
+        return None
+    return sql
+
+for index, message in enumerate(st.session_state.messages):
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
-        if 'results' in message.keys():
+        if 'cost_warning' in message:
+            st.warning(message["cost_warning"])
+        if message.get("pending_sql") and 'results' not in message:
+            if st.button("Run query anyway", key=f"run_pending_{index}"):
+                with st.spinner('Getting insights from database based on the query.....'):
+                    run_query(message, message.pop("pending_sql"))
+        elif 'results' in message.keys():
             if isinstance(message["results"], str):
                 st.error(message["results"])
             else:
                 st.dataframe(message["results"], use_container_width=True)
+                download_controls(message, index)
+        if 'trace' in message and st.session_state.get("show_performance"):
+            performance_expander(message["trace"])
 
-# Call init_season() with the appropriate configuration dict
-client = azure_openai(config=config)
+# Chat backend selected by LLM_PROVIDER (Azure OpenAI or the offline local responder)
+client = get_chat_client(config=config)
 data = st.session_state.db
 
 
@@ -52,89 +162,90 @@ if prompt := st.chat_input(placeholder="Provide the data where biomarker is her2
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    if not st.session_state.openai_key or not st.session_state.chat_model_name:
+    if config.get('llm_provider', 'azure') == 'azure' and (not st.session_state.openai_key or not st.session_state.chat_model_name):
         st.info("Please correctly provide your OpenAI API key and deployment model name to continue.")
         st.stop()
 
-    if prompt.startswith('query:'):
-        middle_prompt = get_relevent_prompt(prompt, data)
-        #print(middle_prompt)
-        with st.chat_message("assistant"):
-            stream = client.chat.completions.create(
-                model= config['chat_model_name'],
-                messages=middle_prompt,
-                stream=True,
-            )
-            response = st.write_stream(stream)
-        if len(response)>1:
-            response = response[-1]
+    # Trace the turn stage by stage (retrieval, LLM, SQL execution, rendering)
+    turn_kind = 'query' if prompt.startswith('query:') else 'insight' if prompt.startswith('insight:') else 'chat'
+    with start_trace(f"chat.{turn_kind}") as trace:
+        if prompt.startswith('query:'):
+            # Parquet uploads are queried by DuckDB, everything else by SQLite
+            dialect = get_engine(st.session_state.get('db_file_path')).dialect
+            # Question terms that name stored values, so the model can compare them exactly
+            from module.value_index import resolve_values
+
+            with span("values.resolve") as attrs:
+                value_hints = resolve_values(st.session_state.get('db_file_path'), prompt)
+                attrs["columns"] = len(value_hints)
+            middle_prompt = get_relevent_prompt(prompt, data, dialect=dialect, value_hints=value_hints)
+            #print(middle_prompt)
+            with st.chat_message("assistant"):
+                # Stop reading (and generating) as soon as the first SQL block is complete
+                parser = SqlStreamParser()
+                stream = until_sql_block(timed_stream(client.stream_chat(middle_prompt)), parser)
+                response = stream_to_text(st.write_stream(stream))
+            message = {"role": "assistant", "content": response}
+            sql = parser.sql if parser.sql is not None else extract_sql(response)
+            with st.spinner('Getting insights from database based on the query.....'):
+                if sql is not None and st.session_state.get('db_file_path'):
+                    # Compile the query against the schema first and let the model fix it if needed
+                    repaired_sql, error, attempts = validate_and_repair(
+                        st.session_state.db_file_path, sql,
+                        lambda bad_sql, error, ddl_list: client.chat(get_repair_prompt(prompt, bad_sql, error, ddl_list, dialect=dialect)),
+                        max_attempts=config.get('sql_repair_attempts', 2),
+                    )
+                    if attempts and error is None:
+                        message["content"] += f"\n\nRepaired query:\n```sql\n{repaired_sql}\n```"
+                        st.markdown(f"Repaired query:\n```sql\n{repaired_sql}\n```")
+                    if error is not None:
+                        message["results"] = f'An error occurred: {error}'
+                        message["result_str"] = ''
+                        st.error(f"An error occurred: {error}")
+                        sql = None
+                    else:
+                        # Downloads re-run the query without the row limit of the cost policy
+                        message["sql"] = repaired_sql
+                        sql = check_query_cost(message, repaired_sql, len(st.session_state.messages))
+                if sql is not None:
+                    #print('path of databse', st.session_state.db_file_path)
+                    run_query(message, sql)
+                    download_controls(message, len(st.session_state.messages))
+
+        elif prompt.startswith('insight:'):
+            with st.chat_message("assistant"):
+                try:
+                    my_list = st.session_state.messages
+                    idx = -(next(i for i, d in enumerate(my_list[::-1]) if 'result_str' in d) + 2)
+                    #print("Latest dict with result:", my_list[idx + 1])
+                    #print("Dict just above the latest with result:", my_list[idx])
+                    stream = timed_stream(client.stream_chat(
+                        [
+                            {"role": "system", "content": main_sys_prompt()},
+                            {"role": "user", "content": prompt + f"\n#### Inquiry\n**Question:** {my_list[idx]['content']}\n\n#### Data Overview\n**Query Result Summary:**\n{my_list[idx + 1]['result_str']}"},
+                        ]
+                    ))
+                    response = stream_to_text(st.write_stream(stream))
+                except StopIteration:
+                    response = "I'm sorry, but without knowing specifically which data you are referring to, I am unable to provide a description. Could you please ask the question again?"
+                message = {"role": "assistant", "content": response}
         else:
-            response = response
-        message = {"role": "assistant", "content": response}
-        sql_match = re.search(r"```sql\n(.*)\n```", response, re.DOTALL)
-        with st.spinner('Getting insights from database based on the query.....'):
-            if sql_match:
-                sql = sql_match.group(1)
-                #print('path of databse', st.session_state.db_file_path)
+            ##print('check this',st.session_state.messages)
+            with st.chat_message("assistant"):
                 try:
-                    results = query_to_dataframe(st.session_state.db_file_path, sql)
-                    # Convert DataFrame to a string with pipe-separated values
-                    result_str = results.head(1).to_csv(sep='|', index=False, lineterminator='\n')
-                    message["results"] = results
-                    message["result_str"] = result_str
-                    st.dataframe(message["results"], use_container_width=True)
+                    stream = timed_stream(client.stream_chat(
+                        [
+                            {"role": m["role"], "content": m["content"]}
+                            for m in st.session_state.messages
+                        ]
+                    ))
+                    response = stream_to_text(st.write_stream(stream))
                 except Exception as e:
-                    message["results"] = f'An error occurred: {e}'
-                    message["result_str"] = ''
                     st.error(f"An error occurred: {e}")
-
-    elif prompt.startswith('insight:'):
-        with st.chat_message("assistant"):
-            try:
-                my_list = st.session_state.messages
-                idx = -(next(i for i, d in enumerate(my_list[::-1]) if 'result_str' in d) + 2)
-                #print("Latest dict with result:", my_list[idx + 1])
-                #print("Dict just above the latest with result:", my_list[idx])
-                stream = client.chat.completions.create(
-                    model= config['chat_model_name'],
-                    messages=[
-                        {"role": "system", "content": main_sys_prompt()},
-                        {"role": "user", "content": prompt + f"\n#### Inquiry\n**Question:** {my_list[idx]['content']}\n\n#### Data Overview\n**Query Result:**  {my_list[idx + 1]['result_str']}"},
-                    ],
-                    stream=True,
-                )
-                response = st.write_stream(stream)
-            except StopIteration:
-                response = "I'm sorry, but without knowing specifically which data you are referring to, I am unable to provide a description. Could you please ask the question again?"
-            if len(response)>1:
-                response = response[-1]
-            elif len(response)==1:
-                response = response[0]
-            else:
-                response = response
-            message = {"role": "assistant", "content": response}
-    else:
-        ##print('check this',st.session_state.messages)
-        with st.chat_message("assistant"):
-            try:
-                stream = client.chat.completions.create(
-                    model= config['chat_model_name'],
-                    messages=[
-                        {"role": m["role"], "content": m["content"]}
-                        for m in st.session_state.messages
-                    ],
-                    stream=True,
-                )
-                response = st.write_stream(stream)
-            except Exception as e:
-                st.error(f"An error occurred: {e}")
-                response = f"An error occurred: {e}"
-            if len(response)>1:
-                response = response[-1]
-            elif len(response)==1:
-                response = response[0]
-            else:
-                response = response
-            message = {"role": "assistant", "content": response}
+                    response = f"An error occurred: {e}"
+                message = {"role": "assistant", "content": response}
+    message["trace"] = trace.to_dict()
+    if st.session_state.get("show_performance"):
+        performance_expander(message["trace"])
     st.session_state.messages.append(message)
     ##print('hi bro', st.session_state.messages, '\n')
\ No newline at end of file
@@ -0,0 +1,61 @@
+"""
+Diff two benchmark result files produced by `benchmarks.run_benchmarks`.
+
+Usage:
+    python -m benchmarks.compare benchmarks/results/<old>.json benchmarks/results/<new>.json [--threshold 1.2]
+
+Prints the p50 latency of every benchmark in both runs and flags those that
+got slower by more than `--threshold`. Exits with status 1 if any did.
+"""
+import argparse
+import json
+import sys
+
+
+def _key(result: dict) -> tuple:
+    return result["benchmark"], result.get("rows"), result.get("items")
+
+
+def _value(result: dict):
+    stats = result["stats"]
+    return stats.get("p50_ms", stats.get("total_s"))
+
+
+def compare(old: dict, new: dict, threshold: float) -> list:
+    old_results = {_key(r): r for r in old["results"]}
+    regressions = []
+    print(f"{'benchmark':45} {'scale':>10} {'old':>12} {'new':>12} {'ratio':>7}")
+    for result in new["results"]:
+        key = _key(result)
+        scale = key[1] if key[1] is not None else key[2]
+        new_value = _value(result)
+        if key not in old_results:
+            print(f"{key[0]:45} {scale:>10} {'-':>12} {new_value:>12.3f} {'new':>7}")
+            continue
+        old_value = _value(old_results[key])
+        ratio = new_value / old_value if old_value else float("inf")
+        flag = " <-- slower" if ratio > threshold else ""
+        print(f"{key[0]:45} {scale:>10} {old_value:>12.3f} {new_value:>12.3f} {ratio:>7.2f}{flag}")
+        if ratio > threshold:
+            regressions.append((key, ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=1.2, help="slowdown ratio reported as a regression")
+    args = parser.parse_args(argv)
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print(f"old: {old['meta']['commit']}  new: {new['meta']['commit']}")
+    regressions = compare(old, new, args.threshold)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
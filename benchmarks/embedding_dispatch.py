@@ -0,0 +1,108 @@
+"""
+Embedding dispatcher benchmark.
+
+Simulates many sessions embedding their questions at once against a
+deployment with a fixed per-request latency and a limited number of
+concurrent requests, and compares sending every text on its own with the
+cross-session `MicroBatcher` (batching window plus single-flight). Reports
+API requests made and per-call latency percentiles.
+
+    python -m benchmarks.embedding_dispatch
+    python -m benchmarks.embedding_dispatch --sessions 64 --questions 20 --latency-ms 80
+"""
+import argparse
+import random
+import threading
+import time
+
+from openai_llm.batching import MicroBatcher
+
+
+class SimulatedDeployment:
+    """
+    Embedding endpoint taking `latency_ms` per request (plus a little per
+    text) and serving at most `concurrency` requests at a time.
+    """
+    def __init__(self, latency_ms: float, per_text_ms: float, concurrency: int):
+        self.latency = latency_ms / 1000
+        self.per_text = per_text_ms / 1000
+        self.slots = threading.Semaphore(concurrency)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def embed(self, texts: list) -> list:
+        with self.lock:
+            self.requests += 1
+        with self.slots:
+            time.sleep(self.latency + self.per_text * len(texts))
+        return [[float(len(text))] for text in texts]
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def run(embed, sessions: int, questions: int, vocabulary: int, seed: int = 0) -> list:
+    """Per-call latencies (seconds) of `sessions` threads embedding `questions` texts each."""
+    rng = random.Random(seed)
+    # Popular questions repeat across sessions, as they do in real traffic
+    plans = [[f"question {int(rng.paretovariate(1.2)) % vocabulary}" for _ in range(questions)]
+             for _ in range(sessions)]
+    latencies = []
+    lock = threading.Lock()
+    start = threading.Barrier(sessions)
+
+    def session(plan):
+        start.wait()
+        for text in plan:
+            began = time.perf_counter()
+            embed([text])
+            with lock:
+                latencies.append(time.perf_counter() - began)
+
+    threads = [threading.Thread(target=session, args=(plan,)) for plan in plans]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare direct and dispatched embedding requests.")
+    parser.add_argument("--sessions", type=int, default=32)
+    parser.add_argument("--questions", type=int, default=10, help="Texts embedded per session.")
+    parser.add_argument("--vocabulary", type=int, default=200, help="Distinct questions.")
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests the deployment serves at once.")
+    parser.add_argument("--window-ms", type=float, default=5.0)
+    parser.add_argument("--max-batch", type=int, default=64)
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ("direct", "dispatcher"):
+        deployment = SimulatedDeployment(args.latency_ms, 0.05, args.concurrency)
+        embed = deployment.embed
+        if mode == "dispatcher":
+            embed = MicroBatcher(deployment.embed, max_batch_size=args.max_batch,
+                                 max_wait_ms=args.window_ms, workers=args.concurrency, name="benchmark")
+        began = time.perf_counter()
+        latencies = run(embed, args.sessions, args.questions, args.vocabulary)
+        elapsed = time.perf_counter() - began
+        results[mode] = {"requests": deployment.requests, "seconds": elapsed,
+                         "p50_ms": percentile(latencies, 0.5) * 1000,
+                         "p95_ms": percentile(latencies, 0.95) * 1000,
+                         "p99_ms": percentile(latencies, 0.99) * 1000}
+
+    texts = args.sessions * args.questions
+    print(f"{args.sessions} sessions x {args.questions} texts, {args.latency_ms:.0f} ms per request, "
+          f"{args.concurrency} concurrent requests")
+    for mode, result in results.items():
+        print(f"  {mode:<10} {result['requests']:5d} requests for {texts} texts  "
+              f"p50 {result['p50_ms']:7.1f} ms  p95 {result['p95_ms']:7.1f} ms  p99 {result['p99_ms']:7.1f} ms  "
+              f"({result['seconds']:.2f} s)")
+
+
+if __name__ == "__main__":
+    main()
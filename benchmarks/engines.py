@@ -0,0 +1,81 @@
+"""
+Execution engine benchmark: Parquet uploads converted to SQLite vs. queried
+in place by DuckDB.
+
+For each scale the same synthetic Parquet upload goes through
+`convert_and_save_file` with either engine, and reports:
+
+- upload to first query: storing the upload plus the first aggregate query,
+- stored size on disk,
+- latency of aggregate queries typical of analyst questions (p50/p95).
+
+    python -m benchmarks.engines
+    python -m benchmarks.engines --rows 100000 1000000 10000000 --repeat 10
+"""
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.run_benchmarks import measure
+from benchmarks.synthetic import TABLE_NAME, make_dataframe
+from module.engines import duckdb_available
+from module.utils import convert_and_save_file, query_to_dataframe
+
+AGGREGATE_QUERIES = {
+    "group_by": f"SELECT disease_name, phase, COUNT(*) AS n, AVG(price) AS avg_price "
+                f"FROM {TABLE_NAME} GROUP BY disease_name, phase",
+    "filtered_sum": f"SELECT biomarker, SUM(price) AS revenue FROM {TABLE_NAME} "
+                    f"WHERE phase >= 3 AND lower(biomarker) LIKE '%her2%' GROUP BY biomarker",
+    "distinct_top": f"SELECT drug_name, COUNT(DISTINCT disease_name) AS diseases FROM {TABLE_NAME} "
+                    f"GROUP BY drug_name ORDER BY diseases DESC LIMIT 10",
+}
+
+
+def bench_engine(parquet: bytes, engine: str, upload_dir: str, repeat: int) -> dict:
+    start = time.perf_counter()
+    path = convert_and_save_file(io.BytesIO(parquet), "parquet", upload_dir=upload_dir, parquet_engine=engine)
+    query_to_dataframe(path, AGGREGATE_QUERIES["group_by"])
+    result = {
+        "upload_to_first_query_ms": (time.perf_counter() - start) * 1000,
+        "bytes": os.path.getsize(path),
+        "queries": {name: measure(lambda: query_to_dataframe(path, sql), repeat)
+                    for name, sql in AGGREGATE_QUERIES.items()},
+    }
+    os.remove(path)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the SQLite and DuckDB paths of Parquet uploads.")
+    parser.add_argument("--rows", type=int, nargs="*", default=[100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=10, help="Repetitions per aggregate query.")
+    args = parser.parse_args()
+    if not duckdb_available():
+        parser.error("duckdb is not installed (pip install duckdb)")
+
+    upload_dir = tempfile.mkdtemp(prefix="insightgenix_engines_")
+    try:
+        for rows in args.rows:
+            buffer = io.BytesIO()
+            make_dataframe(rows).to_parquet(buffer, index=False)
+            parquet = buffer.getvalue()
+            print(f"{rows:,} rows ({len(parquet) / 1e6:.1f} MB of Parquet)")
+            results = {engine: bench_engine(parquet, engine, upload_dir, args.repeat)
+                       for engine in ("sqlite", "duckdb")}
+            for engine, result in results.items():
+                print(f"  {engine:<7} upload to first query {result['upload_to_first_query_ms']:9.1f} ms  "
+                      f"stored {result['bytes'] / 1e6:7.1f} MB")
+            for name in AGGREGATE_QUERIES:
+                sqlite, duckdb = (results[engine]["queries"][name] for engine in ("sqlite", "duckdb"))
+                print(f"  {name:<13} sqlite p50 {sqlite['p50_ms']:8.1f} ms  p95 {sqlite['p95_ms']:8.1f} ms   "
+                      f"duckdb p50 {duckdb['p50_ms']:8.1f} ms  p95 {duckdb['p95_ms']:8.1f} ms   "
+                      f"({sqlite['p50_ms'] / duckdb['p50_ms']:.1f}x)")
+    finally:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
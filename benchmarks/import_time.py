@@ -0,0 +1,95 @@
+"""
+Import-time budget for the Streamlit pages.
+
+Runs the top-level imports of `Chatbot.py` and every page in a fresh
+interpreter with `python -X importtime`, reports the time they take and the
+heaviest modules, and fails when a page exceeds the budget or pulls in a
+dependency that must only load on the paths that use it.
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --budget-ms 600 --repeat 5
+"""
+import argparse
+import ast
+import glob
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Heavy dependencies no page may import at startup
+LAZY_MODULES = ["chromadb", "openai", "pandas", "sqlalchemy", "onnxruntime", "pyarrow", "PIL"]
+
+
+def page_scripts() -> list:
+    return [os.path.join(REPO_ROOT, "Chatbot.py")] + sorted(glob.glob(os.path.join(REPO_ROOT, "pages", "*.py")))
+
+
+def top_level_imports(path: str) -> str:
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def run_importtime(code: str) -> list:
+    """
+    Return `(module, self_us, cumulative_us, depth)` for every module imported
+    by `code` in a fresh interpreter.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=REPO_ROOT,
+                            env={**os.environ, "PYTHONPATH": REPO_ROOT}, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def measure(code: str, baseline: set) -> dict:
+    rows = [row for row in run_importtime(code) if row[0] not in baseline]
+    total_us = sum(cumulative for _, _, cumulative, depth in rows if depth == 0)
+    imported = {name for name, _, _, _ in rows}
+    heaviest = sorted(((name, cumulative) for name, _, cumulative, depth in rows if depth <= 1),
+                      key=lambda item: -item[1])[:8]
+    return {"total_ms": total_us / 1000, "imported": imported, "heaviest": heaviest}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time of every Streamlit page.")
+    parser.add_argument("--budget-ms", type=float, default=800.0,
+                        help="Maximum import time per page, streamlit included (default 800 ms).")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per page; the fastest one counts.")
+    args = parser.parse_args()
+
+    baseline = {row[0] for row in run_importtime("pass")}
+    failures = []
+    for path in page_scripts():
+        code = top_level_imports(path)
+        runs = [measure(code, baseline) for _ in range(args.repeat)]
+        best = min(runs, key=lambda run: run["total_ms"])
+        page = os.path.relpath(path, REPO_ROOT)
+        print(f"{page}: {best['total_ms']:.0f} ms")
+        for name, cumulative in best["heaviest"]:
+            print(f"    {cumulative / 1000:8.1f} ms  {name}")
+        eager = [name for name in LAZY_MODULES if name in best["imported"]]
+        if eager:
+            failures.append(f"{page} imports {', '.join(eager)} at startup")
+        if best["total_ms"] > args.budget_ms:
+            failures.append(f"{page} takes {best['total_ms']:.0f} ms to import (budget {args.budget_ms:.0f} ms)")
+
+    if failures:
+        print("\nImport budget exceeded:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print(f"\nAll pages within the {args.budget_ms:.0f} ms import budget.")
+
+
+if __name__ == "__main__":
+    main()
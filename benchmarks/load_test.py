@@ -0,0 +1,364 @@
+"""
+Concurrent-session load test.
+
+Runs N simulated users at once against the real pages through Streamlit's
+`AppTest`, each on its own thread with its own session state, in one process
+(as sessions share one Streamlit server process). Every session opens the
+Connect DB and Train LLM pages, then sends a mix of `query:`, `insight:` and
+chat turns to `Chatbot.py` with some think time between them, against a
+synthetic uploaded database and a trained vector store.
+
+The LLM and embedding backends are the local providers with a configurable
+latency standing in for the API round trips (`LOCAL_FIRST_TOKEN_LATENCY`,
+`LOCAL_TOKEN_LATENCY`, `LOCAL_EMBEDDING_LATENCY`). Per concurrency level it
+reports:
+
+- throughput (turns per second) and errors,
+- p50/p95/p99 per stage: page loads (`page:<page>`), whole turns by kind
+  (`turn:query`, ...) and the spans each turn traced (retrieval, llm.stream,
+  sql.execute, ...),
+- process RSS sampled over the run.
+
+The browser and websocket side of Streamlit is not part of the measurement.
+Everything is written under a temporary working directory.
+
+    python -m benchmarks.load_test
+    python -m benchmarks.load_test --sessions 1 8 32 --turns 10 --llm-latency-ms 800 \\
+        --token-latency-ms 20 --embedding-latency-ms 60 --output load.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = {"connect_db": "pages/Connect DB.py", "train_llm": "pages/Train LLM.py"}
+CHATBOT = "Chatbot.py"
+INSIGHT_PROMPTS = ["insight: summarize the result", "insight: what stands out in this data?"]
+CHAT_PROMPTS = ["what does the phase column mean?", "which biomarkers are tracked?", "thanks, that helps"]
+
+
+def rss_mb() -> float:
+    # Current RSS from /proc on Linux; elsewhere the peak RSS is the best available figure
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class RssSampler:
+    """(seconds since start, RSS MB) every `interval` seconds on a background thread."""
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def _run(self):
+        start = time.perf_counter()
+        while True:
+            self.samples.append((round(time.perf_counter() - start, 2), round(rss_mb(), 1)))
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.samples.append((self.samples[-1][0] + self.interval if self.samples else 0.0, round(rss_mb(), 1)))
+
+
+def isolate_sessions():
+    """
+    `AppTest` runs one script at a time, in ways that collide when sessions
+    run at once:
+
+    - it puts a mock Streamlit runtime for each run in a class attribute and
+      removes it when the run ends,
+    - it turns on the `global.appTest` option by patching `config.get_option`
+      for the length of a run, which another session's run then undoes,
+    - it compiles the script again every run, and compiling in several
+      threads at once trips a CPython 3.11 `ast` bug.
+
+    Instead, every script thread sees the runtime of its own session's run,
+    the option is on for the whole process, and scripts are compiled once
+    into a shared cache, as a server does.
+    """
+    from streamlit import config
+    from streamlit.runtime.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.runtime.scriptrunner_utils.script_run_context import get_script_run_ctx
+    from streamlit.testing.v1 import app_test, local_script_runner
+    from streamlit.testing.v1.util import build_mock_config_get_option
+
+    config.get_option = build_mock_config_get_option({"global.appTest": True})
+    app_test.patch_config_options = lambda overrides: contextlib.nullcontext()
+
+    script_cache = ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+
+    runtimes = {}  # id of a session's SessionState -> mock runtime of its current run
+    running = threading.local()
+    make_mock = app_test.MagicMock
+
+    def mock(*args, **kwargs):
+        created = make_mock(*args, **kwargs)
+        if kwargs.get("spec") is Runtime and getattr(running, "state", None) is not None:
+            runtimes[running.state] = created
+        return created
+
+    run = app_test.AppTest._run
+
+    def run_session(self, *args, **kwargs):
+        running.state = id(self._session_state._state)
+        try:
+            return run(self, *args, **kwargs)
+        finally:
+            running.state = None
+
+    def session_runtime():
+        ctx = get_script_run_ctx(suppress_warning=True)
+        runtime = runtimes.get(id(ctx.session_state._state)) if ctx is not None else None
+        return runtime or Runtime._instance  # threads outside a script, e.g. background jobs
+
+    def instance(cls):
+        runtime = session_runtime()
+        if runtime is None:
+            raise RuntimeError("Runtime hasn't been created!")
+        return runtime
+
+    app_test.MagicMock = mock
+    app_test.AppTest._run = run_session
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: session_runtime() is not None)
+
+
+def prepare(workdir: str, rows: int, items: int) -> str:
+    """
+    Synthetic uploaded database plus the vector store bound to it, trained
+    with a synthetic corpus. Returns the database path.
+    """
+    from benchmarks.synthetic import make_sqlite_db, make_training_corpus
+    from module.query_plan import cache_table_stats
+    from module.utils import database_fingerprint, get_openai_config, init_chromadb
+    from module.value_index import build_value_index
+
+    os.makedirs(os.path.join(workdir, "uploaded_data"), exist_ok=True)
+    db_file = make_sqlite_db(os.path.join(workdir, "uploaded_data", "load_test.db"), rows)
+    # What an upload builds next to the database
+    cache_table_stats(db_file)
+    build_value_index(db_file)
+    db, _ = init_chromadb(get_openai_config(), fingerprint=database_fingerprint(db_file))
+    for kind, records in make_training_corpus(items).items():
+        for record in records:
+            db.train(**{kind: record})
+    return db_file
+
+
+def make_plan(turns: int, mix: dict, rng: random.Random) -> list:
+    """(kind, prompt) turns of one session; it starts with a query so insights have a result to explain."""
+    from benchmarks.synthetic import make_questions
+
+    questions = make_questions(turns, seed=rng.randrange(1 << 30))
+    kinds = ["query"] + rng.choices(list(mix), weights=list(mix.values()), k=turns - 1)
+    prompts = {"insight": INSIGHT_PROMPTS, "chat": CHAT_PROMPTS}
+    return [(kind, questions[i] if kind == "query" else rng.choice(prompts[kind]))
+            for i, kind in enumerate(kinds[:turns])]
+
+
+class Session(threading.Thread):
+    def __init__(self, index: int, db_file: str, plan: list, think_s: float, timeout: float,
+                 start: threading.Barrier, rng: random.Random):
+        super().__init__(name=f"session-{index}", daemon=True)
+        self.db_file = db_file
+        self.plan = plan
+        self.think_s = think_s
+        self.timeout = timeout
+        self.start_barrier = start
+        self.rng = rng
+        self.timings = {}  # stage -> [ms]
+        self.errors = []
+        self.turns = 0
+
+    def record(self, stage: str, ms: float):
+        self.timings.setdefault(stage, []).append(ms)
+
+    def _app(self, page: str):
+        from streamlit.testing.v1 import AppTest
+
+        app = AppTest.from_file(os.path.join(REPO, page), default_timeout=self.timeout)
+        app.session_state.db_file_path = self.db_file
+        app.session_state.uploaded_data_file = os.path.basename(self.db_file)
+        return app
+
+    def _check(self, app, what: str):
+        if app.exception:
+            self.errors.append(f"{what}: {app.exception[0].message}")
+
+    def run(self):
+        self.start_barrier.wait()
+        try:
+            for name, page in PAGES.items():
+                app = self._app(page)
+                began = time.perf_counter()
+                app.run()
+                self.record(f"page:{name}", (time.perf_counter() - began) * 1000)
+                self._check(app, name)
+
+            chat = self._app(CHATBOT)
+            began = time.perf_counter()
+            chat.run()
+            self.record("page:chatbot", (time.perf_counter() - began) * 1000)
+            self._check(chat, "chatbot")
+            for kind, prompt in self.plan:
+                # Think time, jittered so sessions do not stay in lockstep
+                time.sleep(self.think_s * self.rng.uniform(0.5, 1.5))
+                began = time.perf_counter()
+                chat.chat_input[0].set_value(prompt).run()
+                self.record(f"turn:{kind}", (time.perf_counter() - began) * 1000)
+                self.turns += 1
+                self._check(chat, kind)
+                message = chat.session_state.messages[-1]
+                if isinstance(message.get("results"), str):
+                    self.errors.append(f"{kind}: {message['results']}")
+                for span in message.get("trace", {}).get("spans", []):
+                    self.record(span["name"], span["duration_ms"])
+        except Exception as e:
+            self.errors.append(f"{type(e).__name__}: {e}")
+
+
+def run_level(db_file: str, sessions: int, turns: int, mix: dict, think_s: float, timeout: float,
+              rss_interval: float, seed: int) -> dict:
+    from benchmarks.embedding_dispatch import percentile
+
+    rng = random.Random(seed)
+    start = threading.Barrier(sessions)
+    workers = [Session(i, db_file, make_plan(turns, mix, rng), think_s, timeout, start,
+                       random.Random(rng.randrange(1 << 30))) for i in range(sessions)]
+    with RssSampler(rss_interval) as sampler:
+        began = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - began
+
+    timings = {}
+    for worker in workers:
+        for stage, values in worker.timings.items():
+            timings.setdefault(stage, []).extend(values)
+    completed = sum(worker.turns for worker in workers)
+    return {
+        "sessions": sessions,
+        "turns": completed,
+        "seconds": elapsed,
+        "turns_per_s": completed / elapsed if elapsed else None,
+        "errors": [error for worker in workers for error in worker.errors],
+        "stages": {stage: {"count": len(values),
+                           "p50_ms": percentile(values, 0.5),
+                           "p95_ms": percentile(values, 0.95),
+                           "p99_ms": percentile(values, 0.99)}
+                   for stage, values in sorted(timings.items())},
+        "rss_mb": sampler.samples,
+    }
+
+
+def print_level(result: dict):
+    rss = [mb for _, mb in result["rss_mb"]]
+    print(f"{result['sessions']} sessions: {result['turns']} turns in {result['seconds']:.1f} s "
+          f"({result['turns_per_s']:.2f} turns/s), {len(result['errors'])} errors, "
+          f"RSS {rss[0]:.0f} -> {rss[-1]:.0f} MB (peak {max(rss):.0f} MB)")
+    print(f"  {'stage':<28} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    # Page loads and whole turns first, then the traced spans
+    order = sorted(result["stages"], key=lambda stage: (not stage.startswith(("page:", "turn:")), stage))
+    for stage in order:
+        stats = result["stages"][stage]
+        print(f"  {stage:<28} {stats['count']:>6} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} "
+              f"{stats['p99_ms']:>9.1f}")
+    # A dozen points of the RSS curve; the full series is in the JSON output
+    step = max(1, len(result["rss_mb"]) // 12)
+    print("  RSS over time: " + ", ".join(f"{t:.0f}s {mb:.0f}MB" for t, mb in result["rss_mb"][::step]))
+    for error in result["errors"][:5]:
+        print(f"  error: {error}")
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        if kind.strip() not in ("query", "insight", "chat"):
+            raise argparse.ArgumentTypeError(f"unknown turn kind: {kind}")
+        mix[kind.strip()] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive the app with concurrent simulated sessions.")
+    parser.add_argument("--sessions", type=int, nargs="*", default=[1, 8], help="Concurrency levels to run.")
+    parser.add_argument("--turns", type=int, default=6, help="Chat turns per session.")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("query=3,insight=1,chat=1"),
+                        help="Relative weights of the turn kinds after the first query.")
+    parser.add_argument("--think-ms", type=float, default=500.0, help="Mean pause between the turns of a session.")
+    parser.add_argument("--llm-latency-ms", type=float, default=500.0, help="Time to the first streamed token.")
+    parser.add_argument("--token-latency-ms", type=float, default=10.0, help="Gap between streamed tokens.")
+    parser.add_argument("--embedding-latency-ms", type=float, default=50.0, help="Round trip of an embedding request.")
+    parser.add_argument("--rows", type=int, default=100_000, help="Rows of the uploaded database.")
+    parser.add_argument("--items", type=int, default=200, help="Training items in the vector store.")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Seconds one page run may take.")
+    parser.add_argument("--rss-interval", type=float, default=1.0, help="Seconds between RSS samples.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="Working directory (default: a temporary one, removed afterwards).")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="insightgenix_load_"))
+    os.makedirs(workdir, exist_ok=True)
+    # The app keeps its stores, uploads, jobs and traces under the working directory. The app
+    # modules read some settings when they are imported, so nothing of the app is imported before.
+    os.chdir(workdir)
+    os.environ.update({"LLM_PROVIDER": "local", "EMBEDDING_PROVIDER": "local", "WARMUP": "0",
+                       "TRACE_LOG_PATH": os.path.join(workdir, "traces.jsonl")})
+    isolate_sessions()
+    try:
+        began = time.perf_counter()
+        db_file = prepare(workdir, args.rows, args.items)
+        print(f"Prepared {args.rows:,} rows and {args.items} training items in {time.perf_counter() - began:.1f} s")
+        # Latency applies to the run only, not to training the store
+        os.environ.update({"LOCAL_FIRST_TOKEN_LATENCY": str(args.llm_latency_ms / 1000),
+                           "LOCAL_TOKEN_LATENCY": str(args.token_latency_ms / 1000),
+                           "LOCAL_EMBEDDING_LATENCY": str(args.embedding_latency_ms / 1000)})
+        results = []
+        for sessions in args.sessions:
+            result = run_level(db_file, sessions, args.turns, args.mix, args.think_ms / 1000, args.timeout,
+                               args.rss_interval, args.seed)
+            print_level(result)
+            results.append(result)
+        if output:
+            with open(output, "w") as f:
+                json.dump({"args": vars(args), "results": results}, f, indent=2)
+            print(f"Wrote {output}")
+    finally:
+        os.chdir(REPO)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
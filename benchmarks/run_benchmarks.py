@@ -0,0 +1,207 @@
+"""
+Offline end-to-end benchmark suite.
+
+Generates synthetic SQLite databases and training corpora at several scales
+and times the hot paths of the app with the local provider (no network):
+
+- retrieval:  ChromaDB_VectorStore.get_similar_question_sql / get_related_ddl / get_related_schema /
+              get_related_documentation
+- prompt:     get_sql_prompt
+- training:   ChromaDB_VectorStore.train and get_training_data
+- ingestion:  convert_and_save_file (parquet and sqlite uploads)
+- execution:  query_to_dataframe (lookup, aggregate and bulk materialization)
+- values:     build_value_index and resolve_values (question terms to stored values)
+
+Usage (from the repository root):
+    python -m benchmarks.run_benchmarks                      # quick scales
+    python -m benchmarks.run_benchmarks --full               # 1e3..1e7 rows, 10..10k items
+    python -m benchmarks.run_benchmarks --rows 1000 --items 10 --output results.json
+
+Results are written as JSON; compare two runs with `python -m benchmarks.compare`.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.synthetic import TABLE_NAME, make_dataframe, make_questions, make_sqlite_db, make_training_corpus
+from chroma_db.chroma_vector import ChromaDB_VectorStore
+from module.utils import convert_and_save_file, get_sql_prompt, query_to_dataframe
+from module.value_index import build_value_index, resolve_values
+
+QUICK_ROWS = [1_000, 100_000]
+FULL_ROWS = [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+QUICK_ITEMS = [10, 1_000]
+FULL_ITEMS = [10, 100, 1_000, 10_000]
+
+EXECUTION_QUERIES = {
+    "lookup": f"SELECT drug_name, disease_name, phase FROM {TABLE_NAME} WHERE lower(biomarker) like '%her2 positive%' LIMIT 10",
+    "aggregate": f"SELECT disease_name, phase, COUNT(*) AS n, AVG(price) AS avg_price FROM {TABLE_NAME} GROUP BY disease_name, phase",
+    "materialize": f"SELECT * FROM {TABLE_NAME} LIMIT {{limit}}",
+}
+
+
+def local_config(path: str) -> dict:
+    return {"path": path, "llm_provider": "local", "embedding_provider": "local"}
+
+
+def measure(fn, repeat: int) -> dict:
+    """
+    Call `fn` `repeat` times and return latency statistics in milliseconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "n": len(timings),
+        "mean_ms": statistics.fmean(timings),
+        "p50_ms": timings[len(timings) // 2],
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "min_ms": timings[0],
+        "max_ms": timings[-1],
+    }
+
+
+def bench_vector_store(items: int, workdir: str, repeat: int) -> list:
+    results = []
+    store_path = os.path.join(workdir, f"chroma_{items}")
+    shutil.rmtree(store_path, ignore_errors=True)
+    db = ChromaDB_VectorStore(config=local_config(store_path))
+    corpus = make_training_corpus(items)
+
+    start = time.perf_counter()
+    for kind, entries in corpus.items():
+        for entry in entries:
+            db.train(**{kind: entry})
+    elapsed = time.perf_counter() - start
+    results.append({"benchmark": "train", "items": items,
+                    "stats": {"total_s": elapsed, "items_per_s": items / elapsed if elapsed else None}})
+
+    questions = iter(make_questions(repeat * 4))
+    for name in ["get_similar_question_sql", "get_related_ddl", "get_related_schema", "get_related_documentation"]:
+        method = getattr(db, name)
+        results.append({"benchmark": f"retrieval.{name}", "items": items,
+                        "stats": measure(lambda: method(next(questions)), repeat)})
+
+    question = make_questions(1, seed=7)[0]
+    question_sql_list = db.get_similar_question_sql(question)
+    ddl_list = db.get_related_schema(question)
+    doc_list = db.get_related_documentation(question)
+    results.append({"benchmark": "prompt.get_sql_prompt", "items": items,
+                    "stats": measure(lambda: get_sql_prompt(question=question,
+                                                            question_sql_list=question_sql_list,
+                                                            ddl_list=ddl_list,
+                                                            doc_list=doc_list), repeat)})
+
+    results.append({"benchmark": "training.get_training_data", "items": items,
+                    "stats": measure(db.get_training_data, max(1, repeat // 5))})
+    return results
+
+
+def bench_database(rows: int, workdir: str, repeat: int, ingest_max_rows: int, materialize_rows: int) -> list:
+    results = []
+    db_path = make_sqlite_db(os.path.join(workdir, f"synthetic_{rows}.db"), rows)
+    upload_dir = os.path.join(workdir, "uploads")
+
+    if rows <= ingest_max_rows:
+        parquet = io.BytesIO()
+        make_dataframe(rows).to_parquet(parquet, index=False)
+
+        def ingest_parquet():
+            parquet.seek(0)
+            # Conversion to SQLite; benchmarks.engines compares it with DuckDB in place
+            os.remove(convert_and_save_file(parquet, "parquet", upload_dir=upload_dir, parquet_engine="sqlite"))
+
+        results.append({"benchmark": "ingestion.parquet", "rows": rows,
+                        "stats": measure(ingest_parquet, max(1, repeat // 5))})
+
+        with open(db_path, "rb") as f:
+            sqlite_bytes = io.BytesIO(f.read())
+        results.append({"benchmark": "ingestion.sqlite", "rows": rows,
+                        "stats": measure(lambda: os.remove(convert_and_save_file(sqlite_bytes, "db", upload_dir=upload_dir)),
+                                         max(1, repeat // 5))})
+
+    for name, query in EXECUTION_QUERIES.items():
+        query = query.format(limit=materialize_rows)
+        results.append({"benchmark": f"execution.{name}", "rows": rows,
+                        "stats": measure(lambda: query_to_dataframe(db_path, query), max(1, repeat // 5))})
+
+    results.append({"benchmark": "values.build", "rows": rows,
+                    "stats": measure(lambda: build_value_index(db_path), 1)})
+    questions = iter(make_questions(repeat + 1, seed=3))
+    resolve_values(db_path, next(questions))  # loads the index
+    results.append({"benchmark": "values.resolve", "rows": rows,
+                    "stats": measure(lambda: resolve_values(db_path, next(questions)), repeat)})
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--full", action="store_true", help="run every scale (up to 1e7 rows and 10k items)")
+    parser.add_argument("--rows", type=int, nargs="*", help="database sizes to benchmark")
+    parser.add_argument("--items", type=int, nargs="*", help="training corpus sizes to benchmark")
+    parser.add_argument("--repeat", type=int, default=20, help="repetitions per latency measurement")
+    parser.add_argument("--ingest-max-rows", type=int, default=1_000_000,
+                        help="skip ingestion benchmarks above this many rows")
+    parser.add_argument("--materialize-rows", type=int, default=100_000,
+                        help="rows fetched by the materialization query")
+    parser.add_argument("--workdir", default=None, help="where synthetic data is generated (reused between runs)")
+    parser.add_argument("--output", default=None, help="JSON results file (default benchmarks/results/<commit>.json)")
+    args = parser.parse_args(argv)
+
+    rows = args.rows if args.rows is not None else (FULL_ROWS if args.full else QUICK_ROWS)
+    items = args.items if args.items is not None else (FULL_ITEMS if args.full else QUICK_ITEMS)
+    workdir = args.workdir or os.path.join(tempfile.gettempdir(), "insightgenix_bench")
+    os.makedirs(workdir, exist_ok=True)
+
+    commit = git_commit()
+    results = []
+    for n in items:
+        print(f"vector store: {n} training items", flush=True)
+        results.extend(bench_vector_store(n, workdir, args.repeat))
+    for n in rows:
+        print(f"database: {n} rows", flush=True)
+        results.extend(bench_database(n, workdir, args.repeat, args.ingest_max_rows, args.materialize_rows))
+
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": args.repeat,
+            "rows": rows,
+            "items": items,
+        },
+        "results": results,
+    }
+
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Synthetic databases and training corpora for the benchmark suite.
+
+Everything is generated from a fixed seed so runs on different commits see
+exactly the same data.
+"""
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+TABLE_NAME = "uploaded_data"
+
+DDL = f"""CREATE TABLE {TABLE_NAME} (
+    id INTEGER,
+    drug_name TEXT,
+    disease_name TEXT,
+    biomarker TEXT,
+    phase INTEGER,
+    launch_date TEXT,
+    price REAL
+)"""
+
+DRUGS = [f"drug_{i:04d}" for i in range(500)]
+DISEASES = [f"disease_{i:02d}" for i in range(50)]
+BIOMARKERS = ["her2 positive", "her2 negative", "egfr", "kras g12c", "alk", "braf v600e",
+              "pd-l1 high", "pd-l1 low", "brca1", "brca2", "msi-h", "ntrk", "ret", "met",
+              "ros1", "fgfr2", "idh1", "pik3ca", "tmb high", "none"]
+
+
+def make_dataframe(rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Build `rows` rows of the synthetic drug table with vectorized NumPy.
+    """
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2015-01-01")
+    return pd.DataFrame({
+        "id": np.arange(rows, dtype=np.int64) + seed * rows,
+        "drug_name": np.array(DRUGS, dtype=object)[rng.integers(0, len(DRUGS), rows)],
+        "disease_name": np.array(DISEASES, dtype=object)[rng.integers(0, len(DISEASES), rows)],
+        "biomarker": np.array(BIOMARKERS, dtype=object)[rng.integers(0, len(BIOMARKERS), rows)],
+        "phase": rng.integers(1, 5, rows),
+        "launch_date": (start + rng.integers(0, 4000, rows).astype("timedelta64[D]")).astype(str),
+        "price": rng.gamma(2.0, 500.0, rows).round(2),
+    })
+
+
+def make_sqlite_db(path: str, rows: int, seed: int = 0, chunk_size: int = 200_000) -> str:
+    """
+    Write a SQLite database with `rows` rows of the synthetic table.
+
+    Existing files with the right row count are reused, so the larger scales
+    only have to be generated once per work directory.
+    """
+    if os.path.exists(path):
+        with sqlite3.connect(path) as conn:
+            try:
+                count = conn.execute(f"SELECT COUNT(*) FROM {TABLE_NAME}").fetchone()[0]
+            except sqlite3.OperationalError:
+                count = -1
+        if count == rows:
+            return path
+        os.remove(path)
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute(DDL)
+    written = 0
+    chunk = 0
+    while written < rows:
+        size = min(chunk_size, rows - written)
+        df = make_dataframe(size, seed=seed + chunk)
+        df["id"] = np.arange(written, written + size)
+        conn.executemany(f"INSERT INTO {TABLE_NAME} VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         df.itertuples(index=False, name=None))
+        written += size
+        chunk += 1
+    conn.commit()
+    conn.close()
+    return path
+
+
+def make_training_corpus(items: int, seed: int = 0) -> dict:
+    """
+    Build `items` training items in the format accepted by `ChromaDB_VectorStore.train`.
+
+    Roughly 60% are question/SQL pairs, 30% documentation lines and 10% DDL
+    statements (at least one of each).
+
+    Returns:
+        dict: {"sql": [...], "documentation": [...], "ddl": [...]}
+    """
+    rng = np.random.default_rng(seed)
+    n_ddl = max(1, items // 10)
+    n_doc = max(1, (items * 3) // 10)
+    n_sql = max(1, items - n_ddl - n_doc)
+
+    sql = []
+    for i in range(n_sql):
+        drug = DRUGS[rng.integers(len(DRUGS))]
+        biomarker = BIOMARKERS[rng.integers(len(BIOMARKERS))]
+        phase = int(rng.integers(1, 5))
+        sql.append({
+            "id": f"bench-{i}",
+            "question": f"Which diseases is {drug} tested for in phase {phase} with biomarker {biomarker}? ({i})",
+            "query": (f"SELECT disease_name, phase FROM {TABLE_NAME} "
+                      f"WHERE lower(drug_name) like '%{drug}%' AND phase = {phase} "
+                      f"AND lower(biomarker) like '%{biomarker}%' LIMIT 10"),
+        })
+
+    documentation = []
+    for i in range(n_doc):
+        biomarker = BIOMARKERS[i % len(BIOMARKERS)]
+        disease = DISEASES[i % len(DISEASES)]
+        documentation.append({
+            "id": f"bench-{i}",
+            "documentation": f"`biomarker` value '{biomarker}' is frequently reported for {disease} (note {i}).",
+        })
+
+    ddl = []
+    for i in range(n_ddl):
+        statement = DDL if i == 0 else DDL.replace(TABLE_NAME, f"{TABLE_NAME}_{i}")
+        ddl.append({"id": f"bench-{i}", "table_name": f"{TABLE_NAME}_{i}", "ddl_statement": statement})
+
+    return {"sql": sql, "documentation": documentation, "ddl": ddl}
+
+
+def make_questions(count: int, seed: int = 1) -> list:
+    """
+    Natural language questions used to drive retrieval and prompt assembly.
+    """
+    rng = np.random.default_rng(seed)
+    return [
+        f"query: show diseases for {DRUGS[rng.integers(len(DRUGS))]} where biomarker is "
+        f"{BIOMARKERS[rng.integers(len(BIOMARKERS))]}"
+        for _ in range(count)
+    ]
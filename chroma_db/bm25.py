@@ -0,0 +1,132 @@
+import math
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Tuple
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "for", "from", "give", "has", "have",
+    "how", "i", "in", "is", "it", "me", "my", "of", "on", "or", "please", "provide", "query", "show",
+    "that", "the", "their", "there", "this", "to", "was", "what", "when", "where", "which", "who",
+    "with", "you",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase word tokens. Identifiers such as `drug_name` are kept whole and
+    also split into their parts, so both column names and plain words match.
+    """
+    tokens = []
+    for word in re.findall(r"\w+", text.lower()):
+        if word in STOPWORDS:
+            continue
+        tokens.append(word)
+        if "_" in word:
+            tokens.extend(part for part in word.split("_") if part and part not in STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    """
+    In-memory Okapi BM25 index over the documents of one collection.
+
+    Documents are added and removed incrementally, so the index can follow the
+    Chroma collection it shadows without being rebuilt.
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.documents: Dict[str, str] = {}
+        self._term_freqs: Dict[str, Counter] = {}
+        self._lengths: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def add(self, id: str, document: str, text: str = None):
+        """
+        Index `document` under `id`. `text` overrides what is tokenized (e.g.
+        the question and SQL of a JSON document); `document` is what is returned.
+        """
+        with self._lock:
+            if id in self.documents:
+                self.remove(id)
+            freqs = Counter(tokenize(text if text is not None else document))
+            self.documents[id] = document
+            self._term_freqs[id] = freqs
+            self._lengths[id] = sum(freqs.values())
+            self._total_length += self._lengths[id]
+            for term, count in freqs.items():
+                self._postings.setdefault(term, {})[id] = count
+
+    def remove(self, id: str) -> bool:
+        with self._lock:
+            if id not in self.documents:
+                return False
+            freqs = self._term_freqs.pop(id)
+            del self.documents[id]
+            self._total_length -= self._lengths.pop(id)
+            for term in freqs:
+                posting = self._postings[term]
+                del posting[id]
+                if not posting:
+                    del self._postings[term]
+            return True
+
+    def clear(self):
+        with self._lock:
+            self.documents.clear()
+            self._term_freqs.clear()
+            self._lengths.clear()
+            self._postings.clear()
+            self._total_length = 0
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """
+        Return up to `k` (id, score) pairs, best first. Only documents sharing
+        at least one term with the query are returned.
+        """
+        with self._lock:
+            n_docs = len(self.documents)
+            if not n_docs:
+                return []
+            avg_length = self._total_length / n_docs
+            scores = Counter()
+            for term in set(tokenize(query)):
+                posting = self._postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                for id, tf in posting.items():
+                    norm = tf + self.k1 * (1 - self.b + self.b * self._lengths[id] / avg_length)
+                    scores[id] += idf * tf * (self.k1 + 1) / norm
+            return scores.most_common(k)
+
+    def coverage(self, query: str, id: str) -> float:
+        """
+        Fraction of the distinct query terms that occur in document `id`.
+        Used as the confidence of a lexical match.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return 0.0
+        with self._lock:
+            freqs = self._term_freqs.get(id)
+            if not freqs:
+                return 0.0
+            return sum(1 for term in terms if term in freqs) / len(terms)
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """
+    Merge several ranked id lists: each id scores sum(1 / (k + rank)).
+    """
+    scores = Counter()
+    for ranking in rankings:
+        for rank, id in enumerate(ranking, start=1):
+            scores[id] += 1.0 / (k + rank)
+    return [id for id, _ in scores.most_common()]
@@ -1,34 +1,83 @@
+import hashlib
 import json
-import uuid
-from typing import List
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, Tuple
 
 import chromadb
-import pandas as pd
+import numpy as np
+from chromadb.api.client import SharedSystemClient
 from chromadb.config import Settings
-from openai_llm.openai_embedding import OpenAI_Embeddings
+from chroma_db.bm25 import BM25Index, reciprocal_rank_fusion
+from chroma_db.locking import ReadWriteLock
+from chroma_db.retrieval import apply_token_budget, cosine_distances, mmr_select, retrieval_settings
+from chroma_db.schema_index import SchemaIndex
+from module.tracing import span
+from openai_llm.providers import embedding_settings, get_embedding_provider
+
+COLLECTION_NAMES = ("sql", "ddl", "documentation")
+# Shadow collections a re-index builds before they replace the live ones
+SHADOW_SUFFIX = "-reindex"
+REINDEX_CHECKPOINT = "reindex.json"
+# Id suffix of each collection, which `remove_training_data` dispatches on
+ID_SUFFIXES = {"sql": "-sql", "ddl": "-ddl", "documentation": "-doc"}
+
+
+def content_id(collection_name: str, document: str) -> str:
+    """
+    Id of a training document derived from its content, so the same DDL,
+    documentation line or question/SQL pair is stored (and embedded) once.
+    """
+    return hashlib.sha256(document.encode("utf-8")).hexdigest()[:32] + ID_SUFFIXES[collection_name]
+
+
+def close_chroma_client(client):
+    """
+    Stop the Chroma system behind a persistent client and drop it from
+    chromadb's per-path cache. The cache is private (and misspelled) chromadb
+    API: when a release no longer has it, the system is left to chromadb.
+    """
+    systems = getattr(SharedSystemClient, "_identifer_to_system", None)
+    identifier = getattr(client, "_identifier", None)
+    if not isinstance(systems, dict) or identifier is None:
+        return
+    system = systems.pop(identifier, None)
+    if system is not None:
+        system.stop()
+
 
 class ChromaDB_VectorStore():
     def __init__(self, config=None):
         self.config = config
         self.run_sql_is_set = False
         self.static_documentation = ""
-         # Initialize the OpenAI_Embeddings instance
-        self.openai_embedfuc = OpenAI_Embeddings(config=self.config)
+        # Initialize the embedding provider selected in the config (Azure OpenAI or local)
+        self.embedding_provider = get_embedding_provider(config=self.config)
+        self.embedding_config = embedding_settings(self.config)
 
         # Now, use the chroma_embedding_function to get the setup embedding function
         # This function can be used directly or stored as an attribute for later use
-        self.chroma_embedding_func = self.openai_embedfuc.chroma_embedding_function()
+        self.chroma_embedding_func = self.embedding_provider.chroma_embedding_function()
 
         if config is not None:
             path = config.get("path", ".")
             self.embedding_function = config.get("embedding_function", self.chroma_embedding_func)
             curr_client = config.get("client", "persistent")
             self.n_results = config.get("n_results", 10)
+            self.hybrid_search = config.get("hybrid_search", True)
+            self.lexical_fastpath_threshold = config.get("lexical_fastpath_threshold", 0.9)
+            self.rrf_k = config.get("rrf_k", 60)
+            self.retrieval = retrieval_settings(config)
         else:
             path = "."
             self.embedding_function = self.chroma_embedding_func
             curr_client = "persistent"  # defaults to persistent storage
             self.n_results = 10  # defaults to 10 documents
+            self.hybrid_search = True  # BM25 + vector retrieval
+            self.lexical_fastpath_threshold = 0.9  # query term coverage to skip the embedding call
+            self.rrf_k = 60
+            self.retrieval = retrieval_settings(None)  # distance cutoff, MMR and token budget per collection
 
         if curr_client == "persistent":
             #print('path',path)
@@ -44,26 +93,300 @@ class ChromaDB_VectorStore():
             self.chroma_client = curr_client
         else:
             raise ValueError(f"Unsupported client was set in config: {curr_client}")
+        # Only a client this store opened on its own path is shut down by close()
+        self._owns_client = curr_client == "persistent"
+        self.path = path if curr_client == "persistent" else None
+        self.closed = threading.Event()
+
+        # Writes are applied one at a time; the collection swap of a re-index
+        # waits for in-flight retrievals, which otherwise run concurrently
+        self._write_lock = threading.RLock()
+        self._index_lock = ReadWriteLock()
+
+        # When the configured model differs from the one the collections were
+        # embedded with, keep serving them with their own model until a
+        # re-index has rebuilt them (see chroma_db.reindex)
+        self.configured_embedding_function = self.embedding_function
+        self.pending_provider = None
+        self.vector_search = True
+        self._stored_model = None
+        self._checkpoint = None
+        self._finish_interrupted_swap()
+        self._detect_model_change()
+
+        self.documentation_collection = self._get_or_create_collection("documentation")
+        self.ddl_collection = self._get_or_create_collection("ddl")
+        self.sql_collection = self._get_or_create_collection("sql")
+
+        # Lexical BM25 indexes shadowing each collection, kept in sync on add/remove
+        self.lexical_indexes = {name: BM25Index() for name in ("sql", "ddl", "documentation")}
+        for collection in (self.sql_collection, self.ddl_collection, self.documentation_collection):
+            self._load_lexical_index(collection)
+        # Columns of the trained tables, rebuilt from the ddl and documentation indexes after a change
+        self.schema_index = SchemaIndex()
+
+        # Recent question embeddings, so one question is embedded at most once; shared
+        # by every session reading the store, so guarded by its own lock
+        self._query_embeddings = OrderedDict()
+        self._query_embeddings_lock = threading.Lock()
+
+    def close(self):
+        """
+        Release the Chroma system (HNSW indexes, sqlite handles) behind a
+        persistent client. The store must not be used afterwards.
+        """
+        self.closed.set()
+        self.lexical_indexes = {name: BM25Index() for name in self.lexical_indexes}
+        self.schema_index = SchemaIndex()
+        if not self._owns_client:
+            return
+        close_chroma_client(self.chroma_client)
+
+    @property
+    def embedding_model(self) -> str:
+        return self.embedding_provider.model_name
+
+    @property
+    def reindex_required(self) -> bool:
+        return self.pending_provider is not None
+
+    def _collection_metadata(self) -> dict:
+        return {"hnsw:space": "cosine", "embedding_model": self.embedding_model,
+                "embedding_config": json.dumps(self.embedding_config, sort_keys=True)}
+
+    def _get_or_create_collection(self, name: str):
+        """
+        Open a collection, creating it stamped with the embedding model (and
+        the settings rebuilding it) that produces its vectors.
+        """
+        try:
+            return self.chroma_client.get_collection(name=name, embedding_function=self.embedding_function)
+        except ValueError:
+            return self.chroma_client.create_collection(
+                name=name,
+                embedding_function=self.embedding_function,
+                metadata=self._collection_metadata(),
+            )
 
-        self.documentation_collection = self.chroma_client.get_or_create_collection(
-            name="documentation", embedding_function=self.embedding_function, metadata={"hnsw:space": "cosine"}
-        )
-        self.ddl_collection = self.chroma_client.get_or_create_collection(
-            name="ddl", embedding_function=self.embedding_function, metadata={"hnsw:space": "cosine"}
-        )
-        self.sql_collection = self.chroma_client.get_or_create_collection(
-            name="sql", embedding_function=self.embedding_function, metadata={"hnsw:space": "cosine"}
+    def _detect_model_change(self):
+        """
+        Compare the model stamped on the collections with the configured one.
+
+        On a mismatch the configured provider becomes `pending_provider` and the
+        collections keep being served with the provider rebuilt from their
+        stamp. Collections stamped before their settings were recorded cannot be
+        rebuilt; they are served by lexical retrieval only until the re-index.
+        Unstamped collections are accepted as-is.
+        """
+        for collection in self.chroma_client.list_collections():
+            metadata = collection.metadata or {}
+            stored_model = metadata.get("embedding_model")
+            if collection.name not in COLLECTION_NAMES or stored_model in (None, self.embedding_model):
+                continue
+            self.pending_provider = self.embedding_provider
+            previous = None
+            try:
+                settings = json.loads(metadata.get("embedding_config") or "null")
+                if settings:
+                    previous = get_embedding_provider({**(self.config or {}), **settings})
+            except Exception:
+                previous = None
+            if previous is not None and previous.model_name == stored_model:
+                self.embedding_provider = previous
+                self.embedding_config = settings
+                self.embedding_function = previous.chroma_embedding_function()
+            else:
+                self.vector_search = False
+                self._stored_model = stored_model
+            return
+
+    @property
+    def index_model(self) -> str:
+        """Model of the vectors currently served."""
+        return self._stored_model or self.embedding_model
+
+    def reindex_status(self) -> dict:
+        checkpoint = self.load_reindex_checkpoint() if self.reindex_required else None
+        status = {"required": self.reindex_required, "index_model": self.index_model,
+                  "target_model": self.pending_provider.model_name if self.reindex_required else self.embedding_model,
+                  "vector_search": self.vector_search}
+        if checkpoint:
+            status["items"] = sum(state["offset"] for state in checkpoint["collections"].values())
+            status["total"] = self.count_training_data()
+        return status
+
+    def _checkpoint_path(self):
+        return os.path.join(self.path, REINDEX_CHECKPOINT) if self.path else None
+
+    def load_reindex_checkpoint(self) -> dict:
+        """
+        Progress of the re-index to the pending model, restarted from scratch
+        when the checkpoint belongs to another target model.
+        """
+        path = self._checkpoint_path()
+        target = self.pending_provider.model_name if self.pending_provider else None
+        checkpoint = self._checkpoint
+        if checkpoint is None and path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                checkpoint = json.load(f)
+        if checkpoint is None or checkpoint.get("target_model") != target:
+            checkpoint = {"target_model": target, "state": "building",
+                          "collections": {name: {"offset": 0, "done": False} for name in COLLECTION_NAMES}}
+        self._checkpoint = checkpoint
+        return checkpoint
+
+    def save_reindex_checkpoint(self, checkpoint: dict):
+        self._checkpoint = checkpoint
+        path = self._checkpoint_path()
+        if path:
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(checkpoint, f)
+            os.replace(tmp, path)  # never leaves a torn checkpoint
+
+    def _clear_reindex_checkpoint(self):
+        self._checkpoint = None
+        path = self._checkpoint_path()
+        if path and os.path.exists(path):
+            os.remove(path)
+
+    def shadow_collection(self, name: str, fresh: bool = False):
+        """
+        Shadow of collection `name` stamped with the pending model, where a
+        re-index writes the re-embedded items. `fresh` drops any earlier one.
+        """
+        shadow_name = name + SHADOW_SUFFIX
+        if fresh:
+            try:
+                self.chroma_client.delete_collection(shadow_name)
+            except ValueError:
+                pass
+        settings = embedding_settings(self.config)
+        return self.chroma_client.get_or_create_collection(
+            name=shadow_name,
+            embedding_function=self.pending_provider.chroma_embedding_function(),
+            metadata={"hnsw:space": "cosine", "embedding_model": self.pending_provider.model_name,
+                      "embedding_config": json.dumps(settings, sort_keys=True)},
         )
 
+    def swap_collections(self, shadows: dict):
+        """
+        Replace the live collections with their complete shadows and switch to
+        the pending model. Callers hold `_write_lock` so no write is lost;
+        retrievals in flight finish on the old collections first.
+        """
+        checkpoint = self.load_reindex_checkpoint()
+        checkpoint["state"] = "swapping"
+        self.save_reindex_checkpoint(checkpoint)
+        self._index_lock.acquire_write()
+        try:
+            self._rename_shadows(shadows)
+            self.sql_collection = shadows["sql"]
+            self.ddl_collection = shadows["ddl"]
+            self.documentation_collection = shadows["documentation"]
+            self.embedding_provider = self.pending_provider
+            self.embedding_config = embedding_settings(self.config)
+            self.embedding_function = self.configured_embedding_function
+            self.pending_provider = None
+            self.vector_search = True
+            self._stored_model = None
+            with self._query_embeddings_lock:
+                self._query_embeddings.clear()
+        finally:
+            self._index_lock.release_write()
+        self._clear_reindex_checkpoint()
+
+    def _rename_shadows(self, shadows: dict):
+        # The same BM25 indexes stay valid: the shadows hold the same ids and documents
+        for name, shadow in shadows.items():
+            try:
+                self.chroma_client.delete_collection(name)
+            except ValueError:
+                pass  # already deleted by an interrupted swap
+            shadow.modify(name=name)
+
+    def _finish_interrupted_swap(self):
+        # A swap that crashed after deleting a live collection is completed from its shadows
+        path = self._checkpoint_path()
+        if not path or not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("state") != "swapping":
+            return
+        names = {collection.name for collection in self.chroma_client.list_collections()}
+        shadows = {name: self.chroma_client.get_collection(name + SHADOW_SUFFIX)
+                   for name in COLLECTION_NAMES if name + SHADOW_SUFFIX in names}
+        self._rename_shadows(shadows)
+        self._clear_reindex_checkpoint()
+
+    @staticmethod
+    def _lexical_text(collection_name: str, document: str) -> str:
+        # Question/SQL pairs are stored as JSON; index their text, not the keys
+        if collection_name == "sql":
+            try:
+                pair = json.loads(document)
+                return f"{pair.get('question', '')}\n{pair.get('sql', '')}"
+            except (ValueError, AttributeError):
+                pass
+        return document
+
+    def _load_lexical_index(self, collection):
+        index = self.lexical_indexes[collection.name]
+        index.clear()
+        for data in self.iter_collection(collection):
+            for id, document in zip(data["ids"], data["documents"]):
+                index.add(id, document, text=self._lexical_text(collection.name, document))
+
+    def _index_document(self, collection_name: str, id: str, document: str):
+        self.lexical_indexes[collection_name].add(id, document, text=self._lexical_text(collection_name, document))
+        self._schema_changed(collection_name)
+
+    def _schema_changed(self, collection_name: str):
+        if collection_name in ("ddl", "documentation"):
+            self.schema_index.invalidate()
+
+    def query_embedding(self, question: str) -> List[float]:
+        """
+        Embedding of a retrieval question, cached for the last few questions.
+        """
+        with self._query_embeddings_lock:
+            embedding = self._query_embeddings.get(question)
+            if embedding is not None:
+                self._query_embeddings.move_to_end(question)
+                return embedding
+        # Embedded outside the lock: a slow call must not hold up the other sessions
+        embedding = self.generate_embedding(question)
+        with self._query_embeddings_lock:
+            self._query_embeddings[question] = embedding
+            self._query_embeddings.move_to_end(question)
+            while len(self._query_embeddings) > 128:
+                self._query_embeddings.popitem(last=False)
+        return embedding
+
     def generate_embedding(self, data: str, **kwargs) -> List[float]:
-        embedding = self.embedding_function([data])
+        with span("embedding"):
+            embedding = self.embedding_function([data])
         if len(embedding) == 1:
             return embedding[0]
         return embedding
 
+    def _add_document(self, collection_name: str, document: str) -> str:
+        # Known content keeps its id and vector: no embedding call, no new HNSW entry
+        id = content_id(collection_name, document)
+        with self._write_lock:
+            if id in self.lexical_indexes[collection_name].documents:
+                return id
+            dict(self._collections())[collection_name].upsert(
+                documents=document,
+                embeddings=self.generate_embedding(document),
+                ids=id,
+            )
+            self._index_document(collection_name, id, document)
+        return id
+
     def add_question_sql(self, sql: dict, **kwargs) -> str:
         try:
-            uid = sql['id']
             question = sql['question']
             sql_query = "Of course, here is your query:\n```sql" + sql['query'] + "```"
         except KeyError as e:
@@ -76,131 +399,135 @@ class ChromaDB_VectorStore():
             },
             ensure_ascii=False,
         )
-        id = str(uid) + "-sql"
-        self.sql_collection.add(
-            documents=question_sql_json,
-            embeddings=self.generate_embedding(question_sql_json),
-            ids=id,
-        )
-        # #print('adding sql',
-        #     question_sql_json,
-        #     self.generate_embedding(question_sql_json),
-        #     id,
-        # )
-
-        return id
+        return self._add_document("sql", question_sql_json)
 
     def add_ddl(self, ddl: dict, **kwargs) -> str:
         try:
-            uid = ddl['id']
             # table_name = ddl['table_name']
             ddl_statement = ddl['ddl_statement']
         except KeyError as e:
             raise ValueError(f"Missing required key in the 'sql' dictionary: {e}")
-          
-        id = str(uid) + "-ddl"
-        self.ddl_collection.add(
-            documents=ddl_statement,
-            embeddings=self.generate_embedding(ddl_statement),
-            ids=id,
-        )
-        # #print('adding ddl',
-        #     ddl_statement,
-        #     self.generate_embedding(ddl_statement),
-        #     id,
-        # )
-        return id
+        return self._add_document("ddl", ddl_statement)
 
     def add_documentation(self, docu: dict, **kwargs) -> str:
         try:
-            uid = docu['id']
             documentation = docu['documentation']
         except KeyError as e:
             raise ValueError(f"Missing required key in the 'sql' dictionary: {e}")
-        id = str(uid) + "-doc"
-        self.documentation_collection.add(
-            documents=documentation,
-            embeddings=self.generate_embedding(documentation),
-            ids=id,
-        )
-        # #print('adding documents',
-        #     documentation,
-        #     self.generate_embedding(documentation),
-        #     id
-        # )
-        return id
-
-    def get_training_data(self, **kwargs) -> pd.DataFrame:
-        sql_data = self.sql_collection.get()
-        df = pd.DataFrame()
-
-        if sql_data is not None:
-            # Extract the documents and ids
-            documents = [json.loads(doc) for doc in sql_data["documents"]]
-            ids = sql_data["ids"]
-
-            # Create a DataFrame
-            df_sql = pd.DataFrame(
-                {
-                    "id": ids,
-                    "question": [doc["question"] for doc in documents],
-                    "content": [doc["sql"] for doc in documents],
-                }
-            )
-
-            df_sql["training_data_type"] = "sql"
-            df = pd.concat([df, df_sql])
-
-        ddl_data = self.ddl_collection.get()
-        if ddl_data is not None:
-            # Extract the documents and ids
-            documents = [doc for doc in ddl_data["documents"]]
-            ids = ddl_data["ids"]
-
-            # Create a DataFrame
-            df_ddl = pd.DataFrame(
-                {
-                    "id": ids,
-                    "question": [None for doc in documents],
-                    "content": [doc for doc in documents],
-                }
-            )
-
-            df_ddl["training_data_type"] = "ddl"
-            df = pd.concat([df, df_ddl])
-
-        doc_data = self.documentation_collection.get()
-        if doc_data is not None:
-            # Extract the documents and ids
-            documents = [doc for doc in doc_data["documents"]]
-            ids = doc_data["ids"]
-
-            # Create a DataFrame
-            df_doc = pd.DataFrame(
-                {
-                    "id": ids,
-                    "question": [None for doc in documents],
-                    "content": [doc for doc in documents],
-                }
-            )
-
-            df_doc["training_data_type"] = "documentation"
-            df = pd.concat([df, df_doc])
-
-        return df
+        return self._add_document("documentation", documentation)
+
+    def _collections(self) -> list:
+        # Collection names double as training data types, in the order training data is listed
+        return [("sql", self.sql_collection), ("ddl", self.ddl_collection),
+                ("documentation", self.documentation_collection)]
+
+    def _training_records(self, collection_name: str, data: dict) -> list:
+        records = []
+        for id, document in zip(data["ids"], data["documents"]):
+            question = None
+            content = document
+            if collection_name == "sql":
+                try:
+                    pair = json.loads(document)
+                    question, content = pair["question"], pair["sql"]
+                except (ValueError, KeyError, TypeError):
+                    pass
+            records.append({"id": id, "question": question, "content": content,
+                            "training_data_type": collection_name})
+        return records
+
+    def count_training_data(self) -> int:
+        return sum(collection.count() for _, collection in self._collections())
+
+    def iter_collection(self, collection, batch_size: int = 1000, include: list = None):
+        """
+        Page through a collection with `get(limit, offset)`, yielding one
+        Chroma result dict per batch, so large stores are never loaded at once.
+        """
+        include = include or ["documents"]
+        offset = 0
+        while True:
+            data = collection.get(limit=batch_size, offset=offset, include=include)
+            if not data["ids"]:
+                return
+            yield data
+            offset += len(data["ids"])
+
+    def iter_training_data(self, batch_size: int = 1000, include_embeddings: bool = False):
+        """
+        Stream every training item as a dict with id, question, content,
+        training_data_type and the raw stored `document`; with
+        `include_embeddings` also its stored `embedding` and `embedding_model`.
+        """
+        include = ["documents", "embeddings"] if include_embeddings else ["documents"]
+        for name, collection in self._collections():
+            model = (collection.metadata or {}).get("embedding_model", self.embedding_model)
+            for data in self.iter_collection(collection, batch_size=batch_size, include=include):
+                records = self._training_records(name, data)
+                for i, record in enumerate(records):
+                    record["document"] = data["documents"][i]
+                    if include_embeddings:
+                        record["embedding"] = [float(x) for x in data["embeddings"][i]]
+                        record["embedding_model"] = model
+                    yield record
+
+    def get_training_data(self, limit: int = None, offset: int = 0, **kwargs) -> "pd.DataFrame":
+        """
+        Training items of all collections (sql, then ddl, then documentation).
+        `limit` and `offset` select one page without reading the others.
+        """
+        records = []
+        for name, collection in self._collections():
+            if limit is not None and len(records) >= limit:
+                break
+            count = collection.count()
+            if offset >= count:
+                offset -= count
+                continue
+            take = count - offset if limit is None else min(limit - len(records), count - offset)
+            data = collection.get(limit=take, offset=offset, include=["documents"])
+            records.extend(self._training_records(name, data))
+            offset = 0
+
+        import pandas as pd  # only the training data view needs it
+
+        return pd.DataFrame(records, columns=["id", "question", "content", "training_data_type"])
+
+    def bulk_add(self, collection_name: str, ids: list, documents: list, embeddings: list = None) -> int:
+        """
+        Upsert a batch of raw documents into a collection. Documents are embedded
+        in one batched call unless their `embeddings` are supplied.
+        """
+        if not ids:
+            return 0
+        with self._write_lock:
+            collection = dict(self._collections())[collection_name]
+            if embeddings is None:
+                with span("embedding", texts=len(documents)):
+                    embeddings = self.embedding_function(documents)
+            collection.upsert(ids=ids, documents=documents, embeddings=embeddings)
+            for id, document in zip(ids, documents):
+                self._index_document(collection_name, id, document)
+        return len(ids)
 
     def remove_training_data(self, id: str, **kwargs) -> bool:
-        if id.endswith("-sql"):
-            self.sql_collection.delete(ids=id)
-            return True
-        elif id.endswith("-ddl"):
-            self.ddl_collection.delete(ids=id)
-            return True
-        elif id.endswith("-doc"):
-            self.documentation_collection.delete(ids=id)
-            return True
-        else:
-            return False
+        with self._write_lock:
+            if id.endswith("-sql"):
+                self.sql_collection.delete(ids=id)
+                self.lexical_indexes["sql"].remove(id)
+                return True
+            elif id.endswith("-ddl"):
+                self.ddl_collection.delete(ids=id)
+                self.lexical_indexes["ddl"].remove(id)
+                self._schema_changed("ddl")
+                return True
+            elif id.endswith("-doc"):
+                self.documentation_collection.delete(ids=id)
+                self.lexical_indexes["documentation"].remove(id)
+                self._schema_changed("documentation")
+                return True
+            else:
+                return False
 
     def remove_collection(self, collection_name: str) -> bool:
         """
@@ -212,26 +539,26 @@ class ChromaDB_VectorStore():
         Returns:
             bool: True if collection is deleted, False otherwise
         """
-        if collection_name == "sql":
-            self.chroma_client.delete_collection(name="sql")
-            self.sql_collection = self.chroma_client.get_or_create_collection(
-                name="sql", embedding_function=self.embedding_function
-            )
-            return True
-        elif collection_name == "ddl":
-            self.chroma_client.delete_collection(name="ddl")
-            self.ddl_collection = self.chroma_client.get_or_create_collection(
-                name="ddl", embedding_function=self.embedding_function
-            )
-            return True
-        elif collection_name == "documentation":
-            self.chroma_client.delete_collection(name="documentation")
-            self.documentation_collection = self.chroma_client.get_or_create_collection(
-                name="documentation", embedding_function=self.embedding_function
-            )
-            return True
-        else:
-            return False
+        with self._write_lock:
+            if collection_name == "sql":
+                self.chroma_client.delete_collection(name="sql")
+                self.sql_collection = self._get_or_create_collection("sql")
+                self.lexical_indexes["sql"].clear()
+                return True
+            elif collection_name == "ddl":
+                self.chroma_client.delete_collection(name="ddl")
+                self.ddl_collection = self._get_or_create_collection("ddl")
+                self.lexical_indexes["ddl"].clear()
+                self._schema_changed("ddl")
+                return True
+            elif collection_name == "documentation":
+                self.chroma_client.delete_collection(name="documentation")
+                self.documentation_collection = self._get_or_create_collection("documentation")
+                self.lexical_indexes["documentation"].clear()
+                self._schema_changed("documentation")
+                return True
+            else:
+                return False
 
     @staticmethod
     def _extract_documents(query_results) -> list:
@@ -259,27 +586,177 @@ class ChromaDB_VectorStore():
 
             return documents
 
-    def get_similar_question_sql(self, question: str, **kwargs) -> list:
-        return ChromaDB_VectorStore._extract_documents(
-            self.sql_collection.query(
-                query_texts=[question],
-                n_results=self.n_results,
-            )
-        )
+    def _candidates(self, collection, question: str, embedding: List[float], fetch_k: int):
+        """
+        Candidate ids for a question, best first, with their relevance in [0, 1]
+        and the question embedding if one was needed.
+
+        - If the best BM25 hit covers at least `lexical_fastpath_threshold` of
+          the question's terms, the lexical ranking is used on its own and the
+          question is never embedded, whatever the size of the collection.
+        - Collections no larger than `fetch_k` are taken whole, since a vector
+          search could not leave anything out: the question is embedded and
+          the stored vectors are scored locally, fused with the BM25 ranking.
+        - Otherwise the BM25 and vector rankings are merged with reciprocal
+          rank fusion.
+
+        While the stored vectors cannot be searched (see `_detect_model_change`)
+        only the lexical ranking is used.
+        """
+        index = self.lexical_indexes[collection.name]
+        lexical = index.search(question, k=fetch_k) if self.hybrid_search or not self.vector_search else []
+        lexical_ids = [id for id, _ in lexical]
+
+        if not self.vector_search:
+            # Stored vectors of an unknown model: lexical ranking until the re-index swap
+            top = lexical[0][1] if lexical else 1.0
+            return "lexical", lexical_ids, [score / top for _, score in lexical], None
+
+        if lexical and index.coverage(question, lexical_ids[0]) >= self.lexical_fastpath_threshold:
+            top = lexical[0][1]
+            return "lexical", lexical_ids, [score / top for _, score in lexical], embedding
+
+        if self.hybrid_search and len(index) <= fetch_k:
+            # Every stored vector is scored locally, so the distance cutoff applies to small collections too
+            if embedding is None:
+                embedding = self.query_embedding(question)
+            stored = collection.get(include=["embeddings"])
+            vector_ids = []
+            if len(stored["ids"]):
+                distances = cosine_distances(embedding, np.asarray(stored["embeddings"], dtype=np.float32))
+                vector_ids = [stored["ids"][i] for i in np.argsort(distances, kind="stable")]
+            ranked = reciprocal_rank_fusion([vector_ids, lexical_ids], k=self.rrf_k) if lexical_ids else vector_ids
+            ids = ranked + [id for id in index.documents if id not in set(ranked)]
+            return "all", ids, [1.0 / (rank + 1) for rank in range(len(ids))], embedding
+
+        if embedding is None:
+            embedding = self.query_embedding(question)
+        results = collection.query(query_embeddings=[embedding], n_results=fetch_k, include=["distances"])
+        vector_ids = results["ids"][0]
+        if not lexical:
+            return "vector", vector_ids, [1 - d for d in results["distances"][0]], embedding
+
+        fused = reciprocal_rank_fusion([vector_ids, lexical_ids], k=self.rrf_k)[:fetch_k]
+        return "hybrid", fused, [1.0 / (rank + 1) for rank in range(len(fused))], embedding
+
+    def _query(self, collection, question: str, embedding: List[float] = None, n_results: int = 10) -> dict:
+        """
+        Adaptive-k retrieval from one collection.
 
-    def get_related_ddl(self, question: str, **kwargs) -> list:
-        return ChromaDB_VectorStore._extract_documents(
-            self.ddl_collection.query(
-                query_texts=[question],
-            )
-        )
+        Up to twice `n_results` candidates are gathered (see `_candidates`),
+        candidates beyond the collection's cosine `max_distance` are dropped,
+        maximal marginal relevance removes near-duplicates, and the result is
+        cut to the collection's `token_budget`. The question embedding is
+        computed lazily and shared by all collections; pass `embedding` to
+        supply a precomputed one.
+
+        Returns:
+            dict: Chroma-style {"ids": [[...]], "documents": [[...]], "distances": [[...]]};
+            distances are None where the question was not embedded.
+        """
+        self._index_lock.acquire_read()
+        try:
+            # The live collection of that name: a re-index may have swapped it since the call
+            collection = dict(self._collections())[collection.name]
+            return self._query_collection(collection, question, embedding, n_results)
+        finally:
+            self._index_lock.release_read()
+
+    def _query_collection(self, collection, question: str, embedding: List[float], n_results: int) -> dict:
+        settings = self.retrieval[collection.name]
+        index = self.lexical_indexes[collection.name]
+        with span(f"chroma.query.{collection.name}") as attrs:
+            path, ids, relevance, embedding = self._candidates(collection, question, embedding, n_results * 2)
+            attrs["path"] = path
+            attrs["candidates"] = len(ids)
+
+            # Stored vectors of the candidates: a local read, never an embedding call
+            vectors = None
+            needs_vectors = (settings["mmr_lambda"] is not None or settings["dedup_similarity"] is not None
+                             or (embedding is not None and settings["max_distance"] is not None))
+            if ids and needs_vectors:
+                stored = collection.get(ids=ids, include=["embeddings"])
+                by_id = dict(zip(stored["ids"], stored["embeddings"]))
+                keep = [i for i, id in enumerate(ids) if id in by_id]
+                ids = [ids[i] for i in keep]
+                relevance = [relevance[i] for i in keep]
+                vectors = np.asarray([by_id[id] for id in ids], dtype=np.float32) if ids else None
+
+            distances = [None] * len(ids)
+            if embedding is not None and vectors is not None:
+                distances = cosine_distances(embedding, vectors).tolist()
+                # Lexical fast-path hits match the question's terms; their documents
+                # (question plus SQL) can still sit far from it in embedding space
+                if settings["max_distance"] is not None and path != "lexical":
+                    keep = [i for i, d in enumerate(distances)
+                            if d <= settings["max_distance"] or i < settings["min_results"]]
+                    ids = [ids[i] for i in keep]
+                    relevance = [relevance[i] for i in keep]
+                    distances = [distances[i] for i in keep]
+                    vectors = vectors[keep] if keep else None
+
+            selected = mmr_select(relevance, vectors, n_results,
+                                  lambda_=settings["mmr_lambda"], dedup_similarity=settings["dedup_similarity"])
+            documents = [index.documents.get(ids[i]) for i in selected]
+            missing = [ids[i] for i, doc in zip(selected, documents) if doc is None]
+            if missing:
+                fetched = collection.get(ids=missing, include=["documents"])
+                lookup = dict(zip(fetched["ids"], fetched["documents"]))
+                documents = [doc if doc is not None else lookup.get(ids[i], "") for i, doc in zip(selected, documents)]
+            count = apply_token_budget(documents, settings["token_budget"], settings["min_results"])
+            selected = selected[:count]
+            attrs["returned"] = count
+            return {
+                "ids": [[ids[i] for i in selected]],
+                "documents": [documents[:count]],
+                "distances": [[distances[i] for i in selected]],
+            }
+
+    @staticmethod
+    def _with_distances(query_results: dict) -> list:
+        documents = ChromaDB_VectorStore._extract_documents(query_results) or []
+        return list(zip(documents, query_results["distances"][0]))
+
+    def get_similar_question_sql(self, question: str, embedding: List[float] = None,
+                                 include_distances: bool = False, **kwargs) -> list:
+        results = self._query(self.sql_collection, question, embedding, n_results=self.n_results)
+        if include_distances:
+            return self._with_distances(results)
+        return ChromaDB_VectorStore._extract_documents(results)
+
+    def get_related_ddl(self, question: str, embedding: List[float] = None,
+                        include_distances: bool = False, **kwargs) -> list:
+        results = self._query(self.ddl_collection, question, embedding, n_results=self.n_results)
+        if include_distances:
+            return self._with_distances(results)
+        return ChromaDB_VectorStore._extract_documents(results)
+
+    def get_related_schema(self, question: str, embedding: List[float] = None,
+                           columns: Iterable[Tuple[str, str]] = (), **kwargs) -> list:
+        """
+        CREATE TABLE statements of the trained tables, pruned for wide schemas
+        to the columns relevant to `question` (and the `(table, column)` pairs
+        in `columns`) and the keys joining them. Falls back to whole DDL
+        documents when no trained DDL has a CREATE TABLE statement.
+        """
+        with span("retrieval.schema") as attrs:
+            if self.schema_index.stale:
+                with self._write_lock:
+                    if self.schema_index.stale:
+                        self.schema_index.build(self.lexical_indexes["ddl"].documents.values(),
+                                                self.lexical_indexes["documentation"].documents.values())
+            attrs["columns"] = len(self.schema_index)
+            if not len(self.schema_index):
+                return self.get_related_ddl(question, embedding)
+            return self.schema_index.related(question, columns=columns, **self.retrieval["schema"])
+
+    def get_related_documentation(self, question: str, embedding: List[float] = None,
+                                  include_distances: bool = False, **kwargs) -> list:
+        results = self._query(self.documentation_collection, question, embedding, n_results=self.n_results)
+        if include_distances:
+            return self._with_distances(results)
+        return ChromaDB_VectorStore._extract_documents(results)
 
-    def get_related_documentation(self, question: str, **kwargs) -> list:
-        return ChromaDB_VectorStore._extract_documents(
-            self.documentation_collection.query(
-                query_texts=[question],
-            )
-        )
     def train(
         self,
         sql: dict = None,
@@ -0,0 +1,131 @@
+"""
+One-off compaction of vector stores trained before ids were content hashes.
+
+Each store is rewritten into a fresh directory keeping one item per distinct
+document, re-keyed with `content_id` and carrying its stored vector (nothing
+is re-embedded), and the new directory then replaces the old one. Rewriting
+instead of deleting in place matters: Chroma only marks deleted vectors in
+the HNSW files and keeps every write in its queue table, so deletes alone do
+not give any space back.
+
+Run it while no app process or store server has the stores open:
+
+    python -m chroma_db.dedup --db-path ./data/db_data/
+"""
+import argparse
+import os
+import shutil
+
+import chromadb
+from chromadb.config import Settings
+
+from chroma_db.chroma_vector import COLLECTION_NAMES, REINDEX_CHECKPOINT, close_chroma_client, content_id
+from chroma_db.registry import StoreRegistry
+
+
+def directory_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+
+def dedupe_store(path: str, batch_size: int = 1000, dry_run: bool = False) -> dict:
+    """
+    Compact the store at `path`, dropping items whose document is already stored.
+
+    Returns:
+        dict: Items before and after, vectors reclaimed and bytes before and after.
+    """
+    if os.path.exists(os.path.join(path, REINDEX_CHECKPOINT)):
+        raise ValueError(f"A re-index of {path} is in progress; open the store to let it finish first.")
+    report = {"items_before": 0, "items_after": 0, "bytes_before": directory_size(path)}
+    source = chromadb.PersistentClient(path=path, settings=Settings(anonymized_telemetry=False))
+    target_path = path.rstrip(os.sep) + ".compact"
+    shutil.rmtree(target_path, ignore_errors=True)
+    target = None if dry_run else chromadb.PersistentClient(
+        path=target_path, settings=Settings(anonymized_telemetry=False))
+    try:
+        for collection in source.list_collections():
+            if collection.name not in COLLECTION_NAMES:
+                continue
+            copy = None if dry_run else target.create_collection(
+                name=collection.name, metadata=collection.metadata, embedding_function=None)
+            seen = set()
+            offset = 0
+            while True:
+                data = collection.get(limit=batch_size, offset=offset, include=["documents", "embeddings"])
+                if not data["ids"]:
+                    break
+                offset += len(data["ids"])
+                ids, documents, embeddings = [], [], []
+                for document, embedding in zip(data["documents"], data["embeddings"]):
+                    id = content_id(collection.name, document)
+                    if id in seen:
+                        continue
+                    seen.add(id)
+                    ids.append(id)
+                    documents.append(document)
+                    embeddings.append(embedding)
+                if ids and copy is not None:
+                    copy.add(ids=ids, documents=documents, embeddings=embeddings)
+            report["items_before"] += offset
+            report["items_after"] += len(seen)
+    finally:
+        close_chroma_client(source)
+        if target is not None:
+            close_chroma_client(target)
+
+    report["vectors_reclaimed"] = report["items_before"] - report["items_after"]
+    if dry_run:
+        return report
+    retired = path.rstrip(os.sep) + ".old"
+    os.rename(path, retired)
+    os.rename(target_path, path)
+    shutil.rmtree(retired)
+    report["bytes_after"] = directory_size(path)
+    return report
+
+
+def dedupe_all(db_path: str = './data/db_data/', batch_size: int = 1000, dry_run: bool = False) -> dict:
+    """
+    Compact every store in the registry under `db_path`.
+
+    Returns:
+        dict: Per-store reports keyed by store name.
+    """
+    registry = StoreRegistry(db_path)
+    reports = {}
+    for entry in registry.list_stores():
+        path = registry.path(entry["name"])
+        if not os.path.isdir(path):
+            continue
+        reports[entry["name"]] = report = dedupe_store(path, batch_size=batch_size, dry_run=dry_run)
+        if not dry_run:
+            registry.touch(entry["name"], items=report["items_after"])
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remove duplicate training items from the vector stores.")
+    parser.add_argument("--db-path", default="./data/db_data/")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="Only count the duplicates.")
+    args = parser.parse_args()
+
+    reports = dedupe_all(args.db_path, batch_size=args.batch_size, dry_run=args.dry_run)
+    totals = {"vectors_reclaimed": 0, "bytes_reclaimed": 0}
+    for name, report in reports.items():
+        totals["vectors_reclaimed"] += report["vectors_reclaimed"]
+        line = f"{name}: {report['items_before']} -> {report['items_after']} items, {report['vectors_reclaimed']} vectors"
+        if not args.dry_run:
+            reclaimed = report["bytes_before"] - report["bytes_after"]
+            totals["bytes_reclaimed"] += reclaimed
+            line += f" and {reclaimed / 1e6:.1f} MB"
+        print(line + " reclaimed")
+    if args.dry_run:
+        print(f"Total: {totals['vectors_reclaimed']} duplicate vectors (dry run, nothing changed)")
+    else:
+        print(f"Total: {totals['vectors_reclaimed']} vectors and {totals['bytes_reclaimed'] / 1e6:.1f} MB reclaimed")
+
+
+if __name__ == "__main__":
+    main()
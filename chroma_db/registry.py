@@ -0,0 +1,223 @@
+"""
+Registry of vector stores bound to uploaded databases.
+
+A small SQLite manifest in the store directory records every vector store
+(name, path, embedding model, item count, last use) and which database
+fingerprint it is bound to, so each uploaded dataset gets its own trained
+store back. `StoreCache` keeps the opened stores of this process and evicts
+the ones nobody used for a while.
+"""
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional
+
+MANIFEST_NAME = "manifest.sqlite"
+
+
+class StoreRegistry:
+    def __init__(self, db_path: str = './data/db_data/'):
+        self.db_path = db_path
+        os.makedirs(db_path, exist_ok=True)
+        self.manifest_path = os.path.join(db_path, MANIFEST_NAME)
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS stores (
+                    name TEXT PRIMARY KEY,
+                    fingerprint TEXT UNIQUE,
+                    embedding_model TEXT,
+                    items INTEGER DEFAULT 0,
+                    created_at REAL,
+                    last_used_at REAL
+                );
+            """)
+        self._adopt_existing_folders()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.manifest_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _adopt_existing_folders(self):
+        # Stores created before the manifest existed are registered unbound
+        folders = [d for d in os.listdir(self.db_path) if os.path.isdir(os.path.join(self.db_path, d))]
+        with self._connect() as conn:
+            known = {row["name"] for row in conn.execute("SELECT name FROM stores")}
+            for folder in folders:
+                if folder not in known:
+                    mtime = os.path.getmtime(os.path.join(self.db_path, folder))
+                    conn.execute("INSERT OR IGNORE INTO stores (name, created_at, last_used_at) VALUES (?, ?, ?)",
+                                 (folder, mtime, mtime))
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.db_path, name)
+
+    def get(self, name: str) -> Optional[dict]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM stores WHERE name = ?", (name,)).fetchone()
+        return dict(row) if row else None
+
+    def list_stores(self) -> list:
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute("SELECT * FROM stores ORDER BY last_used_at DESC")]
+
+    @staticmethod
+    def _insert(conn, fingerprint: str = None, embedding_model: str = None) -> str:
+        name = 'chroma_database_' + str(uuid.uuid4())
+        now = time.time()
+        conn.execute(
+            "INSERT INTO stores (name, fingerprint, embedding_model, created_at, last_used_at) VALUES (?, ?, ?, ?, ?)",
+            (name, fingerprint, embedding_model, now, now),
+        )
+        return name
+
+    def create(self, fingerprint: str = None, embedding_model: str = None) -> dict:
+        with self._connect() as conn:
+            name = self._insert(conn, fingerprint=fingerprint, embedding_model=embedding_model)
+        # The folder only once the row is committed, so a failed insert leaves nothing behind
+        os.makedirs(self.path(name), exist_ok=True)
+        return self.get(name)
+
+    def resolve(self, fingerprint: str = None, embedding_model: str = None) -> dict:
+        """
+        Return the store for a database fingerprint, creating one if needed.
+
+        - A fingerprint already bound returns its store.
+        - A new fingerprint claims the most recently used unbound store (so
+          training done before the database was uploaded is kept), or gets a
+          new store.
+        - Without a fingerprint the most recently used store is returned.
+
+        Lookup and creation run in one write transaction, so concurrent
+        sessions resolving the same new fingerprint get the same store.
+        """
+        created = False
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if fingerprint:
+                row = conn.execute("SELECT name FROM stores WHERE fingerprint = ?", (fingerprint,)).fetchone()
+                if row is None:
+                    row = conn.execute("SELECT name FROM stores WHERE fingerprint IS NULL "
+                                       "ORDER BY last_used_at DESC LIMIT 1").fetchone()
+                    if row is not None:
+                        conn.execute("UPDATE stores SET fingerprint = ? WHERE name = ?", (fingerprint, row["name"]))
+            else:
+                row = conn.execute("SELECT name FROM stores ORDER BY last_used_at DESC LIMIT 1").fetchone()
+            if row is None:
+                name = self._insert(conn, fingerprint=fingerprint, embedding_model=embedding_model)
+                created = True
+            else:
+                name = row["name"]
+        if created:
+            os.makedirs(self.path(name), exist_ok=True)
+        else:
+            self.touch(name, embedding_model=embedding_model)
+        return self.get(name)
+
+    def touch(self, name: str, items: int = None, embedding_model: str = None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE stores SET last_used_at = ?, items = COALESCE(?, items), "
+                "embedding_model = COALESCE(?, embedding_model) WHERE name = ?",
+                (time.time(), items, embedding_model, name),
+            )
+
+    def remove(self, name: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM stores WHERE name = ?", (name,))
+
+
+class StoreCache:
+    """
+    Vector stores opened by this process, shared by all sessions.
+
+    Stores are opened lazily on first use. Stores idle for longer than
+    `idle_seconds`, and the least recently used ones beyond `max_open`, are
+    closed to free their HNSW indexes, but only once nobody may still be using
+    them: a store is leased to its caller for `lease_seconds` after every
+    `get` (sessions get their store again on every rerun), and for as long as
+    a `lease` block runs. While every store is leased, more than `max_open`
+    stay open.
+    """
+    def __init__(self, max_open: int = 4, idle_seconds: float = 900, lease_seconds: float = 600):
+        self.max_open = max_open
+        self.idle_seconds = idle_seconds
+        self.lease_seconds = lease_seconds
+        self._stores = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _config_key(config: dict) -> tuple:
+        return tuple(sorted((k, str(v)) for k, v in config.items() if k != "path"))
+
+    def get(self, name: str, path: str, config: dict, factory):
+        """
+        Return the open store `name`, opening it with `factory(config)` if needed.
+        A store opened with a different config is closed and reopened.
+        """
+        with self._lock:
+            return self._get(name, path, config, factory)["store"]
+
+    @contextmanager
+    def lease(self, name: str, path: str, config: dict, factory):
+        """`get` for a long task: the store is not evicted before the block ends."""
+        with self._lock:
+            entry = self._get(name, path, config, factory)
+            entry["leases"] += 1
+        try:
+            yield entry["store"]
+        finally:
+            with self._lock:
+                entry["leases"] -= 1
+                entry["last_used"] = time.time()
+
+    def _get(self, name: str, path: str, config: dict, factory) -> dict:
+        config_key = self._config_key(config)
+        self._evict_idle()
+        entry = self._stores.get(name)
+        if entry is not None and entry["config"] != config_key:
+            self._close(self._stores.pop(name)["store"])
+            entry = None
+        if entry is None:
+            entry = self._stores[name] = {"store": factory({**config, 'path': path}), "config": config_key,
+                                          "leases": 0}
+        entry["last_used"] = time.time()
+        self._stores.move_to_end(name)
+        # Least recently used first, skipping the ones still leased
+        now = time.time()
+        for key in [k for k, e in self._stores.items() if self._released(e, now, self.lease_seconds)]:
+            if len(self._stores) <= self.max_open:
+                break
+            self._close(self._stores.pop(key)["store"])
+        return entry
+
+    def evict(self, name: str):
+        with self._lock:
+            entry = self._stores.pop(name, None)
+            if entry is not None:
+                self._close(entry["store"])
+
+    @staticmethod
+    def _released(entry: dict, now: float, seconds: float) -> bool:
+        return not entry["leases"] and now - entry["last_used"] > seconds
+
+    def _evict_idle(self):
+        now = time.time()
+        idle = max(self.idle_seconds, self.lease_seconds)
+        for key in [k for k, e in self._stores.items() if self._released(e, now, idle)]:
+            self._close(self._stores.pop(key)["store"])
+
+    @staticmethod
+    def _close(store):
+        close = getattr(store, "close", None)
+        if close is not None:
+            close()
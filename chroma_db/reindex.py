@@ -0,0 +1,109 @@
+"""
+Background re-embedding of a vector store after the embedding model changed.
+
+Every collection records the model that produced its vectors. When a store is
+opened with another configured model, it keeps answering from its current
+collections (see `ChromaDB_VectorStore._detect_model_change`) while
+`reindex_store` rebuilds them into shadow collections:
+
+1. items are read page by page and re-embedded in batches with the new model,
+   and the position is checkpointed after every batch, so an interrupted
+   re-index resumes where it stopped;
+2. writes made meanwhile are caught up by comparing ids and documents, the
+   last time while training writes are held;
+3. the shadows replace the live collections in one swap, after which the
+   store embeds with the new model.
+
+It runs as a "reindex" background job (see `module.jobs`), one per store.
+"""
+import time
+from typing import Callable, Optional
+
+from module.tracing import span
+
+
+def _documents(collection, batch_size: int) -> dict:
+    # id -> document of a whole collection, read page by page
+    documents = {}
+    offset = 0
+    while True:
+        data = collection.get(limit=batch_size, offset=offset, include=["documents"])
+        if not data["ids"]:
+            return documents
+        documents.update(zip(data["ids"], data["documents"]))
+        offset += len(data["ids"])
+
+
+def _embed_into(db, shadow, ids: list, documents: list):
+    with span("embedding", texts=len(documents), model=db.pending_provider.model_name):
+        embeddings = db.pending_provider.generate_embeddings(documents)
+    shadow.upsert(ids=ids, documents=documents, embeddings=embeddings)
+
+
+def _catch_up(db, name: str, shadow, batch_size: int) -> int:
+    """
+    Make `shadow` hold exactly the items of the live collection `name`.
+    Returns the number of items changed.
+    """
+    live = _documents(dict(db._collections())[name], batch_size)
+    copied = _documents(shadow, batch_size)
+    stale = [id for id, document in live.items() if copied.get(id) != document]
+    removed = [id for id in copied if id not in live]
+    for start in range(0, len(stale), batch_size):
+        ids = stale[start:start + batch_size]
+        _embed_into(db, shadow, ids, [live[id] for id in ids])
+    if removed:
+        shadow.delete(ids=removed)
+    return len(stale) + len(removed)
+
+
+def reindex_store(db, batch_size: int = 256, progress: Optional[Callable[[int, int], None]] = None) -> dict:
+    """
+    Rebuild every collection of `db` with its pending embedding model and
+    swap the rebuilt collections in.
+
+    Stops early, keeping its checkpoint, when the store is closed or when
+    `progress(done, total)` raises (e.g. a cancelled job).
+
+    Returns:
+        dict: "status" ("done", "stopped" or "up to date"), items embedded and seconds.
+    """
+    if not db.reindex_required:
+        return {"status": "up to date", "items": 0, "seconds": 0.0}
+    start = time.perf_counter()
+    checkpoint = db.load_reindex_checkpoint()
+    total = db.count_training_data()
+    embedded = 0
+    shadows = {}
+
+    for name, collection in db._collections():
+        state = checkpoint["collections"][name]
+        # A shadow without checkpointed progress may hold items of an abandoned run
+        shadows[name] = db.shadow_collection(name, fresh=state["offset"] == 0 and not state["done"])
+        while not state["done"]:
+            if db.closed.is_set():
+                return {"status": "stopped", "items": embedded, "seconds": time.perf_counter() - start}
+            data = collection.get(limit=batch_size, offset=state["offset"], include=["documents"])
+            if not data["ids"]:
+                state["done"] = True
+            else:
+                with span("reindex.batch", collection=name, items=len(data["ids"])):
+                    _embed_into(db, shadows[name], data["ids"], data["documents"])
+                state["offset"] += len(data["ids"])
+                embedded += len(data["ids"])
+            db.save_reindex_checkpoint(checkpoint)
+            if progress is not None:
+                progress(sum(s["offset"] for s in checkpoint["collections"].values()), total)
+
+    # Most writes made during the rebuild are copied without blocking training...
+    for name, shadow in shadows.items():
+        embedded += _catch_up(db, name, shadow, batch_size)
+    # ...and the rest while writes wait for the swap
+    with db._write_lock:
+        if db.closed.is_set():
+            return {"status": "stopped", "items": embedded, "seconds": time.perf_counter() - start}
+        for name, shadow in shadows.items():
+            embedded += _catch_up(db, name, shadow, batch_size)
+        with span("reindex.swap"):
+            db.swap_collections(shadows)
+    return {"status": "done", "items": embedded, "seconds": time.perf_counter() - start}
@@ -0,0 +1,110 @@
+from typing import List, Optional
+
+import numpy as np
+
+# Per-collection retrieval settings; override any of them through config["retrieval"]
+DEFAULT_RETRIEVAL = {
+    "sql": {
+        "max_distance": 0.5,        # cosine distance above which an example is not relevant
+        "mmr_lambda": 0.7,          # relevance vs. diversity trade-off, None disables MMR
+        "dedup_similarity": 0.95,   # candidates this similar to an already selected one are dropped
+        "token_budget": 3000,       # approximate tokens of examples pasted into the prompt
+        "min_results": 0,
+    },
+    "ddl": {
+        # Every relevant table definition is needed to write valid SQL, so no diversity pruning
+        "max_distance": None,
+        "mmr_lambda": None,
+        "dedup_similarity": None,
+        "token_budget": 10000,
+        "min_results": 1,
+    },
+    "documentation": {
+        "max_distance": 0.6,
+        "mmr_lambda": 0.7,
+        "dedup_similarity": 0.95,
+        "token_budget": 3000,
+        "min_results": 0,
+    },
+    "schema": {
+        # Column-level pruning of the trained tables (chroma_db.schema_index), only
+        # for schemas wider than max_columns or longer than token_budget
+        "max_columns": 40,          # best matching columns across all tables
+        "token_budget": 4000,       # approximate tokens of a schema pasted whole
+        "table_columns": 10,        # columns shown for a table named without matching columns
+        "min_relative_score": 0.2,  # columns scoring below this share of the best one are dropped
+    },
+}
+
+
+def retrieval_settings(config: Optional[dict]) -> dict:
+    overrides = (config or {}).get("retrieval") or {}
+    return {name: {**defaults, **overrides.get(name, {})} for name, defaults in DEFAULT_RETRIEVAL.items()}
+
+
+def approx_token_count(text: str) -> float:
+    # Same 4 characters per token estimate as the prompt builder
+    return len(text) / 4
+
+
+def cosine_distances(query: List[float], vectors: np.ndarray) -> np.ndarray:
+    query = np.asarray(query, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+    return 1 - (vectors @ query) / np.clip(norms, 1e-12, None)
+
+
+def mmr_select(relevance: List[float], vectors: Optional[np.ndarray], k: int,
+               lambda_: Optional[float] = 0.7, dedup_similarity: Optional[float] = None) -> List[int]:
+    """
+    Maximal marginal relevance over candidates ordered by relevance.
+
+    Greedily picks the candidate maximising
+    `lambda_ * relevance - (1 - lambda_) * max similarity to the picked ones`,
+    skipping candidates whose similarity to a picked one reaches
+    `dedup_similarity`. Without vectors (or with `lambda_` None) the relevance
+    order is kept and only the first `k` are returned.
+
+    Returns:
+        List[int]: Indices of the selected candidates, in selection order.
+    """
+    n = len(relevance)
+    if vectors is None or n == 0 or (lambda_ is None and dedup_similarity is None):
+        return list(range(min(k, n)))
+
+    normed = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+    similarity = normed @ normed.T
+    relevance = np.asarray(relevance, dtype=np.float32)
+    weight = 1.0 if lambda_ is None else lambda_
+
+    selected = []
+    remaining = list(range(n))
+    while remaining and len(selected) < k:
+        if selected:
+            redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining), dtype=np.float32)
+        scores = weight * relevance[remaining] - (1 - weight) * redundancy
+        best = int(np.argmax(scores))
+        candidate = remaining.pop(best)
+        if dedup_similarity is not None and selected and redundancy[best] >= dedup_similarity:
+            continue
+        selected.append(candidate)
+    return selected
+
+
+def apply_token_budget(documents: List[str], budget: Optional[float], min_results: int = 0) -> int:
+    """
+    Number of leading documents that fit in `budget` approximate tokens
+    (at least `min_results`).
+    """
+    if budget is None:
+        return len(documents)
+    used = 0.0
+    count = 0
+    for document in documents:
+        tokens = approx_token_count(document)
+        if used + tokens > budget and count >= min_results:
+            break
+        used += tokens
+        count += 1
+    return count
@@ -0,0 +1,308 @@
+"""
+Column-level index of the trained schema, for pruning the DDL pasted into the prompt.
+
+Trained DDL documents are parsed into tables and columns, and every
+`table.column` becomes one BM25 entry made of its name, type, inline comment
+and the documentation sentences that mention it. Words are matched in their
+singular form and `snake_case` names by their parts, so "patients" finds
+`patient_count`.
+
+A schema within the column and token budget (the usual single upload) is
+returned whole. For a wider one, `SchemaIndex.related` returns a pruned
+`CREATE TABLE` per relevant table holding only:
+
+- the columns the question matches (plus the first few columns of a table
+  it names without matching any of its columns),
+- the columns whose stored values the question mentions (`resolve_values`),
+- the table's primary key,
+- the join keys between the selected tables: declared foreign keys, shared
+  key columns (`*_id`, `*_key`, `*_code`), and a bridge table when two
+  selected tables only join through a third one.
+
+So the prompt grows with the number of things a question asks about instead of
+with the width of the schema. DDL documents without a `CREATE TABLE` are not
+indexed; a store with no parseable table falls back to whole-document retrieval.
+"""
+import re
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+from chroma_db.bm25 import BM25Index
+
+_CREATE_TABLE_RE = re.compile(
+    r"CREATE\s+(?:TEMP(?:ORARY)?\s+)?TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?((?:[\"`\[]?[\w ]+?[\"`\]]?\.)?[\"`\[]?\w[\w ]*?[\"`\]]?)\s*\(",
+    re.IGNORECASE)
+_CONSTRAINT_RE = re.compile(r"^(CONSTRAINT|PRIMARY\s+KEY|FOREIGN\s+KEY|UNIQUE|CHECK)\b", re.IGNORECASE)
+_FOREIGN_KEY_RE = re.compile(r"FOREIGN\s+KEY\s*\(([^)]*)\)\s*REFERENCES\s+([\"`\[]?[\w.]+[\"`\]]?)\s*(?:\(([^)]*)\))?",
+                             re.IGNORECASE)
+_PRIMARY_KEY_RE = re.compile(r"PRIMARY\s+KEY\s*\(([^)]*)\)", re.IGNORECASE)
+_REFERENCES_RE = re.compile(r"REFERENCES\s+([\"`\[]?[\w.]+[\"`\]]?)\s*(?:\(([^)]*)\))?", re.IGNORECASE)
+_TYPE_STOP_RE = re.compile(r"\b(NOT|NULL|PRIMARY|REFERENCES|DEFAULT|UNIQUE|CHECK|COLLATE|CONSTRAINT|GENERATED|AS)\b",
+                           re.IGNORECASE)
+_KEY_NAME_RE = re.compile(r"(^id$|_id$|id$|_key$|_code$)", re.IGNORECASE)
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def _singular(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("ches", "shes", "sses", "xes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def _normalize(text: str) -> str:
+    """Lower-cased words of `text` in singular form, `snake_case` names split into their parts."""
+    return " ".join(_singular(word) for word in re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def _unquote(name: str) -> str:
+    name = name.strip()
+    if len(name) > 1 and name[0] in "\"`[" and name[-1] in "\"`]":
+        return name[1:-1]
+    return name
+
+
+def _names(text: str) -> List[str]:
+    return [_unquote(name) for name in text.split(",") if name.strip()]
+
+
+def _split_definitions(body: str) -> List[Tuple[str, str]]:
+    """
+    Top-level comma separated parts of a CREATE TABLE body, each with the
+    `--` comments written on its lines.
+    """
+    parts = []
+    current, comment, depth, i = "", [], 0, 0
+    while i < len(body):
+        char = body[i]
+        if body.startswith("--", i):
+            end = body.find("\n", i)
+            end = len(body) if end < 0 else end
+            text = body[i + 2:end].strip()
+            # A comment after the comma belongs to the definition before it
+            if current.strip() or not parts:
+                comment.append(text)
+            else:
+                parts[-1] = (parts[-1][0], " ".join(filter(None, [parts[-1][1], text])))
+            i = end
+            continue
+        if char in "\"`[":
+            close = {"\"": "\"", "`": "`", "[": "]"}[char]
+            end = body.find(close, i + 1)
+            end = len(body) - 1 if end < 0 else end
+            current += body[i:end + 1]
+            i = end + 1
+            continue
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        if char == "," and depth == 0:
+            parts.append((current.strip(), " ".join(comment)))
+            current, comment = "", []
+        else:
+            current += char
+        i += 1
+    if current.strip():
+        parts.append((current.strip(), " ".join(comment)))
+    return parts
+
+
+def parse_tables(ddl: str) -> List[dict]:
+    """
+    Tables of the CREATE TABLE statements in `ddl`: name, columns (name, type,
+    definition, comment), primary key and foreign keys.
+    """
+    tables = []
+    for match in _CREATE_TABLE_RE.finditer(ddl):
+        depth, end = 1, match.end()
+        while end < len(ddl) and depth:
+            depth += {"(": 1, ")": -1}.get(ddl[end], 0)
+            end += 1
+        table = {"name": _unquote(match.group(1).split(".")[-1]), "columns": [], "primary_key": [],
+                 "foreign_keys": [], "constraints": []}
+        for definition, comment in _split_definitions(ddl[match.end():end - 1]):
+            if not definition:
+                continue
+            if _CONSTRAINT_RE.match(definition):
+                table["constraints"].append(definition)
+                primary = _PRIMARY_KEY_RE.search(definition)
+                if primary:
+                    table["primary_key"].extend(_names(primary.group(1)))
+                for foreign in _FOREIGN_KEY_RE.finditer(definition):
+                    for column, target in zip(_names(foreign.group(1)), _names(foreign.group(3) or "") or [None] * 99):
+                        table["foreign_keys"].append((column, _unquote(foreign.group(2)).split(".")[-1], target))
+                continue
+            name_match = re.match(r"(\"[^\"]+\"|`[^`]+`|\[[^\]]+\]|\S+)\s*(.*)", definition, re.DOTALL)
+            name, rest = _unquote(name_match.group(1)), name_match.group(2)
+            type = _TYPE_STOP_RE.split(rest, 1)[0].strip()
+            table["columns"].append({"name": name, "type": type, "definition": definition, "comment": comment})
+            if re.search(r"\bPRIMARY\s+KEY\b", rest, re.IGNORECASE):
+                table["primary_key"].append(name)
+            reference = _REFERENCES_RE.search(rest)
+            if reference:
+                targets = _names(reference.group(2) or "")
+                table["foreign_keys"].append((name, _unquote(reference.group(1)).split(".")[-1],
+                                              targets[0] if targets else None))
+        if table["columns"]:
+            tables.append(table)
+    return tables
+
+
+class SchemaIndex:
+    """
+    BM25 index over the columns of the trained tables, rebuilt lazily after
+    the DDL or documentation changed.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stale = True
+        self.tables: Dict[str, dict] = {}
+        self.columns = BM25Index()
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+    def invalidate(self):
+        self._stale = True
+
+    @property
+    def stale(self) -> bool:
+        return self._stale
+
+    def build(self, ddl_documents: Iterable[str], documentation: Iterable[str]):
+        """Re-index the tables of `ddl_documents`, documenting columns with `documentation`."""
+        with self._lock:
+            self._stale = False
+            tables = {}
+            for ddl in ddl_documents:
+                for table in parse_tables(ddl):
+                    tables[table["name"].lower()] = table  # a later definition of a table replaces it
+            sentences = [sentence.strip() for document in documentation
+                         for sentence in _SENTENCE_RE.split(document) if sentence.strip()]
+            columns = BM25Index()
+            for key, table in tables.items():
+                for column in table["columns"]:
+                    name = column["name"]
+                    # Short generic names ("id", "name") would attach every sentence
+                    mentions = [] if len(name) < 4 and "_" not in name else [
+                        sentence for sentence in sentences
+                        if re.search(rf"(?<![\w]){re.escape(name)}(?![\w])", sentence, re.IGNORECASE)]
+                    column["documentation"] = mentions
+                    text = " ".join([name, column["type"], column["comment"], *mentions])
+                    columns.add(f"{key}.{name.lower()}", name, text=_normalize(text))
+            self.tables = tables
+            self.columns = columns
+
+    def _join_keys(self, selected: List[str]) -> Dict[str, set]:
+        """Columns joining the selected tables, adding bridge tables to `selected`."""
+        def edges(a: str, b: str) -> List[Tuple[str, str]]:
+            found = []
+            for source, target in ((a, b), (b, a)):
+                for column, table, target_column in self.tables[source]["foreign_keys"]:
+                    if table.lower() == target:
+                        target_column = target_column or (self.tables[target]["primary_key"] or [column])[0]
+                        found += [(source, column), (target, target_column)]
+            names_a = {c["name"].lower(): c["name"] for c in self.tables[a]["columns"]}
+            names_b = {c["name"].lower(): c["name"] for c in self.tables[b]["columns"]}
+            primary = {name.lower() for name in self.tables[a]["primary_key"] + self.tables[b]["primary_key"]}
+            for name in names_a.keys() & names_b.keys():
+                if (_KEY_NAME_RE.search(name) and name != "id") or name in primary:
+                    found += [(a, names_a[name]), (b, names_b[name])]
+            return found
+
+        keys: Dict[str, set] = {}
+        for i, a in enumerate(list(selected)):
+            for b in list(selected)[i + 1:]:
+                found = edges(a, b)
+                if not found:
+                    for bridge in self.tables:
+                        if bridge in selected:
+                            continue
+                        via_a, via_b = edges(a, bridge), edges(bridge, b)
+                        if via_a and via_b:
+                            selected.append(bridge)
+                            found = via_a + via_b
+                            break
+                for table, column in found:
+                    keys.setdefault(table, set()).add(column.lower())
+        return keys
+
+    def related(self, question: str, max_columns: int = 40, table_columns: int = 10,
+                min_relative_score: float = 0.2, token_budget: int = 4000,
+                columns: Iterable[Tuple[str, str]] = ()) -> List[str]:
+        """
+        CREATE TABLE statements for `question`, most relevant table first.
+        Tables are pruned only when the whole schema has more than
+        `max_columns` columns or `token_budget` approximate tokens; the
+        `(table, column)` pairs in `columns` are always shown.
+        """
+        with self._lock:
+            if not self.tables:
+                return []
+            hits = self.columns.search(_normalize(question), k=max_columns)
+            top = hits[0][1] if hits else 0.0
+            matched: Dict[str, set] = {}
+            order: List[str] = []
+            for id, score in hits:
+                if score < top * min_relative_score:
+                    break
+                table, column = id.split(".", 1)
+                matched.setdefault(table, set()).add(column)
+                if table not in order:
+                    order.append(table)
+            for table, column in columns:
+                table = table.lower()
+                if table in self.tables:
+                    matched.setdefault(table, set()).add(column.lower())
+                    if table not in order:
+                        order.append(table)
+
+            full = {key: self._render(table, {c["name"].lower() for c in table["columns"]})
+                    for key, table in self.tables.items()}
+            width = sum(len(table["columns"]) for table in self.tables.values())
+            if width <= max_columns and sum(len(ddl) for ddl in full.values()) / 4 <= token_budget:
+                return [full[key] for key in order + [key for key in full if key not in order]]
+
+            # Tables the question names, and every table when it names nothing at all
+            words = set(_normalize(question).split())
+            named = [key for key in self.tables if all(part in words for part in _normalize(key).split())]
+            for key in named + ([] if order or named else list(self.tables)):
+                if key not in order:
+                    order.append(key)
+                if not matched.get(key):
+                    matched[key] = {c["name"].lower() for c in self.tables[key]["columns"][:table_columns]}
+
+            keys = self._join_keys(order)
+            statements = []
+            for key in order:
+                table = self.tables[key]
+                wanted = matched.get(key, set()) | keys.get(key, set()) | {n.lower() for n in table["primary_key"]}
+                statements.append(self._render(table, wanted))
+            return statements
+
+    @staticmethod
+    def _render(table: dict, wanted: set) -> str:
+        lines = []
+        for column in table["columns"]:
+            if column["name"].lower() not in wanted:
+                continue
+            note = column["comment"] or (column["documentation"][0] if column["documentation"] else "")
+            lines.append(f"    {column['definition']}," + (f"  -- {note[:160]}" if note else ""))
+        included = {column["name"].lower() for column in table["columns"] if column["name"].lower() in wanted}
+        for constraint in table["constraints"]:
+            # Constraints only on shown columns
+            names = {name.lower() for name in re.findall(r"\w+", constraint.split("REFERENCES")[0].split("(", 1)[-1])}
+            if names and names <= included:
+                lines.append(f"    {constraint},")
+        if lines:
+            # The trailing comma goes before the comment of the last definition
+            last, _, note = lines[-1].partition(",  -- ")
+            lines[-1] = last.rstrip(",") + (f"  -- {note}" if note else "")
+        hidden = len(table["columns"]) - len(included)
+        if hidden:
+            lines.append(f"    -- {hidden} more columns not shown")
+        return f"CREATE TABLE {table['name']} (\n" + "\n".join(lines) + "\n)"
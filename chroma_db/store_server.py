@@ -0,0 +1,372 @@
+"""
+Store server for running several app processes against one persistent store.
+
+Chroma's persistent client must not be opened by more than one process at a
+time. In multi-process deployments a single store-server process owns every
+vector store under the store directory, and the Streamlit workers talk to it
+over a local Unix socket through `StoreClient` / `RemoteVectorStore`, which
+mirror the `ChromaDB_VectorStore` methods the app uses.
+
+Each client connection is served by its own thread. Reads (retrieval, paging,
+counts) run concurrently; writes (training, removal, bulk import) take an
+exclusive lock on their store so they are applied one at a time per store.
+
+Requests are pickled, so only processes holding the server's key may connect:
+`STORE_SERVER_AUTHKEY`, or else a random key the server writes next to its
+socket (`<socket>.key`). The key file and the socket are only accessible to
+the user running the server.
+
+    python -m chroma_db.store_server --socket ./data/store.sock --db-path ./data/db_data/
+
+Workers enable it with `STORE_SERVER=./data/store.sock`.
+"""
+import argparse
+import logging
+import os
+import secrets
+import shutil
+import signal
+import threading
+from contextlib import contextmanager
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from chroma_db.locking import ReadWriteLock
+from chroma_db.registry import StoreCache, StoreRegistry
+from module.jobs import JobQueue
+from openai_llm.rate_limit import BACKGROUND, INTERACTIVE, request_priority
+
+logger = logging.getLogger(__name__)
+
+READ_METHODS = {
+    "count_training_data", "get_training_data", "get_similar_question_sql", "get_related_ddl", "get_related_schema",
+    "get_related_documentation", "generate_embedding", "query_embedding", "reindex_status",
+}
+WRITE_METHODS = {
+    "add_question_sql", "add_ddl", "add_documentation", "train", "bulk_add",
+    "remove_training_data", "remove_collection",
+}
+STREAM_METHODS = {"iter_training_data"}
+
+
+def _authkey(address: str, create: bool = False) -> bytes:
+    """
+    Key of the server at `address`: `STORE_SERVER_AUTHKEY`, or the key file
+    next to the socket, which the server creates (`create`) on first start.
+    """
+    key = os.environ.get("STORE_SERVER_AUTHKEY")
+    if key:
+        return key.encode("utf-8")
+    path = address + ".key"
+    if create:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, "w") as f:
+                f.write(secrets.token_hex(32))
+    try:
+        with open(path) as f:
+            return f.read().strip().encode("utf-8")
+    except FileNotFoundError:
+        raise RuntimeError(f"No key for the store server at {address}: "
+                           f"start the server or set STORE_SERVER_AUTHKEY") from None
+
+
+class StoreServer:
+    """
+    Owns the vector stores under `db_path` and serves them on a Unix socket.
+
+    Requests are tuples `(op, store_name, method, args, kwargs)` where `op` is
+    "call" for a store method, "stream" for a generator method, or one of the
+    registry operations "resolve", "touch" and "drop". Replies are
+    `("ok", result)` or `("error", exception)`; streams send `("item", batch)`
+    messages followed by `("end", None)`.
+    """
+    def __init__(self, address: str, db_path: str = './data/db_data/', config: dict = None,
+                 authkey: bytes = None, stream_batch_size: int = 500):
+        self.address = address
+        self.config = dict(config or {})
+        self.registry = StoreRegistry(db_path)
+        # The server is the only process opening stores, so keep them all open
+        self.cache = StoreCache(max_open=64, idle_seconds=3600)
+        self._locks = {}  # store name -> ReadWriteLock
+        self._locks_guard = threading.Lock()
+        self._registry_lock = threading.Lock()
+        self.authkey = authkey or _authkey(address, create=True)
+        self.stream_batch_size = stream_batch_size
+        self._listener = None
+        self._closed = threading.Event()
+        # Re-indexing runs as background jobs, resumed when the server restarts
+        self.jobs = JobQueue(os.path.join(db_path, "jobs.sqlite"), {"reindex": self._reindex_job},
+                             workers=self.config.get("job_workers", 2))
+
+    @contextmanager
+    def _store(self, name: str):
+        # Only the server opens stores; workers importing the client never load chromadb
+        from chroma_db.chroma_vector import ChromaDB_VectorStore
+
+        if self.registry.get(name) is None:
+            raise KeyError(f"Unknown vector store: {name}")
+        # Leased for the request, so the cache does not close it under a running call
+        with self.cache.lease(name, self.registry.path(name), self.config,
+                              lambda store_config: ChromaDB_VectorStore(config=store_config)) as store:
+            # A store opened with another embedding model is rebuilt in the background
+            if store.reindex_required:
+                self.jobs.submit("reindex", {"store": name}, key=f"reindex:{name}", scope=name)
+            yield store
+
+    def _reindex_job(self, job, store: str) -> dict:
+        from chroma_db.reindex import reindex_store
+
+        with self._store(store) as db, request_priority(BACKGROUND):
+            result = reindex_store(db, batch_size=self.config.get("reindex_batch_size", 256), progress=job.progress)
+        if result["status"] == "done":
+            self.registry.touch(store, embedding_model=db.embedding_model)
+        return result
+
+    def _lock(self, name: str) -> ReadWriteLock:
+        with self._locks_guard:
+            if name not in self._locks:
+                self._locks[name] = ReadWriteLock()
+            return self._locks[name]
+
+    def handle(self, request, conn):
+        op, name, method, args, kwargs = request
+        if op == "resolve":
+            # Binding fingerprints to stores is serialized; the stores themselves are not locked
+            with self._registry_lock:
+                entry = self.registry.resolve(*args, **kwargs)
+                with self._store(entry["name"]) as store:
+                    self.registry.touch(entry["name"], items=store.count_training_data(),
+                                        embedding_model=store.embedding_model)
+                    return {"name": entry["name"], "embedding_model": store.embedding_model}
+        if op == "drop":
+            lock = self._lock(name)
+            with self._registry_lock:
+                lock.acquire_write()
+                try:
+                    self.cache.evict(name)
+                    self.registry.remove(name)
+                    shutil.rmtree(self.registry.path(name), ignore_errors=True)
+                    return True
+                finally:
+                    lock.release_write()
+        if op == "touch":
+            with self._store(name) as store:
+                self.registry.touch(name, items=store.count_training_data())
+                return {"name": name, "embedding_model": store.embedding_model}
+
+        lock = self._lock(name)
+        if method in WRITE_METHODS:
+            lock.acquire_write()
+            release = lock.release_write
+        elif method in READ_METHODS or method in STREAM_METHODS:
+            lock.acquire_read()
+            release = lock.release_read
+        else:
+            raise AttributeError(f"Store method not served: {method}")
+        try:
+            # Training embeds behind the retrievals of chat turns in the shared rate limit
+            with self._store(name) as store, request_priority(BACKGROUND if method in WRITE_METHODS else INTERACTIVE):
+                return self._call(store, op, method, args, kwargs, conn)
+        finally:
+            release()
+
+    def _call(self, store, op: str, method: str, args, kwargs, conn):
+        if op == "stream":
+            batch = []
+            for item in getattr(store, method)(*args, **kwargs):
+                batch.append(item)
+                if len(batch) >= self.stream_batch_size:
+                    conn.send(("item", batch))
+                    batch = []
+            if batch:
+                conn.send(("item", batch))
+            return None
+        return getattr(store, method)(*args, **kwargs)
+
+    def _serve_connection(self, conn):
+        with conn:
+            while not self._closed.is_set():
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    result = self.handle(request, conn)
+                    reply = ("end", None) if request[0] == "stream" else ("ok", result)
+                except Exception as e:
+                    logger.exception("Store request failed: %s", request[:3])
+                    reply = ("error", e)
+                try:
+                    conn.send(reply)
+                except (EOFError, OSError):
+                    return
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            os.remove(self.address)  # stale socket from a previous run
+        os.makedirs(os.path.dirname(os.path.abspath(self.address)), exist_ok=True)
+        # Only the server's user may connect to the socket
+        umask = os.umask(0o177)
+        try:
+            self._listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        finally:
+            os.umask(umask)
+        os.chmod(self.address, 0o600)
+        logger.info("Store server listening on %s", self.address)
+        try:
+            while not self._closed.is_set():
+                try:
+                    conn = self._listener.accept()
+                except (OSError, EOFError, AuthenticationError):
+                    if self._closed.is_set():
+                        break
+                    continue  # failed handshake, e.g. a client with the wrong key
+                threading.Thread(target=self._serve_connection, args=(conn,),
+                                 name="store-connection", daemon=True).start()
+        finally:
+            self.close()
+
+    def close(self):
+        self._closed.set()
+        self.jobs.close()
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        if os.path.exists(self.address):
+            os.remove(self.address)
+
+
+class StoreClient:
+    """
+    Connection to a store server, shared by the sessions of one worker.
+
+    Each thread gets its own connection, so concurrent sessions of a worker
+    are served in parallel by the server.
+    """
+    def __init__(self, address: str, authkey: bytes = None):
+        self.address = address
+        self.authkey = authkey  # read when connecting: the server may create its key file later
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.authkey is None:
+                self.authkey = _authkey(self.address)
+            conn = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _reset_connection(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            conn.close()
+
+    def request(self, op: str, name: str = None, method: str = None, *args, **kwargs):
+        conn = self._connection()
+        try:
+            conn.send((op, name, method, args, kwargs))
+            status, result = conn.recv()
+        except (EOFError, OSError):
+            # Server restarted: drop the connection so the next call reconnects
+            self._reset_connection()
+            raise
+        if status == "error":
+            raise result
+        return result
+
+    def stream(self, name: str, method: str, *args, **kwargs):
+        conn = self._connection()
+        conn.send(("stream", name, method, args, kwargs))
+        finished = False
+        try:
+            while True:
+                status, result = conn.recv()
+                if status == "item":
+                    yield from result
+                elif status == "error":
+                    finished = True
+                    raise result
+                else:
+                    finished = True
+                    return
+        finally:
+            if not finished:
+                # Abandoned mid-stream: the connection is out of step with the server
+                self._reset_connection()
+
+    def resolve(self, fingerprint: str = None) -> str:
+        return self.request("resolve", None, None, fingerprint)["name"]
+
+    def store(self, name: str) -> "RemoteVectorStore":
+        info = self.request("touch", name)
+        return RemoteVectorStore(self, name, info["embedding_model"])
+
+    def drop(self, name: str) -> bool:
+        return self.request("drop", name)
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+
+class RemoteVectorStore:
+    """
+    Stand-in for `ChromaDB_VectorStore` whose calls run in the store server.
+    """
+    def __init__(self, client: StoreClient, name: str, embedding_model: str):
+        self.client = client
+        self.name = name
+        self.embedding_model = embedding_model
+
+    def __getattr__(self, method: str):
+        if method in READ_METHODS or method in WRITE_METHODS:
+            return lambda *args, **kwargs: self.client.request("call", self.name, method, *args, **kwargs)
+        if method in STREAM_METHODS:
+            return lambda *args, **kwargs: self.client.stream(self.name, method, *args, **kwargs)
+        raise AttributeError(method)
+
+    def drop(self) -> bool:
+        return self.client.drop(self.name)
+
+    def close(self):
+        pass  # connections belong to the shared StoreClient
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the persistent vector stores to app worker processes.")
+    parser.add_argument("--socket", default=os.environ.get("STORE_SERVER", "./data/store.sock"))
+    parser.add_argument("--db-path", default="./data/db_data/")
+    parser.add_argument("--env-file", help=".env file with the embedding provider settings")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from module.utils import get_openai_config
+
+    if args.env_file:
+        load_dotenv(args.env_file)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    config = {k: v for k, v in get_openai_config().items() if k != "store_server"}
+    server = StoreServer(args.socket, db_path=args.db_path, config=config)
+    signal.signal(signal.SIGTERM, lambda *_: server.close())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Streaming export and import of a vector store's training data.
+
+Items are written one batch at a time to JSONL or Parquet together with their
+stored embeddings and the model that produced them. Importing into a store
+that uses the same embedding model loads the vectors straight into Chroma
+without a single embedding call; otherwise the documents are re-embedded in
+batches.
+"""
+import json
+from typing import Callable, Iterator, List, Optional
+
+EXPORT_COLUMNS = ["id", "training_data_type", "question", "content", "document", "embedding", "embedding_model"]
+
+
+def _batches(records: Iterator[dict], batch_size: int) -> Iterator[List[dict]]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def export_training_data(db, path: str, file_format: str = None, batch_size: int = 1000) -> int:
+    """
+    Write every training item of `db` (a ChromaDB_VectorStore) to `path`.
+
+    Args:
+        db: The vector store to export.
+        path (str): Output file.
+        file_format (str): "jsonl" or "parquet" (default: from the file extension).
+        batch_size (int): Items read from Chroma and written per batch.
+
+    Returns:
+        int: Number of items written.
+    """
+    file_format = file_format or ("parquet" if path.endswith(".parquet") else "jsonl")
+    records = db.iter_training_data(batch_size=batch_size, include_embeddings=True)
+    written = 0
+
+    if file_format == "jsonl":
+        with open(path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                written += 1
+        return written
+
+    if file_format == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([
+            ("id", pa.string()),
+            ("training_data_type", pa.string()),
+            ("question", pa.string()),
+            ("content", pa.string()),
+            ("document", pa.string()),
+            ("embedding", pa.list_(pa.float32())),
+            ("embedding_model", pa.string()),
+        ])
+        with pq.ParquetWriter(path, schema) as writer:
+            for batch in _batches(records, batch_size):
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                written += len(batch)
+        return written
+
+    raise ValueError(f"Unsupported export format: {file_format}")
+
+
+def _read_records(path: str, file_format: str, batch_size: int) -> Iterator[List[dict]]:
+    if file_format == "jsonl":
+        with open(path, encoding="utf-8") as f:
+            yield from _batches((json.loads(line) for line in f if line.strip()), batch_size)
+    elif file_format == "parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            yield batch.to_pylist()
+    else:
+        raise ValueError(f"Unsupported import format: {file_format}")
+
+
+def import_training_data(db, path: str, file_format: str = None, batch_size: int = 1000, skip: int = 0,
+                         progress: Optional[Callable[[int, dict], None]] = None) -> dict:
+    """
+    Bulk-load a file written by `export_training_data` into `db`.
+
+    Items whose `embedding_model` matches the store's model are upserted with
+    their stored vectors; any others are re-embedded in batches. The first
+    `skip` items are left out (to resume an interrupted import), and
+    `progress(items read, counts)` is called after every batch.
+
+    Returns:
+        dict: Items imported per training data type, plus "reembedded".
+    """
+    file_format = file_format or ("parquet" if path.endswith(".parquet") else "jsonl")
+    counts = {"sql": 0, "ddl": 0, "documentation": 0, "reembedded": 0}
+    read = 0
+
+    for batch in _read_records(path, file_format, batch_size):
+        read += len(batch)
+        if read <= skip:
+            continue
+        batch = batch[len(batch) - (read - skip):] if read - len(batch) < skip else batch
+        groups = {}
+        for record in batch:
+            reuse = record.get("embedding") is not None and record.get("embedding_model") == db.embedding_model
+            groups.setdefault((record["training_data_type"], reuse), []).append(record)
+
+        for (collection_name, reuse), records in groups.items():
+            if collection_name not in counts:
+                raise ValueError(f"Unknown training_data_type in import file: {collection_name}")
+            db.bulk_add(
+                collection_name,
+                ids=[r["id"] for r in records],
+                documents=[r["document"] for r in records],
+                embeddings=[list(r["embedding"]) for r in records] if reuse else None,
+            )
+            counts[collection_name] += len(records)
+            if not reuse:
+                counts["reembedded"] += len(records)
+        if progress is not None:
+            progress(read, counts)
+    return counts
@@ -0,0 +1,125 @@
+"""
+Compact statistical digest of a query result for the `insight:` prompt.
+
+Instead of pasting rows, the model gets a summary of the whole result computed
+with vectorized pandas/NumPy: per-column dtype, counts, quantiles and top
+categories, the strongest numeric correlations and a small sample stratified
+over the main categorical column. Sections are added in order of importance
+until the token budget is used, so the prompt stays bounded however large the
+result is.
+"""
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from chroma_db.retrieval import approx_token_count
+
+
+def _fmt(value) -> str:
+    if isinstance(value, (float, np.floating)):
+        if np.isnan(value):
+            return "nan"
+        return f"{value:.4g}"
+    return str(value)
+
+
+def _positional(df: pd.DataFrame) -> pd.DataFrame:
+    # Columns and rows labelled by position: `SELECT *` over a JOIN repeats column names
+    return df.set_axis(range(df.shape[1]), axis=1).reset_index(drop=True)
+
+
+def _column_lines(df: pd.DataFrame, top_k: int) -> List[str]:
+    frame = _positional(df)
+    counts = frame.count()
+    numeric = frame.select_dtypes(include="number").columns
+    quantiles = frame[numeric].quantile([0, 0.25, 0.5, 0.75, 1.0]) if len(numeric) else None
+    means = frame[numeric].mean() if len(numeric) else None
+
+    lines = []
+    for position, column in enumerate(df.columns):
+        series = frame[position]
+        try:
+            distinct = series.nunique(dropna=True)
+        except TypeError:  # unhashable values such as lists
+            series = series.astype(str)
+            distinct = series.nunique(dropna=True)
+        line = f"- {column} ({series.dtype}): {counts[position]} non-null, {distinct} distinct"
+        if position in numeric and counts[position]:
+            q = quantiles[position]
+            line += (f"; min {_fmt(q[0])}, p25 {_fmt(q[0.25])}, median {_fmt(q[0.5])}, "
+                     f"p75 {_fmt(q[0.75])}, max {_fmt(q[1.0])}, mean {_fmt(means[position])}")
+        elif pd.api.types.is_datetime64_any_dtype(series) and counts[position]:
+            line += f"; from {series.min()} to {series.max()}"
+        elif counts[position]:
+            top = series.value_counts(dropna=True).head(top_k)
+            line += "; top: " + ", ".join(f"{_fmt(value)} ({count})" for value, count in top.items())
+        lines.append(line)
+    return lines
+
+
+def _correlation_lines(df: pd.DataFrame, top_k: int) -> List[str]:
+    numeric = df.select_dtypes(include="number")
+    if numeric.shape[1] < 2 or len(numeric) < 3:
+        return []
+    corr = numeric.corr().to_numpy()
+    rows, cols = np.triu_indices_from(corr, k=1)
+    values = corr[rows, cols]
+    order = np.argsort(-np.nan_to_num(np.abs(values)))[:top_k]
+    names = numeric.columns
+    return [f"- {names[rows[i]]} ~ {names[cols[i]]}: r={values[i]:.2f}" for i in order if not np.isnan(values[i])]
+
+
+def stratified_sample(df: pd.DataFrame, n: int, max_strata: int = 20) -> pd.DataFrame:
+    """
+    Up to `n` rows covering every value of the lowest-cardinality text column
+    (at most `max_strata` values), otherwise rows spread evenly over the result.
+    """
+    if len(df) <= n:
+        return df
+    frame = _positional(df)
+    cardinality = {}
+    for column in frame.select_dtypes(exclude=["number", "datetime"]).columns:
+        try:
+            cardinality[column] = frame[column].nunique(dropna=False)
+        except TypeError:  # unhashable values
+            continue
+    candidates = {c: k for c, k in cardinality.items() if 1 < k <= max_strata}
+    if candidates:
+        column = min(candidates, key=candidates.get)
+        per_group = max(1, n // candidates[column])
+        sample = frame.groupby(column, dropna=False, sort=False, group_keys=False).head(per_group)
+        return df.iloc[sample.index[:n]]
+    return df.iloc[np.linspace(0, len(df) - 1, n).astype(int)]
+
+
+def summarize_dataframe(df: pd.DataFrame, token_budget: int = 1500, top_k: int = 5,
+                        sample_rows: int = 10) -> str:
+    """
+    Digest of `df` in at most ~`token_budget` tokens (4 characters per token).
+    """
+    sections = [f"{len(df)} rows x {len(df.columns)} columns"]
+    used = approx_token_count(sections[0])
+
+    def add(lines: List[str], title: str = None) -> bool:
+        nonlocal used
+        if title:
+            if not lines or used + approx_token_count(title) + approx_token_count(lines[0]) > token_budget:
+                return False
+            sections.append(title)
+            used += approx_token_count(title)
+        for line in lines:
+            if used + approx_token_count(line) > token_budget:
+                return False
+            sections.append(line)
+            used += approx_token_count(line)
+        return True
+
+    add(_column_lines(df, top_k), "Columns:")
+    if df.empty:
+        return "\n".join(sections)
+    add(_correlation_lines(df, top_k), "Strongest numeric correlations:")
+    sample = stratified_sample(df, sample_rows)
+    csv = sample.to_csv(sep="|", index=False, lineterminator="\n", float_format="%.6g").splitlines()
+    add(csv, f"Sample rows ({len(sample)} of {len(df)}):")
+    return "\n".join(sections)
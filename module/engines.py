@@ -0,0 +1,236 @@
+"""
+SQL execution engines behind `query_to_dataframe`.
+
+Each uploaded dataset is queried by the engine its file calls for:
+
+- `SqliteEngine` for SQLite databases, uploaded as is or converted from Excel
+  (and from Parquet when DuckDB is not installed),
+- `DuckDBEngine` for Parquet uploads, which are stored unchanged and scanned
+  in place through an `uploaded_data` view. Nothing is converted at upload and
+  aggregations run on DuckDB's columnar executor.
+
+Every engine opens read-only connections that are interrupted after a timeout.
+Each one validates queries and describes its schema as `(type, name, sql)`
+rows, so the repair loop, the cost gate, downloads and warm-up work on either.
+`dialect` is stated in the SQL prompt.
+"""
+import importlib.util
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+TABLE_NAME = "uploaded_data"
+
+# Authorizer actions a SELECT needs; everything else (writes, DDL, ATTACH, PRAGMA) is denied
+_ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+_ACTION_NAMES = {getattr(sqlite3, "SQLITE_" + name): name for name in (
+    "INSERT", "UPDATE", "DELETE", "CREATE_TABLE", "CREATE_INDEX", "CREATE_VIEW", "CREATE_TRIGGER",
+    "CREATE_TEMP_TABLE", "CREATE_TEMP_INDEX", "CREATE_TEMP_VIEW", "CREATE_TEMP_TRIGGER", "CREATE_VTABLE",
+    "DROP_TABLE", "DROP_INDEX", "DROP_VIEW", "DROP_TRIGGER", "DROP_TEMP_TABLE", "DROP_TEMP_INDEX",
+    "DROP_TEMP_VIEW", "DROP_TEMP_TRIGGER", "DROP_VTABLE", "ALTER_TABLE", "REINDEX", "ANALYZE",
+    "ATTACH", "DETACH", "PRAGMA", "TRANSACTION", "SAVEPOINT")}
+
+_IDENTIFIER_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def duckdb_available() -> bool:
+    return importlib.util.find_spec("duckdb") is not None
+
+
+def set_query_timeout(conn: sqlite3.Connection, seconds: Optional[float]):
+    """
+    Abort statements on `conn` running longer than `seconds` (from now); they
+    fail with `sqlite3.OperationalError: interrupted`.
+    """
+    if not seconds:
+        conn.set_progress_handler(None, 0)
+        return
+    deadline = time.monotonic() + seconds
+    conn.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+
+
+class QueryEngine:
+    """
+    Read-only access to one kind of uploaded dataset.
+
+    Subclasses implement `connect`, `validate` and `schema`; connections
+    follow the DB-API far enough for `execute`, `description` and `fetchmany`.
+    """
+    name = ""
+    dialect = ""
+
+    @contextmanager
+    def connect(self, db_file: str, timeout: Optional[float] = None):
+        raise NotImplementedError
+
+    def validate(self, db_file: str, sql: str) -> Optional[str]:
+        """None when `sql` is a valid read-only statement, otherwise the error."""
+        raise NotImplementedError
+
+    def schema(self, db_file: str) -> List[Tuple[str, str, str]]:
+        """(type, name, CREATE statement) of every schema object, ordered by type and name."""
+        raise NotImplementedError
+
+    def columns(self, db_file: str, table: str) -> List[Tuple[str, str]]:
+        """(name, declared type) of every column of `table`."""
+        raise NotImplementedError
+
+    def fetch(self, cursor):
+        """The remaining rows of an executed query, in the engine's native form."""
+        return cursor.fetchall()
+
+    def to_dataframe(self, rows, columns: List[str]) -> "pd.DataFrame":
+        import pandas as pd
+
+        return pd.DataFrame(rows, columns=columns)
+
+    def tables(self, db_file: str) -> List[str]:
+        return [name for type, name, _ in self.schema(db_file)
+                if type in ("table", "view") and not name.startswith("sqlite_")]
+
+    def row_counts(self, db_file: str) -> Dict[str, int]:
+        with self.connect(db_file) as conn:
+            return {table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+                    for table in self.tables(db_file)}
+
+
+class SqliteEngine(QueryEngine):
+    name = "sqlite"
+    dialect = "SQLite"
+
+    @contextmanager
+    def connect(self, db_file: str, timeout: Optional[float] = None):
+        conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+        try:
+            set_query_timeout(conn, timeout)
+            yield conn
+        finally:
+            conn.close()
+
+    def validate(self, db_file: str, sql: str) -> Optional[str]:
+        # Compile with EXPLAIN; the authorizer denies every action a SELECT does not need
+        denied = []
+
+        def authorizer(action, *args):
+            if action in _ALLOWED_ACTIONS:
+                return sqlite3.SQLITE_OK
+            denied.append(_ACTION_NAMES.get(action, str(action)))
+            return sqlite3.SQLITE_DENY
+
+        with self.connect(db_file) as conn:
+            try:
+                conn.set_authorizer(authorizer)
+                conn.execute("EXPLAIN " + sql.strip().rstrip(";"))
+            except (sqlite3.Error, sqlite3.Warning) as e:
+                if denied:
+                    return f"Only read-only SELECT statements are allowed (statement needs {denied[0]} access)"
+                return str(e)
+        return None
+
+    def schema(self, db_file: str) -> List[Tuple[str, str, str]]:
+        with self.connect(db_file) as conn:
+            return conn.execute(
+                "SELECT type, name, sql FROM sqlite_master WHERE sql IS NOT NULL ORDER BY type, name"
+            ).fetchall()
+
+    def columns(self, db_file: str, table: str) -> List[Tuple[str, str]]:
+        with self.connect(db_file) as conn:
+            return [(row[1], row[2] or "") for row in conn.execute(f'PRAGMA table_info("{table}")')]
+
+    def tables(self, db_file: str) -> List[str]:
+        # Views are left out, as before: their rows are those of the tables
+        return [name for type, name, _ in self.schema(db_file)
+                if type == "table" and not name.startswith("sqlite_")]
+
+
+def _quote_string(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _quote_identifier(name: str) -> str:
+    return name if _IDENTIFIER_RE.match(name) else '"' + name.replace('"', '""') + '"'
+
+
+class DuckDBEngine(QueryEngine):
+    """
+    A Parquet file queried in place as the `uploaded_data` view of an
+    in-memory DuckDB database. The connection cannot read or write any other
+    file, and its configuration is locked so a query cannot lift that.
+    """
+    name = "duckdb"
+    dialect = "DuckDB"
+
+    @contextmanager
+    def connect(self, db_file: str, timeout: Optional[float] = None):
+        import duckdb
+
+        path = _quote_string(os.path.abspath(db_file))
+        conn = duckdb.connect(":memory:")
+        timer = None
+        try:
+            conn.execute(f"SET allowed_paths = [{path}]")
+            conn.execute("SET enable_external_access = false")
+            conn.execute("SET lock_configuration = true")
+            conn.execute(f"CREATE VIEW {TABLE_NAME} AS SELECT * FROM read_parquet({path})")
+            if timeout:
+                # Running statements fail with duckdb.InterruptException
+                timer = threading.Timer(timeout, conn.interrupt)
+                timer.daemon = True
+                timer.start()
+            yield conn
+        finally:
+            if timer is not None:
+                timer.cancel()
+            conn.close()
+
+    def validate(self, db_file: str, sql: str) -> Optional[str]:
+        # DuckDB has no authorizer: the parser tells the statement type, EXPLAIN binds it
+        import duckdb
+
+        sql = sql.strip().rstrip(";")
+        try:
+            statements = duckdb.extract_statements(sql)
+        except duckdb.Error as e:
+            return str(e)
+        if len(statements) != 1:
+            return "You can only execute one statement at a time."
+        if statements[0].type != duckdb.StatementType.SELECT:
+            return f"Only read-only SELECT statements are allowed (statement is {statements[0].type.name})"
+        with self.connect(db_file) as conn:
+            try:
+                conn.execute("EXPLAIN " + sql)
+            except duckdb.Error as e:
+                return str(e)
+        return None
+
+    def schema(self, db_file: str) -> List[Tuple[str, str, str]]:
+        # Only the Parquet footer is read
+        body = ",\n".join(f"    {_quote_identifier(name)} {type}" for name, type in self.columns(db_file, TABLE_NAME))
+        return [("table", TABLE_NAME, f"CREATE TABLE {TABLE_NAME} (\n{body}\n)")]
+
+    def columns(self, db_file: str, table: str) -> List[Tuple[str, str]]:
+        with self.connect(db_file) as conn:
+            return [(row[0], row[1]) for row in conn.execute(f'DESCRIBE "{table}"').fetchall()]
+
+    def fetch(self, cursor):
+        return cursor.fetch_arrow_table()
+
+    def to_dataframe(self, rows, columns: List[str]) -> "pd.DataFrame":
+        return rows.to_pandas()
+
+
+ENGINES = {engine.name: engine for engine in (SqliteEngine(), DuckDBEngine())}
+
+
+def get_engine(db_file: Optional[str]) -> QueryEngine:
+    """The engine of an uploaded dataset: DuckDB for Parquet files, SQLite otherwise."""
+    if db_file and db_file.lower().endswith(".parquet"):
+        return ENGINES["duckdb"]
+    return ENGINES["sqlite"]
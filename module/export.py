@@ -0,0 +1,181 @@
+"""
+Streaming export of a full query result.
+
+`export_query` re-runs a chat query on a read-only connection of the dataset's
+engine and writes the cursor batch by batch to a compressed file, so memory
+stays bounded by one batch however many rows the query returns:
+
+- "csv": gzip-compressed CSV,
+- "parquet": Parquet with zstd-compressed column chunks (one row group per batch),
+- "arrow": Arrow IPC file with zstd-compressed buffers.
+
+The query goes through the same read-only validation as the chat turn and is
+interrupted after the export timeout.
+
+Files are written to one directory per browser session under `EXPORT_ROOT`;
+`sweep_exports` removes the directories of sessions that have not exported
+anything for a while, so abandoned downloads do not pile up.
+"""
+import csv
+import gzip
+import os
+import shutil
+import tempfile
+import time
+from typing import Optional
+
+from module.engines import get_engine
+from module.sql_validation import validate_sql
+from module.tracing import span
+
+# format -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    "csv": ("csv.gz", "application/gzip"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    "arrow": ("arrow", "application/vnd.apache.arrow.file"),
+}
+
+EXPORT_ROOT = os.path.join(tempfile.gettempdir(), "insightgenix_exports")
+
+
+def session_export_dir(session: str) -> str:
+    """Directory of the exports of one browser session (created if needed)."""
+    path = os.path.join(EXPORT_ROOT, session)
+    os.makedirs(path, exist_ok=True)
+    os.utime(path)  # the sweep measures age from the last export
+    return path
+
+
+def sweep_exports(max_age: float, keep: Optional[str] = None) -> int:
+    """
+    Remove the export directories of sessions whose last export is older than
+    `max_age` seconds, except `keep`. Returns the number of directories removed.
+    """
+    if not os.path.isdir(EXPORT_ROOT):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for entry in os.scandir(EXPORT_ROOT):
+        if entry.name == keep or not entry.is_dir():
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass  # swept by another session at the same time
+    return removed
+
+
+def _write_csv(cursor, columns, path: str, batch_size: int) -> int:
+    rows = 0
+    with gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=6) as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        while batch := cursor.fetchmany(batch_size):
+            writer.writerows(batch)
+            rows += len(batch)
+    return rows
+
+
+def _record_batches(cursor, columns, batch_size: int):
+    """
+    Arrow record batches of the cursor. The schema is inferred from the first
+    batch (all-NULL columns become strings) and later batches are cast to it.
+    """
+    import pyarrow as pa
+
+    schema = None
+    while batch := cursor.fetchmany(batch_size):
+        values = list(zip(*batch))
+        if schema is None:
+            arrays = [pa.array(column) for column in values]
+            arrays = [array.cast(pa.string()) if pa.types.is_null(array.type) else array for array in arrays]
+            schema = pa.schema([pa.field(name, array.type) for name, array in zip(columns, arrays)])
+        else:
+            arrays = []
+            for field, column in zip(schema, values):
+                try:
+                    arrays.append(pa.array(column, type=field.type))
+                except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+                    raise ValueError(f"Column {field.name} changes type within the result "
+                                     f"({e}); export it as CSV instead") from e
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+    if schema is None:  # empty result: keep the column names
+        yield pa.RecordBatch.from_arrays([pa.array([], type=pa.string()) for _ in columns],
+                                         names=list(columns))
+
+
+def _write_parquet(cursor, columns, path: str, batch_size: int) -> int:
+    import pyarrow.parquet as pq
+
+    rows = 0
+    writer = None
+    try:
+        for batch in _record_batches(cursor, columns, batch_size):
+            if writer is None:
+                writer = pq.ParquetWriter(path, batch.schema, compression="zstd")
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def _write_arrow(cursor, columns, path: str, batch_size: int) -> int:
+    import pyarrow as pa
+
+    rows = 0
+    writer = None
+    try:
+        for batch in _record_batches(cursor, columns, batch_size):
+            if writer is None:
+                writer = pa.ipc.new_file(path, batch.schema,
+                                         options=pa.ipc.IpcWriteOptions(compression="zstd"))
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+_WRITERS = {"csv": _write_csv, "parquet": _write_parquet, "arrow": _write_arrow}
+
+
+def export_query(db_file: str, sql: str, path: str, file_format: str = "csv",
+                 batch_size: int = 10000, timeout: Optional[float] = None) -> dict:
+    """
+    Run `sql` against `db_file` and stream the full result to `path`.
+
+    Returns:
+        dict: rows, bytes written, seconds, rows/s and MB/s.
+    """
+    if file_format not in _WRITERS:
+        raise ValueError(f"Unsupported export format: {file_format}")
+    error = validate_sql(db_file, sql)
+    if error is not None:
+        raise ValueError(error)
+
+    start = time.perf_counter()
+    with span("export.write", format=file_format) as attrs:
+        try:
+            with get_engine(db_file).connect(db_file, timeout=timeout) as conn:
+                cursor = conn.execute(sql.strip().rstrip(";"))
+                columns = [description[0] for description in cursor.description]
+                rows = _WRITERS[file_format](cursor, columns, path, batch_size)
+        except BaseException:
+            if os.path.exists(path):
+                os.remove(path)  # no half-written downloads
+            raise
+        attrs.update(rows=rows)
+    seconds = time.perf_counter() - start
+    size = os.path.getsize(path)
+    return {
+        "rows": rows,
+        "bytes": size,
+        "seconds": seconds,
+        "rows_per_s": rows / seconds if seconds else float("inf"),
+        "mb_per_s": size / 1e6 / seconds if seconds else float("inf"),
+    }
@@ -0,0 +1,309 @@
+"""
+Background jobs that outlive the session which started them.
+
+Uploads, profiling, bulk training and re-indexing ran inside the page script,
+so they blocked the session and a browser refresh stopped them halfway. They
+are submitted to a `JobQueue` instead: a persistent SQLite job table served by
+a few worker threads of the server process. Pages submit a job and poll its row.
+
+- A job is a `kind`, naming its handler, and JSON `params`. Handlers are
+  called as `handler(job, **params)` with a `JobContext` to report progress,
+  save a checkpoint and notice cancellation; what they return is the result.
+- `cancel` stops a queued job at once and a running one at its next progress
+  report, where `JobCancelled` is raised.
+- A job still marked running after its process died (its heartbeat stopped)
+  is queued again and resumes from its last checkpoint.
+- Submitting a job with the `key` of a queued or running job returns that job,
+  so e.g. a store is re-indexed once however many sessions ask for it.
+
+Workers are threads rather than processes: handlers mostly wait on the
+embedding API, SQLite and DuckDB, and they share the vector stores this
+process has open.
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+FINISHED_STATUSES = ("done", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    """Raised in a handler when its job was cancelled."""
+
+
+class JobContext:
+    """
+    What a handler sees of its job: `params`, the `checkpoint` it saved on a
+    previous attempt (None on the first one), and progress reporting.
+    """
+    def __init__(self, queue: "JobQueue", job: dict):
+        self.queue = queue
+        self.id = job["id"]
+        self.kind = job["kind"]
+        self.scope = job["scope"]
+        self.params = job["params"]
+        self.checkpoint = job["checkpoint"]
+        self.attempt = job["attempts"]
+        self.cancel_event = threading.Event()
+        self.stopping = False  # set when the queue closes, as opposed to a user cancelling
+        self._checked = 0.0
+
+    @property
+    def cancelled(self) -> bool:
+        if not self.cancel_event.is_set() and time.monotonic() - self._checked > 0.5:
+            # Another process may have cancelled it
+            self._checked = time.monotonic()
+            if self.queue._cancel_requested(self.id):
+                self.cancel_event.set()
+        return self.cancel_event.is_set()
+
+    def check(self):
+        if self.cancelled:
+            raise JobCancelled(self.id)
+
+    def progress(self, done: int, total: Optional[int] = None, message: Optional[str] = None):
+        """Record `done` of `total` units of work; raises `JobCancelled` when the job was cancelled."""
+        with self.queue._connect() as conn:
+            conn.execute("UPDATE jobs SET progress = ?, total = COALESCE(?, total), message = COALESCE(?, message), "
+                         "heartbeat_at = ? WHERE id = ?", (done, total, message, time.time(), self.id))
+        self.check()
+
+    def save_checkpoint(self, checkpoint: dict):
+        """State to resume from if the job is interrupted; given back as `checkpoint`."""
+        self.checkpoint = checkpoint
+        with self.queue._connect() as conn:
+            conn.execute("UPDATE jobs SET checkpoint = ? WHERE id = ?", (json.dumps(checkpoint), self.id))
+
+    def submit(self, kind: str, params: dict = None, key: str = None, scope: str = None) -> str:
+        """Queue a follow-up job, by default in this job's scope."""
+        return self.queue.submit(kind, params, key=key, scope=scope if scope is not None else self.scope)
+
+
+class JobQueue:
+    """
+    Persistent job table at `path` run by `workers` threads with `handlers`
+    (kind -> callable). Jobs of kinds without a handler stay queued.
+    """
+    def __init__(self, path: str, handlers: Dict[str, Callable], workers: int = 2,
+                 heartbeat_seconds: float = 5.0, stale_seconds: float = 30.0, poll_seconds: float = 1.0,
+                 max_attempts: int = 3, retention_seconds: float = 7 * 24 * 3600):
+        self.path = path
+        self.handlers = dict(handlers)
+        self.heartbeat_seconds = heartbeat_seconds
+        self.stale_seconds = stale_seconds
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max_attempts
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    key TEXT,
+                    scope TEXT,
+                    params TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress INTEGER DEFAULT 0,
+                    total INTEGER,
+                    message TEXT,
+                    checkpoint TEXT,
+                    result TEXT,
+                    error TEXT,
+                    cancel_requested INTEGER DEFAULT 0,
+                    attempts INTEGER DEFAULT 0,
+                    worker TEXT,
+                    created_at REAL,
+                    started_at REAL,
+                    finished_at REAL,
+                    heartbeat_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+                CREATE INDEX IF NOT EXISTS jobs_scope ON jobs (scope, created_at);
+            """)
+            conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed', 'cancelled') AND finished_at < ?",
+                         (time.time() - retention_seconds,))
+
+        self._running: Dict[str, JobContext] = {}
+        self._running_lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._closed = threading.Event()
+        self._threads = [threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                         for i in range(max(1, workers))]
+        self._threads.append(threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _row(row: Optional[sqlite3.Row]) -> Optional[dict]:
+        if row is None:
+            return None
+        job = dict(row)
+        for field in ("params", "checkpoint", "result"):
+            job[field] = json.loads(job[field]) if job[field] else ({} if field == "params" else None)
+        return job
+
+    def submit(self, kind: str, params: dict = None, key: str = None, scope: str = None) -> str:
+        """
+        Queue a job and return its id; with `key`, the id of the queued or
+        running job holding that key if there is one. `scope` (e.g. a store
+        name) groups jobs for `list_jobs`.
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if key is not None:
+                row = conn.execute("SELECT id FROM jobs WHERE key = ? AND status IN ('queued', 'running')",
+                                   (key,)).fetchone()
+                if row is not None:
+                    return row["id"]
+            id = uuid.uuid4().hex
+            conn.execute("INSERT INTO jobs (id, kind, key, scope, params, status, created_at) "
+                         "VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+                         (id, kind, key, scope, json.dumps(params or {}), time.time()))
+        with self._wakeup:
+            self._wakeup.notify()
+        return id
+
+    def get(self, id: str) -> Optional[dict]:
+        with self._connect() as conn:
+            return self._row(conn.execute("SELECT * FROM jobs WHERE id = ?", (id,)).fetchone())
+
+    def list_jobs(self, kinds: List[str] = None, scope: str = None, limit: int = 20) -> List[dict]:
+        """Most recent jobs first, optionally of some `kinds` or one `scope`."""
+        query, args = "SELECT * FROM jobs WHERE 1 = 1", []
+        if kinds:
+            query += f" AND kind IN ({', '.join('?' * len(kinds))})"
+            args += list(kinds)
+        if scope is not None:
+            query += " AND scope = ?"
+            args.append(scope)
+        with self._connect() as conn:
+            rows = conn.execute(query + " ORDER BY created_at DESC LIMIT ?", args + [limit]).fetchall()
+        return [self._row(row) for row in rows]
+
+    def cancel(self, id: str) -> bool:
+        """Cancel a queued or running job. Returns False when it already finished."""
+        with self._connect() as conn:
+            queued = conn.execute("UPDATE jobs SET status = 'cancelled', cancel_requested = 1, finished_at = ? "
+                                  "WHERE id = ? AND status = 'queued'", (time.time(), id)).rowcount
+            running = conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'",
+                                   (id,)).rowcount
+        with self._running_lock:
+            if id in self._running:
+                self._running[id].cancel_event.set()
+        return bool(queued or running)
+
+    def close(self, timeout: float = 5.0):
+        """Stop taking jobs; running ones are interrupted at their next progress report and resume later."""
+        self._closed.set()
+        with self._running_lock:
+            for job in self._running.values():
+                job.stopping = True
+                job.cancel_event.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _cancel_requested(self, id: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (id,)).fetchone()
+        return row is None or bool(row["cancel_requested"])
+
+    def _recover(self, conn):
+        # Jobs whose worker stopped beating died with their process: run them again
+        stale = time.time() - self.stale_seconds
+        conn.execute("UPDATE jobs SET status = 'failed', finished_at = ?, error = 'Interrupted too many times' "
+                     "WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?",
+                     (time.time(), stale, self.max_attempts))
+        conn.execute("UPDATE jobs SET status = 'queued', worker = NULL "
+                     "WHERE status = 'running' AND heartbeat_at < ?", (stale,))
+
+    def _claim(self) -> Optional[dict]:
+        kinds = list(self.handlers)
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._recover(conn)
+            row = conn.execute(f"SELECT * FROM jobs WHERE status = 'queued' "
+                               f"AND kind IN ({', '.join('?' * len(kinds))}) ORDER BY created_at LIMIT 1",
+                               kinds).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            conn.execute("UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, "
+                         "started_at = COALESCE(started_at, ?), heartbeat_at = ? WHERE id = ?",
+                         (self.worker_id, now, now, row["id"]))
+            job = self._row(row)
+        job["attempts"] += 1
+        return job
+
+    def _work(self):
+        while not self._closed.is_set():
+            try:
+                job = self._claim()
+            except sqlite3.Error:
+                logger.exception("Could not read the job table")
+                job = None
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_seconds)
+                continue
+            self._run(job)
+
+    def _run(self, job: dict):
+        context = JobContext(self, job)
+        with self._running_lock:
+            self._running[job["id"]] = context
+        status, result, error = "done", None, None
+        try:
+            result = self.handlers[job["kind"]](context, **job["params"])
+        except JobCancelled:
+            status = "cancelled"
+            if context.stopping and not self._cancel_requested(job["id"]):
+                status = None  # the queue is closing: resume the job later
+        except Exception as e:
+            logger.exception("Job %s (%s) failed", job["id"], job["kind"])
+            status, error = "failed", f"{type(e).__name__}: {e}"
+        finally:
+            with self._running_lock:
+                self._running.pop(job["id"], None)
+        with self._connect() as conn:
+            if status is None:
+                conn.execute("UPDATE jobs SET status = 'queued', worker = NULL WHERE id = ?", (job["id"],))
+            else:
+                conn.execute("UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                             (status, json.dumps(result) if result is not None else None, error, time.time(),
+                              job["id"]))
+
+    def _heartbeat(self):
+        # Long steps without progress reports must not look like a dead process
+        while not self._closed.wait(self.heartbeat_seconds):
+            with self._running_lock:
+                ids = list(self._running)
+            if ids:
+                try:
+                    with self._connect() as conn:
+                        conn.execute(f"UPDATE jobs SET heartbeat_at = ? WHERE id IN ({', '.join('?' * len(ids))})",
+                                     [time.time()] + ids)
+                except sqlite3.Error:
+                    logger.exception("Could not update job heartbeats")
@@ -0,0 +1,214 @@
+"""
+Cost gate for generated SQL, based on the engine's query plan.
+
+Table row counts are computed once when a database is uploaded and cached next
+to it (`<db>.stats.json`). Before a generated query runs, its plan is checked
+for full scans of large tables, unindexed nested-loop (cartesian) joins and
+temporary B-trees built over large inputs. What happens to a flagged query
+depends on the policy:
+
+- "warn": run it and show the issues,
+- "limit": run it with its row LIMIT added or tightened to `query_row_limit`
+  when that makes the plan cheaper (a LIMIT does not shorten aggregates, sorts
+  or filtered scans, so those run unchanged),
+- "confirm": only run it after the user clicks "Run query anyway",
+- "off": skip the check.
+
+On DuckDB (Parquet uploads) full scans are the columnar executor's normal
+mode, so only joins without an equality condition (cross products and nested
+loops) over a large table are flagged.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from module.engines import get_engine
+
+QUERY_COST_POLICIES = ("warn", "limit", "confirm", "off")
+DEFAULT_LARGE_TABLE_ROWS = 100_000
+DEFAULT_ROW_LIMIT = 1000
+
+_SCAN_RE = re.compile(r"^(SCAN|SEARCH)(?: TABLE)? (\S+)(?: AS (\S+))?(.*)$")
+# Outer row limit: "LIMIT n", "LIMIT n OFFSET m" or "LIMIT m, n" (group 1 or 2 is the row count)
+_LIMIT_RE = re.compile(r"\bLIMIT\s+(\d+)(?:\s+OFFSET\s+\d+|\s*,\s*(\d+))?$", re.IGNORECASE)
+# Prefix of a line up to an SQL line comment, skipping quoted strings
+_CODE_RE = re.compile(r"""(?:[^'"-]|-(?!-)|'[^']*'|"[^"]*")*""")
+# Clauses that make SQLite read the whole input before returning the first row
+_BLOCKING_RE = re.compile(r"\b(WHERE|GROUP\s+BY|ORDER\s+BY|DISTINCT|JOIN|COUNT|SUM|AVG|MIN|MAX)\b", re.IGNORECASE)
+# Operator boxes of DuckDB's EXPLAIN output, and the join operators without an equality condition
+_DUCKDB_OPERATOR_RE = re.compile(r"[│┤]\s*([A-Z][A-Z_]+)\s*[│├]")
+_DUCKDB_LOOP_JOINS = {"CROSS_PRODUCT", "NESTED_LOOP_JOIN", "BLOCKWISE_NL_JOIN"}
+
+_stats_cache = {}
+_stats_lock = threading.Lock()
+
+
+def _stats_path(db_file: str) -> str:
+    return db_file + ".stats.json"
+
+
+def cache_table_stats(db_file: str) -> Dict[str, int]:
+    """
+    Count the rows of every table of `db_file` and store the counts next to it.
+    Called once at upload, so planning never has to count rows.
+    """
+    counts = get_engine(db_file).row_counts(db_file)
+    with open(_stats_path(db_file), "w") as f:
+        json.dump({"row_counts": counts}, f)
+    with _stats_lock:
+        _stats_cache[db_file] = (os.path.getmtime(db_file), counts)
+    return counts
+
+
+def load_table_stats(db_file: str) -> Dict[str, int]:
+    """
+    Cached row count per table (lower-cased names). Databases uploaded before
+    the cache existed are counted on first use.
+    """
+    mtime = os.path.getmtime(db_file)
+    with _stats_lock:
+        cached = _stats_cache.get(db_file)
+    if cached is not None and cached[0] == mtime:
+        counts = cached[1]
+    elif os.path.exists(_stats_path(db_file)) and os.path.getmtime(_stats_path(db_file)) >= mtime:
+        with open(_stats_path(db_file)) as f:
+            counts = json.load(f)["row_counts"]
+        with _stats_lock:
+            _stats_cache[db_file] = (mtime, counts)
+    else:
+        counts = cache_table_stats(db_file)
+    return {table.lower(): rows for table, rows in counts.items()}
+
+
+def strip_sql(sql: str) -> str:
+    """`sql` without trailing semicolons, whitespace and comments."""
+    while True:
+        stripped = sql.strip().rstrip(";").strip()
+        if stripped.endswith("*/") and "/*" in stripped:
+            stripped = stripped[:stripped.rindex("/*")]
+        else:
+            line_start = stripped.rfind("\n") + 1
+            code = _CODE_RE.match(stripped, line_start).end()
+            if stripped.startswith("--", code):
+                stripped = stripped[:code]
+        if stripped == sql:
+            return sql
+        sql = stripped
+
+
+def _row_limit_span(sql: str) -> Optional[Tuple[int, int]]:
+    """Position of the row count of the outer LIMIT of a stripped query, if it has one."""
+    match = _LIMIT_RE.search(sql)
+    if not match:
+        return None
+    group = 2 if match.group(2) is not None else 1
+    return match.start(group), match.end(group)
+
+
+def explain_query_plan(conn: sqlite3.Connection, sql: str) -> List[tuple]:
+    """(id, parent, detail) rows of the query plan; the query itself is not run."""
+    return [(row[0], row[1], row[-1]) for row in conn.execute("EXPLAIN QUERY PLAN " + sql.strip().rstrip(";"))]
+
+
+class QueryCost:
+    """
+    Outcome of the cost check of one query.
+
+    Attributes:
+        issues (list): Human readable description of every flagged plan step.
+        scanned_rows (int): Estimated rows read by full scans (products for nested loops).
+        plan (list): Plan detail lines.
+    """
+    def __init__(self, issues: List[str], scanned_rows: int, plan: List[str]):
+        self.issues = issues
+        self.scanned_rows = scanned_rows
+        self.plan = plan
+
+    @property
+    def flagged(self) -> bool:
+        return bool(self.issues)
+
+    def summary(self) -> str:
+        return "This query looks expensive: " + "; ".join(self.issues) + "."
+
+
+def assess_query_cost(db_file: str, sql: str, large_table_rows: int = DEFAULT_LARGE_TABLE_ROWS,
+                      row_counts: Optional[Dict[str, int]] = None) -> QueryCost:
+    """
+    Inspect the plan of `sql` against the cached row counts of `db_file`.
+
+    Raises:
+        sqlite3.Error, duckdb.Error: If the query cannot be planned (e.g. unknown column).
+    """
+    row_counts = row_counts if row_counts is not None else load_table_stats(db_file)
+    engine = get_engine(db_file)
+    if engine.name == "duckdb":
+        return _assess_duckdb_cost(engine, db_file, sql, large_table_rows, row_counts)
+    with engine.connect(db_file) as conn:
+        plan = explain_query_plan(conn, sql)
+
+    # A bare scan under an outer LIMIT stops after the first rows
+    early_exit = _row_limit_span(strip_sql(sql)) is not None and not _BLOCKING_RE.search(sql)
+
+    issues = []
+    scanned_rows = 0
+    full_scans = {}  # parent id -> [(table, rows)] of unindexed scans in one loop nest
+    large_input = False
+    for id, parent, detail in plan:
+        match = _SCAN_RE.match(detail)
+        if match:
+            kind, table, _, rest = match.groups()
+            rows = row_counts.get(table.lower())
+            if rows is None:
+                continue  # subquery or CTE, its own tables are listed separately
+            if kind == "SCAN" and "INDEX" not in rest:
+                full_scans.setdefault(parent, []).append((table, rows))
+                if rows >= large_table_rows and not early_exit:
+                    large_input = True
+                    issues.append(f"full scan of {table} ({rows:,} rows)")
+        elif detail.startswith("USE TEMP B-TREE"):
+            if large_input:
+                issues.append(f"temporary B-tree {detail[len('USE TEMP B-TREE '):].lower()} over a large input")
+
+    for scans in full_scans.values():
+        nested = 1
+        for _, rows in scans:
+            nested *= max(rows, 1)
+        scanned_rows += nested if len(scans) > 1 else scans[0][1]
+        if len(scans) > 1 and nested >= large_table_rows:
+            tables = " x ".join(table for table, _ in scans)
+            issues.append(f"unindexed join {tables} (~{nested:,} row combinations)")
+
+    return QueryCost(issues, scanned_rows, [detail for _, _, detail in plan])
+
+
+def _assess_duckdb_cost(engine, db_file: str, sql: str, large_table_rows: int,
+                        row_counts: Dict[str, int]) -> QueryCost:
+    with engine.connect(db_file) as conn:
+        plan = "\n".join(row[-1] for row in conn.execute("EXPLAIN " + sql.strip().rstrip(";")).fetchall())
+    operators = _DUCKDB_OPERATOR_RE.findall(plan)
+    largest = max(row_counts.values(), default=0)
+    issues = []
+    if largest >= large_table_rows:
+        issues = [f"{operator.lower().replace('_', ' ')} over a large input ({largest:,} rows)"
+                  for operator in dict.fromkeys(operators) if operator in _DUCKDB_LOOP_JOINS]
+    return QueryCost(issues, largest, operators)
+
+
+def apply_row_limit(sql: str, limit: int) -> str:
+    """
+    Return `sql` returning at most `limit` rows: an outer LIMIT above `limit`
+    is tightened (its OFFSET kept), and a query without one is wrapped in a
+    limited SELECT. Trailing semicolons and comments are dropped.
+    """
+    sql = strip_sql(sql)
+    span = _row_limit_span(sql)
+    if span:
+        start, end = span
+        if int(sql[start:end]) <= limit:
+            return sql
+        return sql[:start] + str(limit) + sql[end:]
+    return f"SELECT * FROM (\n{sql}\n) LIMIT {limit}"
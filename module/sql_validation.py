@@ -0,0 +1,125 @@
+"""
+Compile-only validation of generated SQL, with a bounded repair loop.
+
+`validate_sql` prepares the query on a read-only connection of the dataset's
+engine with EXPLAIN, so unknown tables/columns and syntax errors are caught
+without running anything, and rejects every statement that would write or
+change the schema (see `module.engines`).
+When validation fails, `validate_and_repair` asks the model for a fix, sending
+only the compiler error and the DDL of the tables involved.
+"""
+import re
+from typing import Callable, List, Optional, Tuple
+
+from module.engines import get_engine
+from module.tracing import span
+
+# Opening fence of an SQL block, ```sql or ```sqlite; trained examples store it
+# without the newlines around the code, so "```sqlSELECT" is a block too
+_SQL_FENCE = r"```(?:sqlite3?\b|sql)"
+_SQL_FENCE_RE = re.compile(_SQL_FENCE, re.IGNORECASE)
+# First SQL block
+SQL_BLOCK_RE = re.compile(_SQL_FENCE + r"\s*(.*?)\s*```", re.DOTALL | re.IGNORECASE)
+
+
+def extract_sql(response: str) -> Optional[str]:
+    """SQL of the first ```sql block of a model response, if any."""
+    match = SQL_BLOCK_RE.search(response)
+    return match.group(1) if match else None
+
+
+class SqlStreamParser:
+    """
+    Incremental detector of the first complete ```sql block in a token stream.
+
+    Feed it the chunks as they arrive; `sql` is set as soon as the closing
+    fence has been seen and `end` is the offset just past that fence.
+    """
+    def __init__(self):
+        self.buffer = ""
+        self.sql = None
+        self.end = None
+        self._open_end = None
+
+    def feed(self, chunk: str) -> bool:
+        """Add a chunk; returns True once the SQL block is complete."""
+        if self.sql is not None:
+            return True
+        self.buffer += chunk
+        if self._open_end is None:
+            match = _SQL_FENCE_RE.search(self.buffer)
+            # Wait while the fence may still turn out to be ```sqlite
+            if match is None or "ite3".startswith(self.buffer[match.start() + 6:].lower()):
+                return False
+            self._open_end = match.end()
+        close = self.buffer.find("```", self._open_end)
+        if close < 0:
+            return False
+        self.sql = self.buffer[self._open_end:close].strip()
+        self.end = close + 3
+        return True
+
+
+def until_sql_block(stream, parser: SqlStreamParser):
+    """
+    Pass `stream` through until `parser` sees the end of the first SQL block,
+    then close it: trailing prose is neither waited for nor generated.
+    """
+    try:
+        for chunk in stream:
+            consumed = len(parser.buffer)
+            if parser.feed(chunk):
+                yield chunk[:parser.end - consumed]
+                return
+            yield chunk
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+
+
+def validate_sql(db_file: str, sql: str) -> Optional[str]:
+    """
+    Compile `sql` against the schema of `db_file` without executing it.
+
+    Returns:
+        Optional[str]: None when the query is a valid read-only statement,
+        otherwise the compiler error.
+    """
+    return get_engine(db_file).validate(db_file, sql)
+
+
+def relevant_ddl(db_file: str, sql: str) -> List[str]:
+    """
+    CREATE statements of the tables (and views) `sql` mentions, or of all of
+    them when none is mentioned, straight from the database schema.
+    """
+    rows = [(name, ddl) for type, name, ddl in get_engine(db_file).schema(db_file) if type in ("table", "view")]
+    words = set(re.findall(r"\w+", sql.lower()))
+    mentioned = [ddl for name, ddl in rows if name.lower() in words]
+    return mentioned or [ddl for _, ddl in rows]
+
+
+def validate_and_repair(db_file: str, sql: str, repair: Callable[[str, str, List[str]], str],
+                        max_attempts: int = 2) -> Tuple[str, Optional[str], int]:
+    """
+    Validate `sql`, asking `repair(sql, error, ddl_list)` for a corrected model
+    response up to `max_attempts` times while it does not compile.
+
+    Returns:
+        Tuple: The last SQL, its validation error (None if valid) and the
+        number of repair attempts made.
+    """
+    attempts = 0
+    while True:
+        with span("sql.validate", attempt=attempts) as attrs:
+            error = validate_sql(db_file, sql)
+            attrs["valid"] = error is None
+        if error is None or attempts >= max_attempts:
+            return sql, error, attempts
+        attempts += 1
+        with span("sql.repair", attempt=attempts, error=error[:200]):
+            repaired = extract_sql(repair(sql, error, relevant_ddl(db_file, sql)))
+        if repaired is None:
+            return sql, error, attempts
+        sql = repaired
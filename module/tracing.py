@@ -0,0 +1,329 @@
+"""
+Lightweight per-request tracing and metrics.
+
+A chat turn opens a trace with `start_trace`, and every stage inside it is
+timed with the `span` context manager (or recorded after the fact with
+`record_span`). When the trace finishes it is appended as one JSON line to the
+trace log, and each span duration is added to a Prometheus histogram served on
+a local endpoint by `start_metrics_server`.
+
+    with start_trace("chat.query", question=prompt) as trace:
+        with span("retrieval"):
+            ...
+
+Spans opened outside a trace still feed the histograms, so library code can be
+instrumented unconditionally.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+TRACE_LOG_PATH = os.environ.get("TRACE_LOG_PATH", "./data/traces/trace.jsonl")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 9464))
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+STAGE_METRIC = "insightgenix_stage_duration_seconds"
+
+_local = threading.local()
+_log_lock = threading.Lock()
+
+
+class Trace:
+    """
+    The spans recorded for one request, with offsets relative to its start.
+    """
+    def __init__(self, name: str, **attrs):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.attrs = attrs
+        self.timestamp = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.spans = []
+
+    def add(self, name: str, start: float, duration: float, depth: int = 0, **attrs):
+        self.spans.append({
+            "name": name,
+            "start_ms": round((start - self.start) * 1000, 3),
+            "duration_ms": round(duration * 1000, 3),
+            "depth": depth,
+            **attrs,
+        })
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "timestamp": self.timestamp,
+            "duration_ms": round((self.duration or 0) * 1000, 3),
+            "attrs": self.attrs,
+            "spans": sorted(self.spans, key=lambda s: s["start_ms"]),
+        }
+
+
+def current_trace() -> Optional[Trace]:
+    return getattr(_local, "trace", None)
+
+
+def _stack() -> list:
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+@contextmanager
+def start_trace(name: str, **attrs):
+    """
+    Open a trace for the current thread. On exit the trace is written to the
+    trace log and its total duration is recorded as a span named `name`.
+    """
+    previous = current_trace()
+    trace = Trace(name, **attrs)
+    _local.trace = trace
+    try:
+        yield trace
+    finally:
+        trace.duration = time.perf_counter() - trace.start
+        _local.trace = previous
+        metrics.observe(STAGE_METRIC, trace.duration, stage=name)
+        write_trace(trace)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Time the enclosed block as stage `name`. Extra keyword arguments are stored
+    on the span; the yielded dict can be used to add attributes from inside.
+    """
+    stack = _stack()
+    extra = dict(attrs)
+    start = time.perf_counter()
+    stack.append(name)
+    try:
+        yield extra
+    finally:
+        stack.pop()
+        record_span(name, time.perf_counter() - start, start=start, depth=len(stack), **extra)
+
+
+def record_span(name: str, duration: float, start: float = None, depth: int = None, **attrs):
+    """
+    Record a stage that was timed by the caller (e.g. time to first token).
+    """
+    metrics.observe(STAGE_METRIC, duration, stage=name)
+    trace = current_trace()
+    if trace is not None:
+        if start is None:
+            start = time.perf_counter() - duration
+        if depth is None:
+            depth = len(_stack())
+        trace.add(name, start, duration, depth=depth, **attrs)
+
+
+def record_since_start(name: str, **attrs):
+    """
+    Record a span from the start of the current trace until now, e.g. the time
+    until the first result is shown.
+    """
+    trace = current_trace()
+    if trace is not None:
+        record_span(name, time.perf_counter() - trace.start, start=trace.start, depth=0, **attrs)
+
+
+def traced(name: str):
+    """
+    Decorator form of `span`.
+    """
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+    return decorator
+
+
+def timed_stream(stream, name: str = "llm"):
+    """
+    Pass a token stream through, recording `<name>.first_token` when the first
+    chunk arrives and `<name>.stream` when the stream is exhausted or closed.
+    Closing this generator closes `stream` too.
+    """
+    start = time.perf_counter()
+    first = True
+    tokens = 0
+    try:
+        for chunk in stream:
+            if first:
+                record_span(f"{name}.first_token", time.perf_counter() - start, start=start)
+                first = False
+            tokens += 1
+            yield chunk
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+        record_span(f"{name}.stream", time.perf_counter() - start, start=start, chunks=tokens)
+
+
+def write_trace(trace: Trace, path: str = None):
+    path = path or TRACE_LOG_PATH
+    if not path:
+        return
+    line = json.dumps(trace.to_dict(), ensure_ascii=False, default=str)
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with _log_lock:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+    except OSError:
+        # Tracing must never break a request
+        pass
+
+
+class Metrics:
+    """
+    Minimal in-process registry of histograms, counters and gauges rendered in
+    the Prometheus text exposition format.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist["counts"][i] += 1
+            hist["sum"] += value
+            hist["count"] += 1
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    @staticmethod
+    def _labels(labels: tuple, extra: str = "") -> str:
+        parts = [f'{k}="{v}"' for k, v in labels]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            seen = set()
+            for (name, labels), hist in sorted(self._histograms.items()):
+                if name not in seen:
+                    lines.append(f"# TYPE {name} histogram")
+                    seen.add(name)
+                for bound, count in zip(self.buckets, hist["counts"]):
+                    le = self._labels(labels, 'le="%s"' % bound)
+                    lines.append(f"{name}_bucket{le} {count}")
+                le = self._labels(labels, 'le="+Inf"')
+                lines.append(f"{name}_bucket{le} {hist['count']}")
+                lines.append(f"{name}_sum{self._labels(labels)} {hist['sum']}")
+                lines.append(f"{name}_count{self._labels(labels)} {hist['count']}")
+            for kind, values in (("counter", self._counters), ("gauge", self._gauges)):
+                for (name, labels), value in sorted(values.items()):
+                    if name not in seen:
+                        lines.append(f"# TYPE {name} {kind}")
+                        seen.add(name)
+                    lines.append(f"{name}{self._labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+_server = None
+_server_attempted = False  # bind once per process, even when the port was taken
+_server_lock = threading.Lock()
+
+
+_health_checks = {}
+
+
+def register_health_check(name: str, check):
+    """
+    Add a readiness check served on `/ready`: `check()` returns
+    `(ready, detail)` where `detail` is JSON serialisable.
+    """
+    _health_checks[name] = check
+
+
+def health() -> Tuple[bool, dict]:
+    results = {}
+    ready = True
+    for name, check in list(_health_checks.items()):
+        ok, detail = check()
+        ready = ready and ok
+        results[name] = detail
+    return ready, {"ready": ready, "checks": results}
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.rstrip("/")
+        if path in ("", "/metrics"):
+            self._send(200, metrics.render(), "text/plain; version=0.0.4; charset=utf-8")
+        elif path == "/healthz":
+            self._send(200, json.dumps({"alive": True}), "application/json")
+        elif path == "/ready":
+            ready, detail = health()
+            self._send(200 if ready else 503, json.dumps(detail, default=str), "application/json")
+        else:
+            self.send_error(404)
+
+    def _send(self, status: int, text: str, content_type: str):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int = None, host: str = "127.0.0.1"):
+    """
+    Serve `/metrics`, `/healthz` and `/ready` on a daemon thread, once per
+    process. Returns the server, or None if the port is already taken (e.g.
+    by another worker process); a failed bind is not retried on later calls,
+    which come from every script rerun.
+    """
+    global _server, _server_attempted
+    with _server_lock:
+        if _server is not None or _server_attempted:
+            return _server
+        _server_attempted = True
+        try:
+            _server = ThreadingHTTPServer((host, METRICS_PORT if port is None else port), _MetricsHandler)
+        except OSError:
+            return None
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return _server
@@ -1,11 +1,24 @@
-from PIL import Image
+import os
+import time
+from functools import lru_cache
+
 import streamlit as st
 
+
+@lru_cache(maxsize=None)
+def page_icon():
+    # Decoded once per process instead of on every rerun of every page
+    from PIL import Image
+
+    # Relative to the repository rather than the working directory
+    im = Image.open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "components", "sql.ico"))
+    im.load()
+    return im
+
 # Define a function to set up the Streamlit page configuration
-# @st.cache_data
 def setup_page():
     PAGE_TITLE = "InsightGenix"
-    im = Image.open("./components/sql.ico")
+    im = page_icon()
     # Initialize the Streamlit page with wide layout
     st.set_page_config(page_title=PAGE_TITLE,
                         page_icon=im, 
@@ -38,6 +51,69 @@ def chatbot_sidebar():
             "and suggestions. Engage with us on GitHub to shape its future."
         )
         st.markdown("Crafted with care by [![Open in GitHub](https://img.shields.io/badge/GitHub-deBUGger404-blue?style=for-the-badge&logo=github&logoColor=white)](https://github.com/deBUGger404)")
+        st.toggle("Show performance", key="show_performance",
+                  help="Show a per-stage timing waterfall under each assistant message.")
+
+def performance_expander(trace: dict):
+    # Waterfall of the stages recorded for one chat turn
+    with st.expander(f"performance · {trace['duration_ms']:.0f} ms"):
+        spans = [
+            {
+                "stage": ("  " * s["depth"]) + s["name"],
+                "start_ms": s["start_ms"],
+                "end_ms": s["start_ms"] + s["duration_ms"],
+                "duration_ms": s["duration_ms"],
+            }
+            for s in trace["spans"]
+        ]
+        if not spans:
+            st.caption("No stages were recorded for this turn.")
+            return
+        st.vega_lite_chart(
+            {
+                "data": {"values": spans},
+                "mark": {"type": "bar", "tooltip": True},
+                "encoding": {
+                    "y": {"field": "stage", "type": "nominal", "sort": None, "title": None},
+                    "x": {"field": "start_ms", "type": "quantitative", "title": "ms"},
+                    "x2": {"field": "end_ms"},
+                },
+            },
+            use_container_width=True,
+        )
+        # Both measured from the start of the turn
+        marks = []
+        for name, label in (("llm.first_token", "first token"), ("turn.first_result", "first result")):
+            s = next((s for s in trace["spans"] if s["name"] == name), None)
+            if s is not None:
+                marks.append(f"{label}: {s['start_ms'] + s['duration_ms']:.0f} ms")
+        st.caption(" · ".join(marks + [f"trace id: {trace['trace_id']}"]))
+
+def job_status(job: dict, queue=None, label: str = None):
+    # Progress of a background job, with a Cancel button while it is queued or running
+    label = label or job["kind"].capitalize()
+    if job["status"] in ("queued", "running"):
+        done = f" ({job['progress']}/{job['total']})" if job["total"] else ""
+        text = f"{label}: {job['message'] or job['status']}{done}"
+        if job["total"]:
+            st.progress(min(1.0, job["progress"] / job["total"]), text=text)
+        else:
+            st.caption(text)
+        if queue is not None and st.button("Cancel", key=f"cancel-{job['id']}"):
+            queue.cancel(job["id"])
+            st.rerun()
+    elif job["status"] == "failed":
+        st.error(f"{label} failed: {job['error']}")
+    elif job["status"] == "cancelled":
+        st.caption(f"{label}: cancelled")
+    else:
+        st.caption(f"{label}: done")
+
+def poll_jobs(jobs: list, interval: float = 1.0):
+    # Rerun the page while a job is active, so it shows progress without blocking on the work
+    if any(job is not None and job["status"] in ("queued", "running") for job in jobs):
+        time.sleep(interval)
+        st.rerun()
 
 def setup_bot_sidebar():
     with st.sidebar:
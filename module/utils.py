@@ -1,13 +1,30 @@
+import hashlib
+import io
 import os
+import re
 import shutil
-import sqlite3
-from typing import Tuple
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Optional, Tuple
 import uuid
-import pandas as pd
 from dotenv import load_dotenv
 import streamlit as st
-from openai import AzureOpenAI
-from chroma_db.chroma_vector import ChromaDB_VectorStore
+from chroma_db.registry import StoreCache, StoreRegistry
+from chroma_db.store_server import RemoteVectorStore, StoreClient
+from module.engines import TABLE_NAME, duckdb_available, get_engine
+from module.jobs import JobCancelled, JobQueue
+from module.query_plan import cache_table_stats
+from module.tracing import span
+from module.warmup import readiness, start_warmup, warm_database, warm_vector_store
+from openai_llm.base import ChatProvider
+from openai_llm.providers import get_chat_provider
+from openai_llm.rate_limit import BACKGROUND, request_priority
+
+# pandas, sqlalchemy and chromadb are imported by the functions that need them,
+# so loading this module (every page does) stays cheap
+if TYPE_CHECKING:
+    import pandas as pd
+    from chroma_db.chroma_vector import ChromaDB_VectorStore
 
 def load_env():
     if 'uploaded_env_file' in st.session_state:
@@ -24,6 +41,10 @@ def get_openai_config() -> dict:
     api_version = os.environ.get("OPENAI_API_VERSION")
     embedding_model_name = os.environ.get("EMBEDDING_MODEL_NAME")
     chat_model_name = os.environ.get("CHAT_MODEL_NAME")
+    # "azure" (default) or "local" for the offline deterministic backend
+    llm_provider = os.environ.get("LLM_PROVIDER", "azure")
+    # embeddings can additionally run in-process with "onnx"
+    embedding_provider = os.environ.get("EMBEDDING_PROVIDER", llm_provider)
 
     config = {
         "api_key": api_key,
@@ -31,7 +52,48 @@ def get_openai_config() -> dict:
         "api_type": api_type,
         "api_version": api_version,
         "chat_model_name": chat_model_name,
-        "embedding_model_name": embedding_model_name
+        "embedding_model_name": embedding_model_name,
+        "llm_provider": llm_provider,
+        "embedding_provider": embedding_provider,
+        "local_first_token_latency": float(os.environ.get("LOCAL_FIRST_TOKEN_LATENCY", 0)),
+        "local_token_latency": float(os.environ.get("LOCAL_TOKEN_LATENCY", 0)),
+        "local_embedding_latency": float(os.environ.get("LOCAL_EMBEDDING_LATENCY", 0)),
+        "onnx_model_path": os.environ.get("ONNX_MODEL_PATH"),
+        # Per-deployment budgets shared by all sessions of the process (0 = unlimited)
+        "chat_rpm": float(os.environ.get("CHAT_RPM", 0)),
+        "chat_tpm": float(os.environ.get("CHAT_TPM", 0)),
+        "embedding_rpm": float(os.environ.get("EMBEDDING_RPM", 0)),
+        "embedding_tpm": float(os.environ.get("EMBEDDING_TPM", 0)),
+        "llm_max_retries": int(os.environ.get("LLM_MAX_RETRIES", 5)),
+        # Cross-session batching of small embedding requests (0 disables it)
+        "embedding_batch_window_ms": float(os.environ.get("EMBEDDING_BATCH_WINDOW_MS", 5)),
+        "embedding_max_batch": int(os.environ.get("EMBEDDING_MAX_BATCH", 64)),
+        # Unix socket of a store server owning the vector stores (multi-process deployments)
+        "store_server": os.environ.get("STORE_SERVER"),
+        # What to do with generated SQL whose plan looks expensive: warn, limit, confirm or off
+        "query_cost_policy": os.environ.get("QUERY_COST_POLICY", "limit"),
+        "query_row_limit": int(os.environ.get("QUERY_ROW_LIMIT", 1000)),
+        "large_table_rows": int(os.environ.get("LARGE_TABLE_ROWS", 100000)),
+        # Times the model is asked to fix generated SQL that does not compile
+        "sql_repair_attempts": int(os.environ.get("SQL_REPAIR_ATTEMPTS", 2)),
+        # Seconds after which a chat query / a full-result download is interrupted (0 for no limit)
+        "query_timeout": float(os.environ.get("QUERY_TIMEOUT", 60)),
+        "export_timeout": float(os.environ.get("EXPORT_TIMEOUT", 600)),
+        # Seconds after their last download that the export files of a session are removed
+        "export_max_age": float(os.environ.get("EXPORT_MAX_AGE", 3600)),
+        # Engine of Parquet uploads: "duckdb" queries the file in place, "sqlite" converts it
+        "parquet_engine": os.environ.get("PARQUET_ENGINE", "duckdb"),
+        # Text columns with at most this many distinct values are resolvable from questions (0 disables it)
+        "value_index_max_distinct": int(os.environ.get("VALUE_INDEX_MAX_DISTINCT", 5000)),
+        # Approximate tokens of the result digest sent with `insight:` questions
+        "insight_token_budget": int(os.environ.get("INSIGHT_TOKEN_BUDGET", 1500)),
+        # Background warm-up of vector indexes, database pages and clients
+        "warmup": os.environ.get("WARMUP", "1").lower() not in ("0", "false", "no"),
+        "warmup_prefetch_mb": int(os.environ.get("WARMUP_PREFETCH_MB", 256)),
+        # Items re-embedded per call when a store is rebuilt for a new embedding model
+        "reindex_batch_size": int(os.environ.get("REINDEX_BATCH_SIZE", 256)),
+        # Threads running background jobs (uploads, profiling, training, re-indexing)
+        "job_workers": int(os.environ.get("JOB_WORKERS", 2)),
     }
     return config
     
@@ -55,37 +117,99 @@ def find_latest_folder(db_path: str):
     #print(f"Latest directory: {latest_directory}")
     return latest_directory
 
-def init_chromadb(config: dict, db_path: str = './data/db_data/') -> Tuple:
+# Vector stores opened by this server process, shared by every session
+_store_cache = StoreCache()
+_registries = {}
+_store_clients = {}
+_process_warmup_lock = threading.Lock()
+_process_store = None  # store warmed at process start, "" when there is none
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_store_registry(db_path: str = './data/db_data/') -> StoreRegistry:
+    if db_path not in _registries:
+        _registries[db_path] = StoreRegistry(db_path)
+    return _registries[db_path]
+
+
+def get_store_client(address: str) -> StoreClient:
+    if address not in _store_clients:
+        _store_clients[address] = StoreClient(address)
+    return _store_clients[address]
+
+
+def database_fingerprint(db_file_path: Optional[str]) -> Optional[str]:
+    """
+    Fingerprint of an uploaded database: a hash of its schema, so the same
+    dataset uploaded again maps to the same vector store.
+
+    Returns:
+        Optional[str]: Hex digest, or None when no database is uploaded.
     """
-    Initialize a new ChromaDB instance or return the existing instance.
+    if not db_file_path or not os.path.exists(db_file_path):
+        return None
+    from module.value_index import INDEX_PREFIX
+
+    # Indexes the upload adds for the value dictionary are not part of the user's schema
+    rows = [row for row in get_engine(db_file_path).schema(db_file_path)
+            if not (row[0] == "index" and row[1].startswith(INDEX_PREFIX))]
+    digest = hashlib.sha256()
+    for row in rows:
+        digest.update("\x1f".join(row).encode("utf-8"))
+        digest.update(b"\x1e")
+    return digest.hexdigest()
+
+
+def init_chromadb(config: dict, db_path: str = './data/db_data/', fingerprint: Optional[str] = None) -> Tuple:
+    """
+    Return the ChromaDB instance bound to a database fingerprint, opening it
+    (or creating a new one) if needed.
 
     Parameters:
         config (dict): Configuration dictionary containing OpenAI settings.
         db_path (str): Path to the database directory.
+        fingerprint (str): Fingerprint of the uploaded database, see `database_fingerprint`.
 
     Returns:
         Tuple: A tuple containing the ChromaDB instance and the database name.
     """
-    # Check if the data folder exists and create it if not
-    os.makedirs(db_path, exist_ok=True)
-    latest_folder = find_latest_folder(db_path)
-    #print('latest_folder',latest_folder)
-    # Check if the folder is empty
-    if latest_folder:
-        # If not empty, read from the latest file
-        db_path = os.path.join(db_path, latest_folder)
-        #print(f"Reading from existing database: {latest_folder}")
-    else:
-        # If empty, create a new database file
-        new_db_name = 'chroma_database_' + str(uuid.uuid4())
-        db_path = os.path.join(db_path, new_db_name)
-        # Ensure the new database directory exists
-        os.makedirs(db_path, exist_ok=True)
-        #print(f"Creating new database: {new_db_name}")
+    if config.get('store_server'):
+        client = get_store_client(config['store_server'])
+        name = client.resolve(fingerprint)
+        return client.store(name), name
+
+    registry = get_store_registry(db_path)
+    name = registry.resolve(fingerprint)['name']
+    db = open_chromadb(config, name, db_path)
+    registry.touch(name, items=db.count_training_data(), embedding_model=db.embedding_model)
+    return db, name
 
-    # Initialize a new ChromaDB instance with the provided configuration
-    db = ChromaDB_VectorStore(config={'path': db_path, **config})
-    return db, os.path.basename(db_path)
+
+def open_chromadb(config: dict, name: str, db_path: str = './data/db_data/') -> "ChromaDB_VectorStore":
+    """
+    Return the open vector store `name` from the process cache; it is loaded
+    lazily on first use and closed again once idle.
+    """
+    if config.get('store_server'):
+        return get_store_client(config['store_server']).store(name)
+    from chroma_db.chroma_vector import ChromaDB_VectorStore
+
+    return _store_cache.get(name, get_store_registry(db_path).path(name), config,
+                            lambda store_config: ChromaDB_VectorStore(config=store_config))
+
+
+@contextmanager
+def lease_chromadb(config: dict, name: str, db_path: str = './data/db_data/'):
+    """`open_chromadb` for background jobs: the store stays open until the block ends."""
+    if config.get('store_server'):
+        yield get_store_client(config['store_server']).store(name)
+        return
+    from chroma_db.chroma_vector import ChromaDB_VectorStore
+
+    with _store_cache.lease(name, get_store_registry(db_path).path(name), config,
+                            lambda store_config: ChromaDB_VectorStore(config=store_config)) as db:
+        yield db
 
 
 def reset_chromadb(db_path: str = './data/db_data/') -> None:
@@ -98,67 +222,321 @@ def reset_chromadb(db_path: str = './data/db_data/') -> None:
     """
     # Delete existing database directory if it exists in session state
     if 'db_name' in st.session_state:
-        existing_db_path = os.path.join(db_path, st.session_state.db_name)
-        if os.path.exists(existing_db_path):
-            shutil.rmtree(existing_db_path)
-            #print(f"Deleted existing database: {st.session_state.db_name}")
-            # Also remove the db and db_name from session state
-            del st.session_state['db_name']
-            if 'db' in st.session_state:
-                del st.session_state['db']
+        if isinstance(st.session_state.get('db'), RemoteVectorStore):
+            # The store server owns the files
+            st.session_state.db.drop()
+        else:
+            _store_cache.evict(st.session_state.db_name)
+            get_store_registry(db_path).remove(st.session_state.db_name)
+            existing_db_path = os.path.join(db_path, st.session_state.db_name)
+            if os.path.exists(existing_db_path):
+                shutil.rmtree(existing_db_path)
+                #print(f"Deleted existing database: {st.session_state.db_name}")
+        # Also remove the db and db_name from session state
+        del st.session_state['db_name']
+        if 'db' in st.session_state:
+            del st.session_state['db']
+
+def warm_up_process(config: dict, db_path: str = './data/db_data/'):
+    """
+    Once per server process: create the chat client and warm the most recently
+    used vector store in the background. Components that failed (e.g. the
+    client before credentials were uploaded) are tried again on the next call.
+    """
+    global _process_store
+    if not config.get('warmup', True):
+        return
+    with _process_warmup_lock:
+        if _process_store is None:
+            stores = [] if config.get('store_server') else get_store_registry(db_path).list_stores()
+            _process_store = stores[0]['name'] if stores else ""
+        tasks = []
+        if readiness.state("clients") in (None, "failed"):
+            tasks.append(("clients", lambda: get_chat_client(config)))
+        name = _process_store
+        if name and readiness.state(f"store:{name}") in (None, "failed"):
+            tasks.append((f"store:{name}", lambda: warm_vector_store(open_chromadb(config, name, db_path))))
+        if tasks:
+            start_warmup(tasks)
+
+def warm_up_dataset(config: dict, db, db_name: str, db_file_path: Optional[str]):
+    """
+    Warm the store and database a session just switched to, unless another
+    session already did.
+    """
+    if not config.get('warmup', True):
+        return
+    tasks = []
+    if readiness.state(f"store:{db_name}") not in ("warming", "ready"):
+        tasks.append((f"store:{db_name}", lambda: warm_vector_store(db)))
+    if db_file_path and readiness.state(f"database:{db_file_path}") not in ("warming", "ready"):
+        prefetch = config.get('warmup_prefetch_mb', 256) * 1024 * 1024
+        tasks.append((f"database:{db_file_path}", lambda: warm_database(db_file_path, prefetch)))
+    if tasks:
+        start_warmup(tasks)
+
+def start_store_reindex(config: dict, db, db_name: str):
+    """
+    Re-embed a store whose embedding model changed, as a background job; it
+    keeps answering from its current index until the rebuilt one is swapped in.
+    """
+    if isinstance(db, RemoteVectorStore):
+        return  # the store server re-indexes the stores it opens
+    if db.reindex_required:
+        get_job_queue(config).submit("reindex", {"store": db_name}, key=f"reindex:{db_name}", scope=db_name)
 
 def init_season(config: dict):
-    # Initialize and store the DB in session state if it's not already done
-    
-    if 'db' not in st.session_state or 'db_name' not in st.session_state:
-        #print('here i am ')
-        st.session_state.db, st.session_state.db_name = init_chromadb(config=config)
+    # Bind the session to the vector store of the uploaded database. Switching
+    # datasets only re-resolves the store; opened stores are shared across sessions.
+    warm_up_process(config)
+    fingerprint = database_fingerprint(st.session_state.get('db_file_path'))
+    if ('db' not in st.session_state or 'db_name' not in st.session_state
+            or st.session_state.get('db_fingerprint') != fingerprint):
+        st.session_state.db, st.session_state.db_name = init_chromadb(config=config, fingerprint=fingerprint)
+        st.session_state.db_fingerprint = fingerprint
+        warm_up_dataset(config, st.session_state.db, st.session_state.db_name, st.session_state.get('db_file_path'))
+        start_store_reindex(config, st.session_state.db, st.session_state.db_name)
         st.session_state.openai_key = config['api_key']
         st.session_state.chat_model_name = config['chat_model_name']
         #print(f'Database setup done: {st.session_state.db_name}')
+    elif not isinstance(st.session_state.db, RemoteVectorStore):
+        # The shared cache may have closed an idle store since the last rerun
+        st.session_state.db = open_chromadb(config, st.session_state.db_name)
+        start_store_reindex(config, st.session_state.db, st.session_state.db_name)
     
-def query_to_dataframe(db_file: str, query: str) -> pd.DataFrame:
+def query_to_dataframe(db_file: str, query: str, timeout: float = None) -> "pd.DataFrame":
     """
-    Retrieve data from an SQLite database file and convert it into a DataFrame.
+    Run a query against an uploaded dataset and convert the result into a DataFrame.
 
     Parameters:
-        db_file (str): Path to the SQLite database file.
-        query (str): SQL query to execute.
+        db_file (str): Path to the SQLite database or Parquet file.
+        query (str): SQL query to execute, in the dialect of the file's engine.
+        timeout (float): Seconds after which the query is interrupted (None for no limit).
 
     Returns:
         pd.DataFrame: DataFrame containing the fetched data.
     """
+    engine = get_engine(db_file)
+    with engine.connect(db_file, timeout=timeout) as conn:
+        # Execute SQL query and fetch the results
+        with span("sql.execute", engine=engine.name):
+            cursor = conn.execute(query)
+            data = engine.fetch(cursor)
+
+        # Get column names from cursor description
+        columns = [description[0] for description in cursor.description]
+
+        with span("sql.materialize", rows=len(data)):
+            df = engine.to_dataframe(data, columns)
 
-    # Connect to SQLite database
-    conn = sqlite3.connect(db_file)
-    
-    # Create a cursor object
-    cursor = conn.cursor()
-    
-    # Execute SQL query and fetch the results
-    cursor.execute(query)
-    data = cursor.fetchall()
-    
-    # Get column names from cursor description
-    columns = [description[0] for description in cursor.description]
-    
-    # Create DataFrame from fetched data and column names
-    df = pd.DataFrame(data, columns=columns)
-    
-    # Close cursor and connection
-    cursor.close()
-    conn.close()
-    
     return df
 
-def azure_openai(config: dict):
-    
-    client = AzureOpenAI(
-        api_key= config['api_key'],  
-        api_version= config['api_version'],
-        azure_endpoint = config['api_base']
-        )
-    return client
+def convert_and_save_file(uploaded_file, file_type: str, upload_dir: str = './uploaded_data',
+                          parquet_engine: str = 'duckdb', max_distinct_values: int = 5000) -> str:
+    """
+    Store an uploaded file as a queryable dataset: Parquet files are kept as
+    they are and queried in place by DuckDB (unless `parquet_engine` is
+    "sqlite" or DuckDB is not installed); everything else becomes a SQLite database.
+
+    Parameters:
+        uploaded_file: File-like object (Streamlit UploadedFile, BytesIO, ...).
+        file_type (str): One of "db", "sqlite", "xlsx" or "parquet".
+        upload_dir (str): Directory the database file is written to.
+        parquet_engine (str): "duckdb" or "sqlite".
+        max_distinct_values (int): Text columns with at most this many distinct values
+            go into the value dictionary (see `module.value_index`); 0 disables it.
+
+    Returns:
+        str: Path to the SQLite database or Parquet file.
+    """
+    os.makedirs(upload_dir, exist_ok=True)
+
+    if file_type == "parquet" and parquet_engine == "duckdb" and duckdb_available():
+        db_file_path = os.path.join(upload_dir, f"{uuid.uuid4()}.parquet")
+        with open(db_file_path, "wb") as f:
+            f.write(uploaded_file.getvalue())
+        try:
+            # Reads the footer only; rejects files that are not Parquet
+            get_engine(db_file_path).schema(db_file_path)
+        except Exception:
+            os.remove(db_file_path)
+            raise
+        build_values(db_file_path, max_distinct_values, create_indexes=False)
+        cache_table_stats(db_file_path)
+        return db_file_path
+
+    db_file_path = os.path.join(upload_dir, f"{uuid.uuid4()}.db")
+    if file_type in ["db", "sqlite"]:
+        with open(db_file_path, "wb") as f:
+            f.write(uploaded_file.getvalue())
+    else:
+        import pandas as pd
+        from sqlalchemy import create_engine
+
+        if file_type == "xlsx":
+            df = pd.read_excel(uploaded_file)
+        elif file_type == "parquet":
+            df = pd.read_parquet(uploaded_file)
+        else:
+            raise ValueError(f"Unsupported file type: {file_type}")
+
+        engine = create_engine(f'sqlite:///{db_file_path}')
+        df.to_sql(name=TABLE_NAME, con=engine, index=False, if_exists="replace")
+        engine.dispose()
+
+    # Only databases converted here are indexed; uploaded ones keep their schema
+    build_values(db_file_path, max_distinct_values, create_indexes=file_type not in ["db", "sqlite"])
+    # Row counts used by the query cost gate
+    cache_table_stats(db_file_path)
+    return db_file_path
+
+def build_values(db_file_path: str, max_distinct_values: int, create_indexes: bool, progress=None):
+    # Value dictionary used to resolve question terms to stored values
+    if max_distinct_values > 0:
+        from module.value_index import build_value_index
+
+        with span("upload.values"):
+            build_value_index(db_file_path, max_distinct=max_distinct_values, create_indexes=create_indexes,
+                              progress=progress)
+
+def upload_scope() -> str:
+    """
+    Job scope of the uploads of this browser session. Its id is kept in the
+    URL, so a refreshed page finds its uploads again while other visitors
+    never see them.
+    """
+    owner = st.session_state.get('upload_owner') or st.query_params.get('owner', '')
+    if not re.fullmatch(r"[0-9a-f]{32}", owner):
+        owner = uuid.uuid4().hex
+    st.session_state.upload_owner = owner
+    if st.query_params.get('owner') != owner:
+        st.query_params['owner'] = owner
+    return f"datasets:{owner}"
+
+def stage_upload(uploaded_file, upload_dir: str = './uploaded_data') -> str:
+    """
+    Write an uploaded file under `upload_dir/staging`, where an ingest job
+    reads it even after the session that uploaded it is gone.
+    """
+    staging_dir = os.path.join(upload_dir, 'staging')
+    os.makedirs(staging_dir, exist_ok=True)
+    path = os.path.join(staging_dir, f"{uuid.uuid4()}{os.path.splitext(uploaded_file.name)[1].lower()}")
+    with open(path, "wb") as f:
+        f.write(uploaded_file.getvalue())
+    return path
+
+def ingest_job(job, path: str, file_type: str, file_name: str = None, upload_dir: str = './uploaded_data',
+               parquet_engine: str = 'duckdb', max_distinct_values: int = 5000) -> dict:
+    """
+    Store a staged upload as a queryable dataset, then queue its profiling.
+    A resumed job reuses the dataset converted before the interruption.
+    """
+    db_file_path = (job.checkpoint or {}).get("db_file_path")
+    if not db_file_path or not os.path.exists(db_file_path):
+        job.progress(0, 2, "Converting")
+        with open(path, "rb") as f:
+            uploaded = io.BytesIO(f.read())
+        # The value dictionary is built by the profiling job, so the dataset can be queried sooner
+        db_file_path = convert_and_save_file(uploaded, file_type, upload_dir=upload_dir,
+                                             parquet_engine=parquet_engine, max_distinct_values=0)
+        job.save_checkpoint({"db_file_path": db_file_path})
+    try:
+        job.progress(1, 2, "Queueing profiling")
+    except JobCancelled:
+        for leftover in (db_file_path, db_file_path + '.stats.json', path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+    profile = job.submit("profile", {"db_file_path": db_file_path, "max_distinct_values": max_distinct_values,
+                                     "create_indexes": file_type not in ["db", "sqlite"]
+                                     and not db_file_path.endswith(".parquet")},
+                         key=f"profile:{db_file_path}")
+    if os.path.exists(path):
+        os.remove(path)
+    job.progress(2, 2, "Done")
+    return {"db_file_path": db_file_path, "file_name": file_name, "profile_job": profile}
+
+def profile_job(job, db_file_path: str, max_distinct_values: int = 5000, create_indexes: bool = False) -> dict:
+    """Value dictionary of an uploaded dataset (its row counts are taken at conversion)."""
+    job.progress(0, None, "Building the value dictionary")
+    build_values(db_file_path, max_distinct_values, create_indexes,
+                 progress=lambda done, total: job.progress(done, total))
+    return {"db_file_path": db_file_path}
+
+def train_job(job, store: str, type: str, items: list, checkpoint_every: int = 10) -> dict:
+    """
+    Train the vector store `store` with `items` of `type` ("ddl", "sql" or
+    "documentation"), resuming after the last checkpointed item.
+    """
+    config = get_openai_config()
+    with lease_chromadb(config, store) as db:
+        state = job.checkpoint or {"done": 0, "before": db.count_training_data()}
+        # Training yields the shared LLM rate limit to chat turns
+        with request_priority(BACKGROUND):
+            for start in range(state["done"], len(items), checkpoint_every):
+                for item in items[start:start + checkpoint_every]:
+                    db.train(**{type: item})
+                state["done"] = min(len(items), start + checkpoint_every)
+                job.save_checkpoint(state)
+                job.progress(state["done"], len(items))
+        # Content already in the store is not stored (or embedded) again
+        added = db.count_training_data() - state["before"]
+    return {"items": len(items), "added": added}
+
+def import_job(job, store: str, path: str) -> dict:
+    """Import a training data file written by `export_training_data` into `store`."""
+    from chroma_db.transfer import import_training_data
+
+    state = job.checkpoint or {"items": 0, "counts": {}}
+
+    def progress(items, counts):
+        job.save_checkpoint({"items": items, "counts": {name: state["counts"].get(name, 0) + count
+                                                        for name, count in counts.items()}})
+        job.progress(items, None, f"{items} items imported")
+
+    with lease_chromadb(get_openai_config(), store) as db, request_priority(BACKGROUND):
+        counts = import_training_data(db, path, skip=state["items"], progress=progress)
+    os.remove(path)
+    return {name: state["counts"].get(name, 0) + count for name, count in counts.items()}
+
+def reindex_job(job, store: str) -> dict:
+    """Re-embed `store` with its configured embedding model (see `chroma_db.reindex`)."""
+    from chroma_db.reindex import reindex_store
+
+    config = get_openai_config()
+    with lease_chromadb(config, store) as db, request_priority(BACKGROUND):
+        result = reindex_store(db, batch_size=config.get('reindex_batch_size', 256), progress=job.progress)
+    if result["status"] == "done":
+        get_store_registry().touch(store, embedding_model=db.embedding_model)
+    return result
+
+JOB_HANDLERS = {"ingest": ingest_job, "profile": profile_job, "train": train_job, "import": import_job,
+                "reindex": reindex_job}
+
+def get_job_queue(config: dict = None, path: str = './data/jobs.sqlite') -> JobQueue:
+    """
+    The background job queue of this server process, started on first use;
+    jobs left unfinished by a previous process are picked up again then.
+    """
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue(path, JOB_HANDLERS, workers=(config or {}).get('job_workers', 2))
+        return _job_queue
+
+def get_chat_client(config: dict) -> ChatProvider:
+    """
+    Return the chat provider selected by the config ("azure" or "local").
+    """
+    return get_chat_provider(config=config)
+
+def stream_to_text(response) -> str:
+    """
+    Normalise the value returned by `st.write_stream` to the streamed text.
+    """
+    if isinstance(response, str):
+        return response
+    return "".join(part for part in response if isinstance(part, str))
 
 def str_to_approx_token_count(string: str) -> int:
         return len(string) / 4
@@ -198,6 +576,14 @@ def add_documentation_to_prompt(
 
         return initial_prompt
 
+def add_value_hints_to_prompt(value_hints: dict) -> str:
+    if not value_hints:
+        return ''
+    lines = [f"- {table}.{column}: " + ", ".join("'" + value.replace("'", "''") + "'" for value in values)
+             for (table, column), values in value_hints.items()]
+    return ("\n**Matching values:** the question refers to these values stored in the database:\n"
+            + "\n".join(lines) + "\n")
+
 def system_message( message: str) -> any:
         return {"role": "system", "content": message}
 
@@ -211,6 +597,8 @@ def get_sql_prompt(
         question_sql_list: list,
         ddl_list: list,
         doc_list: list,
+        dialect: str = "SQLite",
+        value_hints: dict = None,
         **kwargs,
     ):
         """
@@ -232,6 +620,8 @@ def get_sql_prompt(
             question_sql_list (list): A list of questions and their corresponding SQL statements.
             ddl_list (list): A list of DDL statements.
             doc_list (list): A list of documentation.
+            dialect (str): SQL dialect of the engine the query runs on ("SQLite" or "DuckDB").
+            value_hints (dict): Stored values the question refers to, per (table, column).
 
         Returns:
             any: The prompt for the LLM to generate SQL.
@@ -241,12 +631,13 @@ As an SQL Expert named QueryGenix., your primary task is to generate Always SELE
 Your goal is to give correct, executable sql query to users.
 Your responses should exclusively consist of SQL code, without any explanatory text. 
 You are given one table, the table name/column names are in DDL and documentation of table and columns is on Documentation
+The database engine is {dialect}: write every query in the {dialect} SQL dialect, using only functions it supports.
 Use insights from past queries to guide your current responses.
 
 **DDL:** {ddl}
 
 **Documentation:** <documentation>{document}</documentation>
-
+{values}
 Here are 6 critical rules for the interaction you must abide:
 <rules>
 1. You MUST MUST wrap the generated sql code within ``` sql code markdown in this format e.g
@@ -257,6 +648,7 @@ Here are 6 critical rules for the interaction you must abide:
 - For string/text searches, Always, adhere to the following practices,
    - Perform case-insensitive comparisons by using the `LOWER()` function to ensure uniformity in string comparison (e.g., LOWER(name) like %her2%).
    - Utilize the LIKE operator with wildcard characters (%) for partial matches, enabling fuzzy searching within text fields. This is particularly useful when an exact match for the input term might not exist in the database/documentation.
+   - When **Matching values** lists stored values for a term, filter on exactly those values with `column IN ('value', ...)` instead of LIKE.
 - Construct a single, comprehensive SQL query per user request.
 - Strictly use table names and columns as outlined in the provided DDL statements. Do not introduce or assume the existence of tables or columns not specified in these statements.
 - Analyze the context within user queries and the documentation provided to craft precise SQL code. Modify condition values and the query's logic based on the **DDL/DOCUMENTATION** to ensure the generated SQL accurately captures the required data.
@@ -301,7 +693,8 @@ LIMIT 10;
             doc_list, max_tokens=14000
         )
 
-        initial_prompt1 = initial_prompt.format(ddl=ddl_prompt, document=doc_prompt)    
+        initial_prompt1 = initial_prompt.format(ddl=ddl_prompt, document=doc_prompt, dialect=dialect,
+                                              values=add_value_hints_to_prompt(value_hints))    
 
         message_log = [system_message(initial_prompt1)]
 
@@ -318,17 +711,35 @@ LIMIT 10;
 
         return message_log
 
-def get_relevent_prompt(question: str, db):
+def get_repair_prompt(question: str, sql: str, error: str, ddl_list: list, dialect: str = "SQLite") -> list:
+    """
+    Compact prompt asking the model to fix a query that failed validation: the
+    question, the failing SQL, the compiler error and only the DDL involved.
+    """
+    system = (f"You fix {dialect} queries. Reply with only the corrected SELECT query "
+              "in a ```sql\n<sql code>\n``` block.\n\n**DDL:** " + add_ddl_to_prompt(ddl_list, max_tokens=4000))
+    user = f"Question: {question}\n\n```sql\n{sql}\n```\n\nError: {error}"
+    return [system_message(system), user_message(user)]
+
+def get_relevent_prompt(question: str, db, dialect: str = "SQLite", value_hints: dict = None):
     # question = "update me about the top 100 data where Modality should be Peptide"
-    question_sql_list = db.get_similar_question_sql(question)
-    ddl_list = db.get_related_ddl(question)
-    doc_list = db.get_related_documentation(question)
-    prompt = get_sql_prompt(
-            question=question,
-            question_sql_list=question_sql_list,
-            ddl_list=ddl_list,
-            doc_list=doc_list,
-        )
+    with span("retrieval"):
+        # The question is embedded at most once across the three collections,
+        # and not at all when the lexical index answers confidently
+        question_sql_list = db.get_similar_question_sql(question)
+        # Wide schemas are pruned to the columns the question needs, keeping
+        # the ones whose stored values it mentions
+        ddl_list = db.get_related_schema(question, columns=list(value_hints or {}))
+        doc_list = db.get_related_documentation(question)
+    with span("prompt.assemble"):
+        prompt = get_sql_prompt(
+                question=question,
+                question_sql_list=question_sql_list,
+                ddl_list=ddl_list,
+                doc_list=doc_list,
+                dialect=dialect,
+                value_hints=value_hints,
+            )
     return prompt
 
 def main_sys_prompt():
@@ -0,0 +1,242 @@
+"""
+Value dictionary of the uploaded dataset, for resolving question terms to
+stored values.
+
+At upload, `build_value_index` collects the distinct values of every text
+column with at most `max_distinct` of them (categories, names, codes; free
+text columns are skipped) and stores them next to the database
+(`<db>.values.json`). Converted SQLite databases also get an index on each of
+these columns, so an equality predicate on them is a search instead of a scan.
+
+Before SQL generation, `resolve_values` maps the question onto that dictionary
+through a trigram index:
+
+- a value whose trigrams are (mostly) found in the question is matched when a
+  window of question words of about its length is similar enough to it, so
+  "her2 postive" still finds "her2 positive";
+- a distinctive question word that is a whole word of a few values of a
+  column (e.g. "her2") matches those values.
+
+The matches are given to the model as hints, so it can filter with
+`column IN ('her2 positive', ...)` instead of `LIKE '%her2 positive%'`.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from chroma_db.bm25 import STOPWORDS
+from module.engines import get_engine
+
+DEFAULT_MAX_DISTINCT = 5000
+MAX_VALUE_LENGTH = 80
+INDEX_PREFIX = "insightgenix_values_"
+# Words too common in questions to pick values by
+_QUESTION_WORDS = STOPWORDS | {"all", "any", "data", "find", "get", "list", "many", "much", "records",
+                               "rows", "top", "value", "values"}
+_TEXT_TYPE_RE = re.compile(r"CHAR|TEXT|CLOB|STRING", re.IGNORECASE)
+_NORMALIZE_RE = re.compile(r"[^0-9a-z]+")
+
+_index_cache = {}
+_index_lock = threading.Lock()
+
+
+def _values_path(db_file: str) -> str:
+    return db_file + ".values.json"
+
+
+def normalize(text: str) -> str:
+    return _NORMALIZE_RE.sub(" ", text.lower()).strip()
+
+
+def trigrams(text: str) -> set:
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def build_value_index(db_file: str, max_distinct: int = DEFAULT_MAX_DISTINCT, create_indexes: bool = False,
+                      progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, int]:
+    """
+    Store the distinct values of the low and medium cardinality text columns
+    of `db_file`, and index those columns if `create_indexes` (SQLite only).
+    `progress(columns done, columns)` is called after every text column.
+
+    Returns:
+        Dict[str, int]: Number of values per "table.column".
+    """
+    engine = get_engine(db_file)
+    text_columns = [(table, column) for table in engine.tables(db_file)
+                    for column, type in engine.columns(db_file, table)
+                    if not type or _TEXT_TYPE_RE.search(type)]
+    columns = []
+    with engine.connect(db_file) as conn:
+        for done, (table, column) in enumerate(text_columns, 1):
+            # One pass that stops as soon as the column has too many values
+            values = [row[0] for row in conn.execute(
+                f"SELECT DISTINCT {_quote(column)} FROM {_quote(table)} "
+                f"WHERE {_quote(column)} IS NOT NULL LIMIT {max_distinct + 1}").fetchall()]
+            values = [value for value in values if isinstance(value, str) and normalize(value)]
+            if values and len(values) <= max_distinct:
+                values = [value for value in values if len(value) <= MAX_VALUE_LENGTH]
+                if values:
+                    columns.append({"table": table, "column": column, "values": values})
+            if progress is not None:
+                progress(done, len(text_columns))
+
+    if create_indexes and engine.name == "sqlite" and columns:
+        conn = sqlite3.connect(db_file)
+        try:
+            for entry in columns:
+                name = normalize(f"{INDEX_PREFIX}{entry['table']}_{entry['column']}").replace(" ", "_")
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {_quote(name)} "
+                             f"ON {_quote(entry['table'])} ({_quote(entry['column'])})")
+            conn.commit()
+        finally:
+            conn.close()
+
+    with open(_values_path(db_file), "w") as f:
+        json.dump({"max_distinct": max_distinct, "columns": columns}, f)
+    return {f"{entry['table']}.{entry['column']}": len(entry["values"]) for entry in columns}
+
+
+class ValueIndex:
+    """
+    Trigram and word index over the stored values of one dataset.
+    """
+    def __init__(self, columns: List[dict]):
+        self.entries: List[Tuple[str, str, str]] = []  # (table, column, value)
+        self.norms: List[str] = []
+        grams: List[set] = []
+        postings: Dict[str, List[int]] = {}
+        words: Dict[Tuple[str, str, str], List[int]] = {}
+        for entry in columns:
+            for value in entry["values"]:
+                id = len(self.entries)
+                norm = normalize(value)
+                self.entries.append((entry["table"], entry["column"], value))
+                self.norms.append(norm)
+                grams.append(trigrams(norm))
+                for gram in grams[-1]:
+                    postings.setdefault(gram, []).append(id)
+                for word in set(norm.split()):
+                    words.setdefault((word, entry["table"], entry["column"]), []).append(id)
+        self.grams = grams
+        self.sizes = np.array([len(g) for g in grams], dtype=np.float32)
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+        # word -> ids per column, for whole-word matches
+        self.words: Dict[str, List[List[int]]] = {}
+        for (word, _, _), ids in words.items():
+            self.words.setdefault(word, []).append(ids)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def resolve(self, question: str, threshold: float = 0.5, margin: float = 0.1, max_per_column: int = 10,
+                max_candidates: int = 200) -> Dict[Tuple[str, str], List[str]]:
+        """
+        Stored values the question refers to, best first, per (table, column).
+        """
+        text = normalize(question)
+        if not text or not self.entries:
+            return {}
+        words = text.split()
+        matched = {}  # id -> (score, (first, last) position of the question words it matched)
+
+        # Values most of whose trigrams occur in the question...
+        grams = [self.postings[gram] for gram in trigrams(text) if gram in self.postings]
+        if grams:
+            shared = np.bincount(np.concatenate(grams), minlength=len(self.entries))
+            containment = shared / self.sizes
+            candidates = np.flatnonzero(containment >= threshold)
+            candidates = candidates[np.argsort(-containment[candidates], kind="stable")][:max_candidates]
+            windows = {}
+            for id in candidates.tolist():
+                length = len(self.norms[id].split())
+                value_grams = self.grams[id]
+                best, term = 0.0, None
+                # ...matched against the question words around their own length
+                for size in range(max(1, length - 1), length + 2):
+                    for start in range(max(1, len(words) - size + 1)):
+                        key = (start, size)
+                        if key not in windows:
+                            windows[key] = trigrams(" ".join(words[start:start + size]))
+                        window = windows[key]
+                        shared = len(window & value_grams)
+                        similarity = shared / (len(window) + len(value_grams) - shared)
+                        if similarity > best:
+                            best, term = similarity, key
+                if best >= threshold:
+                    start, size = term
+                    matched[id] = (best, (start, start + size - 1))
+
+        # Distinctive question words naming a few values of a column
+        for position, word in enumerate(words):
+            if len(word) < 3 or word.isdigit() or word in _QUESTION_WORDS:
+                continue
+            for ids in self.words.get(word, ()):
+                if len(ids) <= max_per_column:
+                    for id in ids:
+                        matched.setdefault(id, (threshold / 2, (position, position)))
+
+        # Per column, a value is kept when it is about as good as the best value
+        # matching overlapping question words: an exact match drops its near
+        # neighbours ("disease_01" next to "disease_07") and the partial matches
+        # of its words, while other terms of the question keep their own values
+        spans = {}
+        for id, (score, span) in matched.items():
+            key = (self.entries[id][:2], span)
+            spans[key] = max(spans.get(key, 0.0), score)
+        tops = {}
+        for (column, (first, last)), score in spans.items():
+            tops[column, (first, last)] = max(other for (other_column, (start, end)), other in spans.items()
+                                              if other_column == column and start <= last and first <= end)
+        kept = {}
+        for id in sorted(matched, key=lambda id: -matched[id][0]):
+            score, span = matched[id]
+            top = tops[self.entries[id][:2], span]
+            if score >= (1.0 if top == 1.0 else top - margin):
+                kept.setdefault((self.entries[id][:2], span), []).append(self.entries[id][2])
+
+        matches = {}
+        for (column, _), values in kept.items():
+            # A term that fits many values equally ("diseases") does not pick any
+            if len(values) <= max_per_column:
+                matches.setdefault(column, []).extend(values)
+        for column in matches:
+            matches[column] = matches[column][:max_per_column]
+        return matches
+
+
+def load_value_index(db_file: str) -> Optional[ValueIndex]:
+    """
+    The value index of `db_file`, loaded once per process, or None when the
+    dataset was uploaded without one.
+    """
+    path = _values_path(db_file)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _index_lock:
+        cached = _index_cache.get(db_file)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+    with open(path) as f:
+        index = ValueIndex(json.load(f)["columns"])
+    with _index_lock:
+        _index_cache[db_file] = (mtime, index)
+    return index
+
+
+def resolve_values(db_file: Optional[str], question: str, **kwargs) -> Dict[Tuple[str, str], List[str]]:
+    """Stored values `question` refers to, per (table, column); see `ValueIndex.resolve`."""
+    index = load_value_index(db_file) if db_file else None
+    return index.resolve(question, **kwargs) if index is not None else {}
@@ -0,0 +1,117 @@
+"""
+Warm-up of the per-process resources a chat turn needs.
+
+At server start (first script run of the process) and whenever a session
+switches to another dataset, a background thread:
+
+- opens the active vector store and runs a dummy retrieval per collection,
+  which loads the HNSW indexes and initialises the embedding client,
+- reads the database schema and value dictionary and asks the OS to prefetch
+  the database file,
+- creates the chat client.
+
+Progress is tracked per component in `readiness`, exported as the
+`insightgenix_component_ready` gauge and served on `/ready` by the metrics
+server (200 once every started component is ready, 503 otherwise).
+"""
+import os
+import threading
+import time
+from typing import Callable, List, Tuple
+
+from module.engines import get_engine
+from module.tracing import metrics, record_span, register_health_check
+
+READY_METRIC = "insightgenix_component_ready"
+WARMUP_QUESTION = "warm up"
+
+
+class Readiness:
+    """
+    State of each warm-up component: "warming", "ready" or "failed".
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.components = {}
+
+    def set(self, component: str, state: str, **detail):
+        with self._lock:
+            self.components[component] = {"state": state, **detail}
+        metrics.set_gauge(READY_METRIC, 1 if state == "ready" else 0, component=component)
+
+    def state(self, component: str) -> str:
+        with self._lock:
+            return self.components.get(component, {}).get("state")
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return all(c["state"] == "ready" for c in self.components.values())
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"ready": all(c["state"] == "ready" for c in self.components.values()),
+                    "components": {name: dict(c) for name, c in self.components.items()}}
+
+
+readiness = Readiness()
+register_health_check("warmup", lambda: (readiness.ready, readiness.snapshot()))
+
+
+def warm_vector_store(db):
+    """
+    One retrieval per collection: Chroma loads the collection's HNSW index on
+    its first query, and the question embedding initialises the embedding client.
+    """
+    db.get_similar_question_sql(WARMUP_QUESTION)
+    db.get_related_schema(WARMUP_QUESTION)
+    db.get_related_documentation(WARMUP_QUESTION)
+
+
+def warm_database(db_file: str, prefetch_bytes: int = 256 * 1024 * 1024):
+    """
+    Read the schema and value dictionary of `db_file` and pull up to
+    `prefetch_bytes` of it into the OS page cache, so the first query does not
+    wait on cold disk reads.
+    """
+    from module.value_index import load_value_index
+
+    get_engine(db_file).schema(db_file)
+    load_value_index(db_file)
+    size = min(os.path.getsize(db_file), prefetch_bytes)
+    with open(db_file, "rb") as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, size, os.POSIX_FADV_WILLNEED)
+        else:
+            while f.tell() < size and f.read(1024 * 1024):
+                pass
+
+
+def run_warmup(tasks: List[Tuple[str, Callable[[], None]]]):
+    """
+    Run `(component, fn)` warm-up tasks in order, recording their readiness
+    and duration (`warmup.<component>` spans feed the stage histograms).
+    """
+    for component, fn in tasks:
+        readiness.set(component, "warming")
+        start = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            readiness.set(component, "failed", error=str(e))
+            continue
+        duration = time.perf_counter() - start
+        record_span(f"warmup.{component.split(':')[0]}", duration, start=start)
+        readiness.set(component, "ready", seconds=round(duration, 3))
+
+
+def start_warmup(tasks: List[Tuple[str, Callable[[], None]]]) -> threading.Thread:
+    """
+    Run the tasks on a daemon thread. Components are marked "warming" right
+    away, so readiness drops until they are done.
+    """
+    for component, _ in tasks:
+        readiness.set(component, "warming")
+    thread = threading.Thread(target=run_warmup, args=(tasks,), name="warmup", daemon=True)
+    thread.start()
+    return thread
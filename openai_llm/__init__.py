@@ -1,2 +1,34 @@
-from .openai_chat import *
-from .openai_embedding import *
\ No newline at end of file
+"""
+Chat and embedding providers.
+
+Submodules are imported on first use of one of their names, so importing the
+package (or `openai_llm.providers`) does not pull in the OpenAI SDK or ONNX
+Runtime unless that provider is selected.
+"""
+import importlib
+
+_EXPORTS = {
+    "ChatProvider": "base",
+    "EmbeddingProvider": "base",
+    "ProviderEmbeddingFunction": "embedding_function",
+    "OpenAI_Chat": "openai_chat",
+    "OpenAI_Embeddings": "openai_embedding",
+    "Local_Chat": "local_llm",
+    "Local_Embeddings": "local_llm",
+    "MicroBatcher": "batching",
+    "ONNX_Embeddings": "onnx_embedding",
+    "CHAT_PROVIDERS": "providers",
+    "EMBEDDING_PROVIDERS": "providers",
+    "get_chat_provider": "providers",
+    "get_embedding_provider": "providers",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f"{__name__}.{_EXPORTS[name]}"), name)
+    globals()[name] = value
+    return value
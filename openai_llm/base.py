@@ -0,0 +1,41 @@
+from typing import Iterator, List
+
+
+class ChatProvider:
+    """
+    Interface every chat backend implements.
+
+    Backends only have to provide `stream_chat`, which yields the text deltas
+    of a completion as they arrive. `chat` is derived from it.
+    """
+    name = "base"
+
+    def stream_chat(self, messages: list, **kwargs) -> Iterator[str]:
+        raise NotImplementedError
+
+    def chat(self, messages: list, **kwargs) -> str:
+        return "".join(self.stream_chat(messages, **kwargs))
+
+
+class EmbeddingProvider:
+    """
+    Interface every embedding backend implements.
+
+    Backends only have to provide `generate_embeddings`, which embeds a batch
+    of texts in one call. `model_name` identifies the vectors it produces.
+    """
+    name = "base"
+    model_name = None
+
+    def generate_embeddings(self, data: List[str], **kwargs) -> List[List[float]]:
+        raise NotImplementedError
+
+    def generate_embedding(self, data: str, **kwargs) -> List[float]:
+        return self.generate_embeddings([data], **kwargs)[0]
+
+    def chroma_embedding_function(self):
+        # Wrap the provider so Chroma collections embed through it as well
+        # (imported here: only vector stores need chromadb)
+        from openai_llm.embedding_function import ProviderEmbeddingFunction
+
+        return ProviderEmbeddingFunction(self)
@@ -0,0 +1,104 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List
+
+from module.tracing import metrics
+from openai_llm.rate_limit import current_priority, request_priority
+
+BATCHES_METRIC = "insightgenix_embedding_batches_total"
+TEXTS_METRIC = "insightgenix_embedding_texts_total"
+COALESCED_METRIC = "insightgenix_embedding_coalesced_total"
+
+
+class MicroBatcher:
+    """
+    Gathers texts submitted by concurrent callers into batches.
+
+    A dispatcher thread waits for the first pending text, then keeps collecting
+    for up to `max_wait_ms` or until `max_batch_size` texts are queued, and
+    hands the batch to `embed_batch` on a thread pool of `workers` threads.
+    Each caller gets its own slice of the results back.
+
+    A text that is already queued or being embedded is not submitted again
+    (single-flight): its callers share one future. A batch runs at the
+    highest request priority of the callers in it.
+
+    Args:
+        embed_batch (Callable): Embeds a list of texts, returns a list of vectors.
+        max_batch_size (int): Largest batch passed to `embed_batch`.
+        max_wait_ms (float): How long the first text of a batch waits for company.
+        workers (int): Batches run concurrently (defaults to the number of cores).
+        name (str): Label of the batcher's metrics.
+    """
+    def __init__(self, embed_batch: Callable[[List[str]], List[List[float]]],
+                 max_batch_size: int = 64, max_wait_ms: float = 2.0, workers: int = None,
+                 name: str = "embedding"):
+        self.embed_batch = embed_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self.pool = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                                       thread_name_prefix="embedding-batch")
+        self._queue = queue.Queue()
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._dispatch, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        with self._inflight_lock:
+            future = self._inflight.get(text)
+            if future is not None:
+                metrics.inc(COALESCED_METRIC, batcher=self.name)
+                return future
+            future = self._inflight[text] = Future()
+        self._queue.put((text, future, current_priority()))
+        return future
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        futures = [self.submit(text) for text in texts]
+        return [future.result() for future in futures]
+
+    def _dispatch(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.pool.submit(self._run, batch)
+
+    def _run(self, batch: list):
+        texts = [text for text, _, _ in batch]
+        metrics.inc(BATCHES_METRIC, batcher=self.name)
+        metrics.inc(TEXTS_METRIC, len(texts), batcher=self.name)
+        vectors, error = None, None
+        try:
+            with request_priority(min(priority for _, _, priority in batch)):
+                vectors = self.embed_batch(texts)
+            if len(vectors) != len(texts):
+                raise ValueError(f"Embedding backend returned {len(vectors)} vectors for {len(texts)} texts")
+        except Exception as e:
+            error = e
+        # Later callers of these texts start a new request
+        with self._inflight_lock:
+            for text in texts:
+                self._inflight.pop(text, None)
+        # Every future is resolved, or its callers would wait forever
+        for i, (_, future, _) in enumerate(batch):
+            try:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(vectors[i])
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
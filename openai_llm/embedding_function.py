@@ -0,0 +1,11 @@
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+
+class ProviderEmbeddingFunction(EmbeddingFunction[Documents]):
+    def __init__(self, provider):
+        self.provider = provider
+
+    def __call__(self, input: Documents) -> Embeddings:
+        if not input:
+            return []
+        return self.provider.generate_embeddings(list(input))
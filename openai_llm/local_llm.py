@@ -0,0 +1,129 @@
+import hashlib
+import re
+import time
+from typing import Iterator, List
+
+import numpy as np
+
+from openai_llm.base import ChatProvider, EmbeddingProvider
+
+
+class Local_Embeddings(EmbeddingProvider):
+    """
+    Deterministic offline embeddings.
+
+    Each text is lowercased and split into word unigrams and character
+    trigrams. Every feature is hashed into one of `embedding_dim` buckets with
+    a signed weight and the vector is L2 normalised, so texts sharing words or
+    spellings end up close in cosine space. The same text always produces the
+    same vector, in any process, without network access.
+
+    `local_embedding_latency` (seconds) simulates the round trip of one
+    embedding request.
+    """
+    name = "local"
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.dim = int(config.get('embedding_dim') or 384)
+        self.ngram = int(config.get('embedding_ngram') or 3)
+        self.model_name = f"local-hash-ngram{self.ngram}-{self.dim}"
+        self.latency = float(config.get('local_embedding_latency') or 0)
+
+    def _features(self, text: str) -> List[str]:
+        text = text.lower()
+        words = re.findall(r"\w+", text)
+        features = [f"w:{w}" for w in words]
+        for word in words:
+            padded = f"#{word}#"
+            features.extend(f"c:{padded[i:i + self.ngram]}"
+                            for i in range(max(len(padded) - self.ngram + 1, 1)))
+        return features
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vector[bucket] += sign
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector.tolist()
+
+    def generate_embeddings(self, data: List[str], **kwargs) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in data]
+
+
+class Local_Chat(ChatProvider):
+    """
+    Offline chat backend that answers from templates.
+
+    - SQL prompts (built by `get_sql_prompt`) are answered with the SQL of a
+      trained example whose question matches, otherwise with a templated
+      `SELECT` against the first table found in the DDL.
+    - Insight prompts get a canned summary, anything else a canned reply.
+    - `local_responses` in the config maps a substring of the last user
+      message to a fixed response and takes precedence over the templates.
+
+    `local_first_token_latency` and `local_token_latency` (seconds) simulate
+    the time to first token and the gap between streamed tokens.
+    """
+    name = "local"
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.model_name = config.get('chat_model_name') or "local-sql-responder"
+        self.first_token_latency = float(config.get('local_first_token_latency') or 0)
+        self.token_latency = float(config.get('local_token_latency') or 0)
+        self.responses = config.get('local_responses') or {}
+
+    @staticmethod
+    def _normalise(question: str) -> str:
+        question = re.sub(r"^\s*(query|insight):", "", question.lower())
+        return " ".join(re.findall(r"\w+", question))
+
+    def _sql_response(self, system: str, messages: list, question: str) -> str:
+        # Few-shot examples arrive as user/assistant pairs after the system message
+        wanted = self._normalise(question)
+        for user, assistant in zip(messages[1:-1], messages[2:-1]):
+            if user["role"] == "user" and assistant["role"] == "assistant":
+                if self._normalise(user["content"]) == wanted:
+                    return assistant["content"]
+
+        table = re.search(r"CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?[\"`\[]?([\w-]+)", system, re.IGNORECASE)
+        table_name = table.group(1) if table else "uploaded_data"
+        columns = []
+        if table:
+            body = system[table.end():].split(")", 1)[0]
+            columns = re.findall(r"[(,]\s*[\"`\[]?(\w+)[\"`\]]?\s+\w+", body)
+        question_words = set(wanted.split())
+        selected = [c for c in columns if c.lower() in question_words] or ["*"]
+        sql = f"SELECT {', '.join(selected)}\nFROM {table_name}\nLIMIT 10;"
+        return f"Of course, here is your query:\n```sql\n{sql}\n```"
+
+    def _respond(self, messages: list) -> str:
+        question = messages[-1]["content"] if messages else ""
+        for key, response in self.responses.items():
+            if key in question:
+                return response
+
+        system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+        if "**DDL:**" in system:
+            return self._sql_response(system, messages, question)
+        if "Data Analysis Insight Brief" in system:
+            return ("#### Summary\nThe query result was analysed offline by the local responder.\n\n"
+                    "#### Detailed Analysis\nNo language model is configured, so no further insight is available.")
+        return "This is the local responder. Configure an LLM provider to get real answers."
+
+    def stream_chat(self, messages: list, **kwargs) -> Iterator[str]:
+        response = self._respond(messages)
+        if self.first_token_latency:
+            time.sleep(self.first_token_latency)
+        for i, token in enumerate(re.findall(r"\S+\s*|\s+", response)):
+            if i and self.token_latency:
+                time.sleep(self.token_latency)
+            yield token
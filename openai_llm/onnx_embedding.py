@@ -0,0 +1,138 @@
+import os
+import threading
+from typing import List
+
+import numpy as np
+
+from openai_llm.base import EmbeddingProvider
+from openai_llm.batching import MicroBatcher
+
+try:
+    import onnxruntime
+    from tokenizers import Tokenizer
+except ImportError:  # optional dependency, only needed for the onnx provider
+    onnxruntime = None
+    Tokenizer = None
+
+
+class ONNX_Embeddings(EmbeddingProvider):
+    """
+    In-process CPU embeddings from an ONNX-exported sentence encoder.
+
+    The model directory must contain `model.onnx` and `tokenizer.json`. When
+    `onnx_model_path` is not configured, Chroma's all-MiniLM-L6-v2 export is
+    downloaded once to `~/.cache/chroma/onnx_models/` and used.
+
+    Single texts from concurrent callers (one retrieval per chat turn) are
+    micro-batched; large batches (training) are sorted by length, chunked and
+    run on a thread pool sized to the machine's cores. The model is warmed up
+    when the provider is created so the first real query does not pay for
+    session initialisation.
+
+    Config keys:
+        onnx_model_path (str): Directory of the exported model.
+        onnx_model_name (str): Name recorded with the vectors (default: directory name).
+        onnx_batch_size (int): Maximum batch size (default 32).
+        onnx_max_wait_ms (float): Micro-batching window (default 2 ms).
+        onnx_threads (int): Total CPU threads to use (default: all cores).
+        onnx_max_length (int): Token truncation length (default 256).
+        embedding_warmup (bool): Run a warm-up inference at startup (default True).
+    """
+    name = "onnx"
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, config=None) -> "ONNX_Embeddings":
+        """
+        Return a process-wide instance for this model configuration, so every
+        Streamlit session reuses one loaded (and warmed up) inference session.
+        """
+        config = config or {}
+        key = tuple(str(config.get(k)) for k in ('onnx_model_path', 'onnx_model_name', 'onnx_batch_size',
+                                                 'onnx_max_wait_ms', 'onnx_threads', 'onnx_max_length'))
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(config=config)
+            return cls._shared[key]
+
+    def __init__(self, config=None):
+        if onnxruntime is None or Tokenizer is None:
+            raise ValueError("The onnx embedding provider requires `onnxruntime` and `tokenizers` to be installed.")
+        config = config or {}
+
+        model_path = config.get('onnx_model_path') or self._default_model_path()
+        if not os.path.exists(os.path.join(model_path, "model.onnx")):
+            raise ValueError(f"No model.onnx found in onnx_model_path: {model_path}")
+        model_name = config.get('onnx_model_name') or os.path.basename(os.path.normpath(model_path))
+        if model_name == "onnx":
+            model_name = os.path.basename(os.path.dirname(os.path.normpath(model_path)))
+        self.model_name = f"onnx/{model_name}"
+
+        self.batch_size = int(config.get('onnx_batch_size') or 32)
+        threads = int(config.get('onnx_threads') or os.cpu_count() or 1)
+        # A couple of sessions run concurrently, each using its share of the cores
+        self.workers = max(1, min(4, threads // 2))
+        max_length = int(config.get('onnx_max_length') or 256)
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = max(1, threads // self.workers)
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_path, "model.onnx"), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.batcher = MicroBatcher(self._embed_batch,
+                                    max_batch_size=self.batch_size,
+                                    max_wait_ms=float(config.get('onnx_max_wait_ms') or 2.0),
+                                    workers=self.workers,
+                                    name="onnx")
+        if config.get('embedding_warmup', True):
+            self.warmup()
+
+    @staticmethod
+    def _default_model_path() -> str:
+        from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+
+        default = ONNXMiniLM_L6_V2()
+        default._download_model_if_not_exists()
+        return os.path.join(default.DOWNLOAD_PATH, default.EXTRACTED_FOLDER_NAME)
+
+    def warmup(self):
+        # First inference allocates the session's buffers; do it before real traffic
+        self._embed_batch(["warm up"] * min(self.batch_size, 8))
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        encoded = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            inputs["token_type_ids"] = np.zeros_like(input_ids)
+        last_hidden = self.session.run(None, inputs)[0]
+
+        # Mean pooling over real tokens, then L2 normalisation
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (last_hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.tolist()
+
+    def generate_embeddings(self, data: List[str], **kwargs) -> List[List[float]]:
+        if len(data) < self.batch_size:
+            return self.batcher(data)
+
+        # Bulk requests: group texts of similar length so padding stays small
+        order = sorted(range(len(data)), key=lambda i: len(data[i]))
+        chunks = [order[i:i + self.batch_size] for i in range(0, len(order), self.batch_size)]
+        results = [None] * len(data)
+        for chunk, vectors in zip(chunks, self.batcher.pool.map(
+                lambda idx: self._embed_batch([data[i] for i in idx]), chunks)):
+            for i, vector in zip(chunk, vectors):
+                results[i] = vector
+        return results
@@ -0,0 +1,94 @@
+import os
+from typing import Iterator
+
+import openai
+from dotenv import load_dotenv
+
+from openai_llm.base import ChatProvider
+from openai_llm.rate_limit import call_with_retry, estimate_tokens, get_rate_limiter
+
+# Completion tokens counted against the TPM budget when max_tokens is not set
+COMPLETION_TOKENS_ESTIMATE = 500
+
+
+class OpenAI_Chat(ChatProvider):
+    name = "azure"
+
+    def __init__(self, config=None):
+        # Define the path for the .env file
+        load_dotenv(dotenv_path='.env')
+
+        # Initialize attributes
+        self.api_key = None
+        self.api_base = None
+        self.api_version = None
+        self.model_name = None
+        self.rpm = 0
+        self.tpm = 0
+        self.max_retries = 5
+
+        # Apply config if provided, otherwise load from environment
+        if config is not None:
+            self.apply_config(config)
+        else:
+            self.load_from_env()
+
+        # Validate that necessary configurations are present
+        self.validate_config()
+
+        # Retries are done by call_with_retry, within the deployment's shared rate limit
+        self.client = openai.AzureOpenAI(api_key=self.api_key,
+                                         api_version=self.api_version,
+                                         azure_endpoint=self.api_base,
+                                         max_retries=0)
+        self.limiter = get_rate_limiter(f"chat:{self.model_name}", rpm=self.rpm, tpm=self.tpm,
+                                        endpoint=self.api_base)
+
+    def apply_config(self, config):
+        self.api_key = config.get('api_key')
+        self.api_base = config.get('api_base')
+        self.api_version = config.get('api_version')
+        self.model_name = config.get('chat_model_name')
+        self.rpm = config.get('chat_rpm', 0)
+        self.tpm = config.get('chat_tpm', 0)
+        self.max_retries = config.get('llm_max_retries', 5)
+
+    def load_from_env(self):
+        self.api_key = os.getenv("OPENAI_API_KEY")
+        self.api_base = os.getenv("OPENAI_API_BASE")
+        self.api_version = os.getenv("OPENAI_API_VERSION")
+        self.model_name = os.getenv("CHAT_MODEL_NAME")
+        self.rpm = float(os.getenv("CHAT_RPM", 0))
+        self.tpm = float(os.getenv("CHAT_TPM", 0))
+        self.max_retries = int(os.getenv("LLM_MAX_RETRIES", 5))
+
+    def validate_config(self):
+        if not self.api_key:
+            raise ValueError("API key is required but not provided.")
+        if not self.api_base:
+            raise ValueError("API base is required but not provided.")
+        if not self.model_name:
+            raise ValueError("Chat model name is required but not provided.")
+
+    def stream_chat(self, messages: list, **kwargs) -> Iterator[str]:
+        tokens = (estimate_tokens(m.get("content") or "" for m in messages)
+                  + kwargs.get("max_tokens", COMPLETION_TOKENS_ESTIMATE))
+        # Only opening the stream is retried; a stream that already sent tokens is not replayed
+        stream = call_with_retry(
+            lambda: self.client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                stream=True,
+                **kwargs
+            ),
+            self.limiter, tokens=tokens, max_retries=self.max_retries,
+        )
+        try:
+            for chunk in stream:
+                # Azure sends an initial chunk with no choices (content filter results)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Closing the generator early (e.g. once the SQL block is complete)
+            # drops the HTTP stream, so no further tokens are generated for it
+            stream.close()
@@ -1,9 +1,29 @@
 import os
+import threading
+from typing import List
+
 import openai
 from dotenv import load_dotenv
-from chromadb.utils import embedding_functions
 
-class OpenAI_Embeddings:
+from openai_llm.base import EmbeddingProvider
+from openai_llm.batching import MicroBatcher
+from openai_llm.rate_limit import call_with_retry, estimate_tokens, get_rate_limiter
+
+class OpenAI_Embeddings(EmbeddingProvider):
+    """
+    Azure OpenAI embeddings.
+
+    Small requests (the question of a chat turn) from every session of the
+    process go through one dispatcher per deployment and rate limit, which
+    merges identical in-flight texts and batches concurrent texts arriving
+    within `embedding_batch_window_ms` into a single API call. Requests of at least
+    `embedding_max_batch` texts (training) are sent as they are.
+    """
+    name = "azure"
+
+    _dispatchers = {}
+    _dispatchers_lock = threading.Lock()
+
     def __init__(self, config=None):
         # Define the path for the .env file
         load_dotenv(dotenv_path='.env')
@@ -14,6 +34,11 @@ class OpenAI_Embeddings:
         self.api_type = None
         self.api_version = None
         self.model_name = None
+        self.rpm = 0
+        self.tpm = 0
+        self.max_retries = 5
+        self.batch_window_ms = 5.0
+        self.max_batch = 64
 
         # Apply config if provided, otherwise load from environment
         if config is not None:
@@ -24,10 +49,15 @@ class OpenAI_Embeddings:
         # Validate that necessary configurations are present
         self.validate_config()
 
-        # Initialize the OpenAI client with the API key
+        # Initialize the OpenAI client with the API key; retries are done by
+        # call_with_retry, within the deployment's shared rate limit
         self.client = openai.AzureOpenAI(api_key = self.api_key,
                                          api_version = self.api_version,
-                                         azure_endpoint = self.api_base)
+                                         azure_endpoint = self.api_base,
+                                         max_retries = 0)
+        self.limiter = get_rate_limiter(f"embedding:{self.model_name}", rpm=self.rpm, tpm=self.tpm,
+                                        endpoint=self.api_base)
+        self.dispatcher = self._dispatcher() if self.batch_window_ms > 0 else None
 
     def apply_config(self, config):
         self.api_key = config.get('api_key')
@@ -35,6 +65,11 @@ class OpenAI_Embeddings:
         self.api_type = config.get('api_type')
         self.api_version = config.get('api_version')
         self.model_name = config.get('embedding_model_name')
+        self.rpm = config.get('embedding_rpm', 0)
+        self.tpm = config.get('embedding_tpm', 0)
+        self.max_retries = config.get('llm_max_retries', 5)
+        self.batch_window_ms = float(config.get('embedding_batch_window_ms', 5.0))
+        self.max_batch = int(config.get('embedding_max_batch', 64))
 
     def load_from_env(self):
         self.api_key = os.getenv("OPENAI_API_KEY")
@@ -42,6 +77,11 @@ class OpenAI_Embeddings:
         self.api_type = os.getenv("OPENAI_API_TYPE")
         self.api_version = os.getenv("OPENAI_API_VERSION")
         self.model_name = os.getenv("EMBEDDING_MODEL_NAME")
+        self.rpm = float(os.getenv("EMBEDDING_RPM", 0))
+        self.tpm = float(os.getenv("EMBEDDING_TPM", 0))
+        self.max_retries = int(os.getenv("LLM_MAX_RETRIES", 5))
+        self.batch_window_ms = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", 5.0))
+        self.max_batch = int(os.getenv("EMBEDDING_MAX_BATCH", 64))
 
     def validate_config(self):
         if not self.api_key:
@@ -51,24 +91,33 @@ class OpenAI_Embeddings:
         if not self.model_name:
             raise ValueError("Model name is required but not provided.")
 
-    def generate_embedding(self, data: str, **kwargs) -> list:
-        # Determine the engine to use, fall back to a default if not specified
-        engine = self.model_name if self.model_name else "text-embedding-ada-002"
+    def _dispatcher(self) -> MicroBatcher:
+        # One per deployment, limiter and process, so sessions share batches; the
+        # batches run on the first instance's client, which only clients with the
+        # same endpoint, key, retries and rate limits may share
+        key = (self.api_base, self.api_key, self.api_version, self.model_name, self.limiter,
+               self.max_retries, self.batch_window_ms, self.max_batch)
+        with self._dispatchers_lock:
+            if key not in self._dispatchers:
+                self._dispatchers[key] = MicroBatcher(self._embed_batch, max_batch_size=self.max_batch,
+                                                      max_wait_ms=self.batch_window_ms,
+                                                      name=f"azure:{self.model_name}")
+            return self._dispatchers[key]
 
-        response = self.client.embeddings.create(
-            model=self.model_name,
-            input=[data],
-            **kwargs
-        )
-        return response.data[0].embedding
-    
-    def chroma_embedding_function(self):
-        # Initialize and return an OpenAIEmbeddingFunction instance with current configurations
-        openai_ef = embedding_functions.OpenAIEmbeddingFunction(
-            api_key=self.api_key,
-            api_base=self.api_base,
-            api_type=self.api_type, 
-            api_version=self.api_version,
-            model_name=self.model_name
+    def generate_embeddings(self, data: List[str], **kwargs) -> List[List[float]]:
+        if self.dispatcher is not None and not kwargs and len(data) < self.max_batch:
+            return self.dispatcher(data)
+        return self._embed_batch(data, **kwargs)
+
+    def _embed_batch(self, data: List[str], **kwargs) -> List[List[float]]:
+        # One request for the whole batch, results come back tagged with their index
+        response = call_with_retry(
+            lambda: self.client.embeddings.create(
+                model=self.model_name,
+                input=data,
+                **kwargs
+            ),
+            self.limiter, tokens=estimate_tokens(data), max_retries=self.max_retries,
         )
-        return openai_ef
+        ordered = sorted(response.data, key=lambda e: e.index)
+        return [e.embedding for e in ordered]
@@ -0,0 +1,72 @@
+import importlib
+
+from openai_llm.base import ChatProvider, EmbeddingProvider
+
+# Backends are named by "module:attribute" and imported on first use, so the
+# OpenAI SDK or ONNX Runtime only load when that provider is selected
+CHAT_PROVIDERS = {
+    "azure": "openai_llm.openai_chat:OpenAI_Chat",
+    "local": "openai_llm.local_llm:Local_Chat",
+}
+
+EMBEDDING_PROVIDERS = {
+    "azure": "openai_llm.openai_embedding:OpenAI_Embeddings",
+    "local": "openai_llm.local_llm:Local_Embeddings",
+    # one loaded model per process, shared by all sessions
+    "onnx": "openai_llm.onnx_embedding:ONNX_Embeddings.shared",
+}
+
+# Config keys that determine the vectors of each embedding backend; stored
+# with a collection so its model can be rebuilt after the config changes
+EMBEDDING_SETTINGS = {
+    "azure": ("embedding_model_name",),
+    "local": ("embedding_dim", "embedding_ngram"),
+    "onnx": ("onnx_model_path", "onnx_model_name", "onnx_max_length"),
+}
+
+
+def _load(target: str):
+    module_name, _, path = target.partition(":")
+    value = importlib.import_module(module_name)
+    for attr in path.split("."):
+        value = getattr(value, attr)
+    return value
+
+
+def get_chat_provider(config: dict = None) -> ChatProvider:
+    """
+    Build the chat backend selected by `llm_provider` in the config (default "azure").
+    """
+    provider = (config or {}).get("llm_provider") or "azure"
+    if provider not in CHAT_PROVIDERS:
+        raise ValueError(f"Unsupported llm_provider was set in config: {provider}")
+    return _load(CHAT_PROVIDERS[provider])(config=config)
+
+
+def get_embedding_provider(config: dict = None) -> EmbeddingProvider:
+    """
+    Build the embedding backend selected by `embedding_provider` in the config,
+    falling back to `llm_provider` and then "azure".
+    """
+    provider = _embedding_provider_name(config)
+    return _load(EMBEDDING_PROVIDERS[provider])(config=config)
+
+
+def _embedding_provider_name(config: dict = None) -> str:
+    settings = config or {}
+    provider = settings.get("embedding_provider") or settings.get("llm_provider") or "azure"
+    if provider not in EMBEDDING_PROVIDERS:
+        raise ValueError(f"Unsupported embedding_provider was set in config: {provider}")
+    return provider
+
+
+def embedding_settings(config: dict = None) -> dict:
+    """
+    The embedding backend and the config values that determine its vectors;
+    `get_embedding_provider({**config, **settings})` rebuilds the same model.
+    """
+    provider = _embedding_provider_name(config)
+    settings = {"embedding_provider": provider}
+    for key in EMBEDDING_SETTINGS.get(provider, ()):
+        settings[key] = (config or {}).get(key)  # None (the default) must override too
+    return settings
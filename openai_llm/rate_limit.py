@@ -0,0 +1,213 @@
+"""
+Process-wide rate limiting and retries for the Azure OpenAI deployments.
+
+Every deployment (endpoint, model and RPM/TPM budget) gets one `RateLimiter`,
+shared by all sessions of the process, with two token buckets: requests per
+minute and tokens per minute. Callers wait in a priority queue, so
+interactive chat (`INTERACTIVE`) is served before training and re-indexing
+(`BACKGROUND`), which run under `with request_priority(BACKGROUND):`.
+
+`call_with_retry` acquires capacity, makes the call and retries throttled
+(429), timed-out and 5xx requests with jittered exponential backoff, waiting
+at least as long as the `Retry-After` header asks. A 429 also pauses the
+deployment's bucket, so the other queued callers back off too.
+
+Exported metrics, labelled by deployment:
+
+- `insightgenix_llm_queue_depth`: callers waiting for capacity,
+- `insightgenix_llm_queue_wait_seconds`: time spent waiting (also by priority),
+- `insightgenix_llm_throttled_total`: 429 responses,
+- `insightgenix_llm_retries_total`: retried calls.
+"""
+import contextvars
+import heapq
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from module.tracing import metrics
+
+INTERACTIVE = 0
+BACKGROUND = 10
+
+QUEUE_DEPTH_METRIC = "insightgenix_llm_queue_depth"
+QUEUE_WAIT_METRIC = "insightgenix_llm_queue_wait_seconds"
+THROTTLED_METRIC = "insightgenix_llm_throttled_total"
+RETRIES_METRIC = "insightgenix_llm_retries_total"
+
+_priority = contextvars.ContextVar("llm_request_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def request_priority(priority: int):
+    """Run the enclosed LLM and embedding calls at `priority` (lower is served first)."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+class TokenBucket:
+    """
+    `capacity` units refilled evenly over a minute; a capacity of 0 means unlimited.
+    """
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute or 0)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        if self.capacity:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (after `refill`)."""
+        if not self.capacity:
+            return 0.0
+        # A request larger than the bucket waits for a full bucket instead of forever
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount: float):
+        if self.capacity:
+            self.level -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute budget of one deployment, handed
+    out in priority order (FIFO within a priority).
+    """
+    def __init__(self, name: str, rpm: float = 0, tpm: float = 0):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._cond = threading.Condition()
+        self._waiting = []  # heap of (priority, sequence)
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+
+    def _wait_time(self, tokens: float, now: float) -> float:
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        return max(self._paused_until - now, self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    def acquire(self, tokens: float = 0, priority: Optional[int] = None) -> float:
+        """
+        Block until one request and `tokens` tokens are available and every
+        caller ahead in the queue has been served. Returns the seconds waited.
+        """
+        priority = current_priority() if priority is None else priority
+        ticket = (priority, next(self._sequence))
+        start = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            metrics.set_gauge(QUEUE_DEPTH_METRIC, len(self._waiting), deployment=self.name)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._wait_time(tokens, now)
+                    if self._waiting[0] == ticket and wait <= 0:
+                        self.requests.take(1)
+                        self.tokens.take(tokens)
+                        break
+                    # The head wakes up when capacity is due; the others when the head is served
+                    self._cond.wait(timeout=wait if self._waiting[0] == ticket else None)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                metrics.set_gauge(QUEUE_DEPTH_METRIC, len(self._waiting), deployment=self.name)
+                self._cond.notify_all()
+        waited = time.monotonic() - start
+        metrics.observe(QUEUE_WAIT_METRIC, waited, deployment=self.name, priority=priority)
+        return waited
+
+    def pause(self, seconds: float):
+        """Hold every caller for `seconds`, e.g. after the deployment answered 429."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str, rpm: float = 0, tpm: float = 0, endpoint: Optional[str] = None) -> RateLimiter:
+    """
+    The process-wide limiter of deployment `name` at `endpoint`, created on
+    first use. Clients configured with other RPM/TPM budgets for the same
+    deployment get their own limiter instead of replacing the shared one.
+    """
+    key = (endpoint, name, float(rpm or 0), float(tpm or 0))
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = RateLimiter(name, rpm=rpm, tpm=tpm)
+        return limiter
+
+
+def estimate_tokens(texts) -> int:
+    # ~4 characters per token, enough to size the TPM bucket
+    return sum(len(text) for text in texts) // 4 + 1
+
+
+def _retry_after(error) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        return None  # an HTTP date; fall back to the backoff
+    return None
+
+
+def _classify(error) -> Optional[str]:
+    """"throttled" for a 429, "transient" for timeouts and 5xx, None otherwise."""
+    import openai
+
+    if isinstance(error, openai.RateLimitError):
+        return "throttled"
+    if isinstance(error, (openai.APIConnectionError, openai.InternalServerError)):
+        return "transient"
+    return None
+
+
+def call_with_retry(fn: Callable, limiter: RateLimiter, tokens: float = 0, max_retries: int = 5,
+                    base_delay: float = 0.5, max_delay: float = 30.0):
+    """
+    Call `fn()` within the limiter's budget, retrying throttled and transient
+    failures up to `max_retries` times with full-jitter exponential backoff.
+    """
+    attempt = 0
+    while True:
+        limiter.acquire(tokens)
+        try:
+            return fn()
+        except Exception as e:
+            kind = _classify(e)
+            if kind is None or attempt >= max_retries:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            retry_after = _retry_after(e)
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            if kind == "throttled":
+                metrics.inc(THROTTLED_METRIC, deployment=limiter.name)
+                limiter.pause(delay)
+            metrics.inc(RETRIES_METRIC, deployment=limiter.name, reason=kind)
+            attempt += 1
+            time.sleep(delay)
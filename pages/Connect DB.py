@@ -1,14 +1,10 @@
-from contextlib import contextmanager
 import os
 from pathlib import Path
-from uuid import uuid4
 import streamlit as st
-import sqlite3
-import pandas as pd
-from sqlalchemy import create_engine
 
-from module.ui_module import connect_db_sidebar, setup_page
-from module.utils import get_openai_config, init_season
+from module.engines import get_engine
+from module.ui_module import connect_db_sidebar, job_status, poll_jobs, setup_page
+from module.utils import get_job_queue, get_openai_config, init_season, query_to_dataframe, stage_upload, upload_scope
 
 # setup side bar
 setup_page()
@@ -25,58 +21,47 @@ except ValueError as e:
     st.warning(f"Please upload database and Setup OpenAI credentials: {e}")
     st.stop()  # Prevent further execution
 
-# Function to establish a connection to a SQLite database
-@contextmanager
-def sqlite_connect(file_path):
-    conn = sqlite3.connect(file_path)
-    try:
-        yield conn
-    finally:
-        conn.close()
+jobs = get_job_queue(config)
+# Uploads and their profiling are only listed to the browser session that submitted them
+scope = upload_scope()
 
-# Function to convert and save a file to SQLite database format
-def convert_and_save_file(uploaded_file, file_type):
-    db_file_path = f"./uploaded_data/{str(uuid4())}.db"
-    if not os.path.exists('./uploaded_data'):
-        os.makedirs('./uploaded_data')
-    
-    if file_type in ["db", "sqlite"]:
-        with open(db_file_path, "wb") as f:
-            f.write(uploaded_file.getvalue())
-    else:
-        if file_type == "xlsx":
-            df = pd.read_excel(uploaded_file)
-        elif file_type == "parquet":
-            df = pd.read_parquet(uploaded_file)
-        
-        engine = create_engine(f'sqlite:///{db_file_path}')
-        df.to_sql(name="uploaded_data", con=engine, index=False, if_exists="replace")
+# Function to store an uploaded file as a queryable dataset (SQLite database or Parquet).
+# The conversion runs as a background job, so it finishes even if the page is refreshed.
+def save_uploaded_file(uploaded_file, file_type):
+    return jobs.submit("ingest", {"path": stage_upload(uploaded_file), "file_type": file_type,
+                                  "file_name": uploaded_file.name,
+                                  "parquet_engine": config.get('parquet_engine', 'duckdb'),
+                                  "max_distinct_values": config.get('value_index_max_distinct', 5000)},
+                       scope=scope)
 
-    st.session_state.db_file_path = db_file_path
-    st.session_state.uploaded_data_file = uploaded_file.name  # Track the uploaded file name
+def open_dataset(result):
+    st.session_state.db_file_path = result["db_file_path"]
+    st.session_state.uploaded_data_file = result["file_name"]  # Track the uploaded file name
+    # Switch to the vector store bound to this dataset (created if it is new)
+    init_season(config)
+
+def profiling_job(db_file_path):
+    # The value dictionary is built after the upload, by its own job
+    for job in jobs.list_jobs(["profile"], scope=scope):
+        if job["params"].get("db_file_path") == db_file_path:
+            return job
+    return None
 
 def display_data_from_db():
     db_file_path = st.session_state.get("db_file_path")
     if db_file_path:
-        with sqlite_connect(db_file_path) as conn:
-            # Fetch the list of all tables in the database
-            cursor = conn.cursor()
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-            tables = cursor.fetchall()  # This returns a list of tuples
+        # Fetch the list of all tables in the database
+        table_names = get_engine(db_file_path).tables(db_file_path)
 
-            if tables:
-                # Extract table names from tuples
-                table_names = [table[0] for table in tables]
-                
-                # Let the user select a table to view
-                selected_table = st.selectbox('Select a table to display', table_names)
-                
-                # Display the selected table
-                query = f"SELECT * FROM {selected_table}"
-                df = pd.read_sql_query(query, conn)
-                st.dataframe(df)
-            else:
-                st.error("The database does not contain any tables.")
+        if table_names:
+            # Let the user select a table to view
+            selected_table = st.selectbox('Select a table to display', table_names)
+
+            # Display the selected table
+            df = query_to_dataframe(db_file_path, f'SELECT * FROM "{selected_table}"')
+            st.dataframe(df)
+        else:
+            st.error("The database does not contain any tables.")
     else:
         st.error("No database file found. Please upload a file first.")
 
@@ -85,25 +70,67 @@ if 'uploaded_data_file' not in st.session_state or st.session_state.uploaded_dat
     uploaded_file = st.file_uploader("Upload a file", type=['db', 'sqlite', 'parquet', 'xlsx'])
     if uploaded_file is not None:
         file_type = uploaded_file.name.split('.')[-1].lower()
-        with st.spinner("Converting and saving file..."):
-            convert_and_save_file(uploaded_file, file_type)
+        # Submitted once per upload, not on every rerun
+        if st.session_state.get('ingest_upload') != (uploaded_file.name, uploaded_file.size):
+            st.session_state.ingest_job = save_uploaded_file(uploaded_file, file_type)
+            st.session_state.ingest_upload = (uploaded_file.name, uploaded_file.size)
+        job = jobs.get(st.session_state.ingest_job)
+        if job["status"] != "done":
+            job_status(job, jobs, label="Converting and saving file")
+            if job["status"] in ("failed", "cancelled"):
+                del st.session_state['ingest_upload']  # submitted again on the next attempt
+            poll_jobs([job])
+            st.stop()
+        open_dataset(job["result"])
         st.success("File uploaded and converted successfully!")
         display_data_from_db()
     else:
+        # Uploads finished (or still running) after the session that started them was gone
+        recent = [job for job in jobs.list_jobs(["ingest"], scope=scope, limit=5)
+                  if job["status"] != "done" or os.path.exists(job["result"]["db_file_path"])]
+        if recent:
+            st.subheader("Recent uploads")
+        for job in recent:
+            name = job["params"].get("file_name") or "upload"
+            if job["status"] == "done":
+                if st.button(f"Open {name}", key=f"open-{job['id']}"):
+                    open_dataset(job["result"])
+                    st.rerun()
+            else:
+                job_status(job, jobs, label=name)
+        poll_jobs(recent)
         st.stop()
 else:
     st.info(f"Uploaded file: {st.session_state['uploaded_data_file']}")
+    st.caption(f"Vector store: {st.session_state.db_name}")
+    profile = profiling_job(st.session_state['db_file_path'])
+    if profile is not None and profile["status"] != "done":
+        job_status(profile, jobs, label="Value dictionary")
+    reindex = st.session_state.db.reindex_status()
+    if reindex["required"]:
+        done = f" ({reindex['items']}/{reindex['total']} items)" if "items" in reindex else ""
+        st.info(f"Re-embedding the training data with {reindex['target_model']}{done}. "
+                f"Answers use the {reindex['index_model']} index until it is done.")
     file_type = st.session_state['uploaded_data_file'].split('.')[-1].lower()
     if file_type in ['xlsx', 'db', 'sqlite', 'parquet']:
         st.markdown(f"**File Type:** {file_type.upper()}")
+        st.caption(f"Query engine: {get_engine(st.session_state['db_file_path']).dialect}")
         if file_type != 'db' and file_type != 'sqlite':
             display_data_from_db()
     else:
         st.warning("Unsupported file type. Please upload a valid file.")
     
     if st.button("Remove uploaded file"):
-        if os.path.exists(st.session_state['db_file_path']):
-            os.remove(st.session_state['db_file_path'])
+        db_file_path = st.session_state['db_file_path']
+        if profile is not None:
+            jobs.cancel(profile["id"])
+        for path in (db_file_path, db_file_path + '.stats.json', db_file_path + '.values.json'):
+            if os.path.exists(path):
+                os.remove(path)
         del st.session_state['db_file_path']
         del st.session_state['uploaded_data_file']
-        st.success("Uploaded file removed successfully.")
\ No newline at end of file
+        st.session_state.pop('ingest_upload', None)
+        st.success("Uploaded file removed successfully.")
+
+    if 'db_file_path' in st.session_state:
+        poll_jobs([profile])
@@ -1,7 +1,8 @@
-import uuid
-from PIL import Image
+import os
+import tempfile
 import streamlit as st
-from module.ui_module import setup_page, trainllm_sidebar
+from chroma_db.transfer import export_training_data
+from module.ui_module import job_status, poll_jobs, setup_page, trainllm_sidebar
 from module.utils import *
 
 # setup side bar
@@ -19,22 +20,37 @@ except ValueError as e:
     st.warning(f"Please upload database and Setup OpenAI credentials: {e}")
     st.stop()  # Prevent further execution
 
+jobs = get_job_queue(config)
+
+# Training data type -> argument of ChromaDB_VectorStore.train
+TRAINING_TYPES = {'ddl': 'ddl', 'Question/Query': 'sql', 'Documentation': 'documentation'}
+
 def send_data_to_function(type: str, data: list):
-    # Placeholder function to simulate sending data
-    # Replace this with actual functionality as needed
-    with st.spinner('Processing...'):
-        if type == 'ddl':
-            for i in data:
-                st.session_state.db.train(ddl=i)
-        elif type == 'Question/Query':
-            for i in data:
-                st.session_state.db.train(sql=i)
-        elif type == 'Documentation':
-            for i in data:
-                st.session_state.db.train(documentation=i)
-        else:
-            st.warning('select correct training type.')
-    st.success(f'{type} training data added successfully!')
+    if type not in TRAINING_TYPES:
+        st.warning('select correct training type.')
+        return
+    # Training runs as a background job: it goes on when the page is left or refreshed
+    jobs.submit("train", {"store": st.session_state.db_name, "type": TRAINING_TYPES[type], "items": data},
+                scope=st.session_state.db_name)
+    st.success(f'{type} training started for {len(data)} items.')
+
+def store_jobs():
+    return jobs.list_jobs(["train", "import", "reindex"], scope=st.session_state.db_name, limit=10)
+
+def background_jobs():
+    # Training, import and re-index jobs of this vector store
+    recent = store_jobs()
+    if recent:
+        with st.expander("Background jobs", expanded=any(job["status"] in ("queued", "running") for job in recent)):
+            for job in recent:
+                job_status(job, jobs)
+                if job["status"] == "done" and job["kind"] == "train":
+                    result = job["result"]
+                    st.caption(f"{result['added']} new, {result['items'] - result['added']} already known")
+                elif job["status"] == "done" and job["kind"] == "import":
+                    result = job["result"]
+                    st.caption(f"Imported {result['sql']} question/SQL pairs, {result['ddl']} DDL statements and "
+                               f"{result['documentation']} documentation items ({result['reembedded']} re-embedded).")
 
 
 def train_model_1():
@@ -54,13 +70,9 @@ def train_model_1():
     )""")
     
     if st.button("Train DDL Model"):
-        # Generate a unique identifier
-        unique_id = str(uuid.uuid4())
-        
-        # Create JSON object
+        # Create JSON object (the store derives the id from the content)
         data_json = [
             {
-                'id': unique_id,
                 'table_name': table_name,
                 'ddl_statement': ddl_statement
             }
@@ -85,13 +97,9 @@ def train_model_2():
                           placeholder="SELECT name, age FROM my-table WHERE name = 'John Doe'")
     
     if st.button("Train QS Model"):
-        # Generate a unique identifier
-        unique_id = str(uuid.uuid4())
-        
-        # Create JSON object
+        # Create JSON object (the store derives the id from the content)
         data_json = [
             {
-                'id': unique_id,
                 'question': question,
                 'query': query
             }
@@ -113,13 +121,10 @@ def train_model_3():
                                  placeholder="`Name`: Column contains person's name.\n`Age`: Column contains person's age.\n Name column unique value: Ramesh, John, Ravi")
     
     if st.button("Train Documentation Model"):
-        # Generate a unique identifier
         documentation_list = documentation.split('\n')
         data_json_list = []
         for index, doc in enumerate(documentation_list):
-            unique_id = str(uuid.uuid4())
             json_object = {
-                'id': unique_id, 
                 'documentation': doc
             }
             # Append the JSON object to the list
@@ -132,9 +137,45 @@ def train_model_3():
         st.write("Training DDL model started with the following data:")
         st.json(data_json_list)  # This will nicely format the JSON in the UI
 
+def show_training_data():
+    # Page through the training data instead of loading every item at once
+    total = st.session_state.db.count_training_data()
+    col1, col2 = st.columns(2)
+    with col1:
+        page_size = st.selectbox("Rows per page", [25, 50, 100, 500], index=1)
+    pages = max(1, -(-total // page_size))
+    with col2:
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1)
+    df = st.session_state.db.get_training_data(limit=page_size, offset=(page - 1) * page_size)
+    st.caption(f"{total} training items")
+    st.dataframe(df, use_container_width=True)
+
+def transfer_training_data():
+    st.subheader("Export / Import")
+    col1, col2 = st.columns(2)
+    with col1:
+        file_format = st.radio("Export format", ["jsonl", "parquet"], horizontal=True)
+        if st.button("Prepare export"):
+            export_path = os.path.join(tempfile.gettempdir(), f"{st.session_state.db_name}.{file_format}")
+            with st.spinner('Exporting...'):
+                count = export_training_data(st.session_state.db, export_path, file_format=file_format)
+            st.session_state.training_export = (export_path, count)
+        if 'training_export' in st.session_state:
+            export_path, count = st.session_state.training_export
+            with open(export_path, "rb") as f:
+                st.download_button(f"Download {count} items", f, file_name=os.path.basename(export_path))
+    with col2:
+        uploaded = st.file_uploader("Import training data", type=["jsonl", "parquet"])
+        if uploaded is not None and st.button("Import"):
+            suffix = os.path.splitext(uploaded.name)[1]
+            with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as f:
+                f.write(uploaded.getbuffer())
+            # The import job removes the file when it is done
+            jobs.submit("import", {"store": st.session_state.db_name, "path": f.name}, scope=st.session_state.db_name)
+            st.success("Import started.")
+
 def train_model_4():
     st.subheader("Training DataBase")
-    show = False  # Initialize 'show' flag
     db_message = None  # Initialize message variable
     rm_message = None
     
@@ -142,12 +183,13 @@ def train_model_4():
     col1, col2 = st.columns(2)
     with col1:
         if st.button('Show Database'):
-            df = st.session_state.db.get_training_data()
-            show = True
+            st.session_state.show_training_data = True
 
     with col2:
         if st.button('Delete Database'):
             data = st.session_state.db_name
+            for job in jobs.list_jobs(scope=data, limit=100):
+                jobs.cancel(job["id"])
             reset_chromadb()
             rm_message = f"database Delete: {data}"
             try:
@@ -158,16 +200,19 @@ def train_model_4():
                 st.warning(f"Please upload database and Setup OpenAI credentials: {e}")
                 st.stop()  # Prevent further execution
             db_message = f"New database created: {st.session_state.db_name}"
-            show = False
+            st.session_state.show_training_data = False
     # Display success message outside columns if db_message is set
     if rm_message:
         st.success(rm_message)
     if db_message:
         st.success(db_message)
         
-    if show:
-        # Display the DataFrame
-        st.dataframe(df, use_container_width=True)
+    if st.session_state.get('show_training_data'):
+        show_training_data()
+
+    transfer_training_data()
+
+background_jobs()
 
 # st.write(f'from page 1, value of ss with key "a" is {st.session_state.db}')
 # Step 1: Tabs
@@ -181,3 +226,6 @@ with tab3:
     train_model_3()
 with tab4:
     train_model_4()
+
+# Including jobs submitted by this run
+poll_jobs(store_jobs())